@@ -3,21 +3,33 @@
 
 from __future__ import annotations
 
-import os, re, hashlib, hmac, html, json, uuid, threading, time, fcntl, base64
+import os, re, hashlib, hmac, html, json, uuid, threading, time, fcntl, base64, bisect, sqlite3, heapq, random, ssl, math
+import gzip, mimetypes, shutil, stat, select
+from collections import OrderedDict
+from collections.abc import Sequence
+from functools import wraps
+import http.client
 from datetime import datetime, timezone, timedelta
 from io import BytesIO
-from urllib.request import urlopen, Request
-from urllib.error import URLError, HTTPError
-from urllib.parse import urlencode
+from urllib.request import urlopen
+from urllib.error import URLError
+from urllib.parse import urlencode, urlsplit
 
-from PIL import Image, ImageDraw, ImageFont
+import click
+try:
+    import brotli  # optional: .br variants are only built when it's installed
+except ImportError:
+    brotli = None
+from PIL import Image, ImageDraw, ImageFont, ImageOps
 
 from flask import (
-    Flask, request, jsonify, send_from_directory, redirect,
+    Flask, request, jsonify, send_file, redirect,
     url_for, session
 )
 from werkzeug.utils import secure_filename
-from werkzeug.exceptions import NotFound
+from werkzeug.http import http_date
+from werkzeug.security import safe_join
+from werkzeug.exceptions import NotFound, RequestEntityTooLarge
 from typing import overload
 
 # ---------------- .env loader (optional) ----------------
@@ -47,6 +59,10 @@ BASE_DIR        = os.path.dirname(os.path.abspath(__file__))
 PORT            = int(env("PORT", "5000"))
 STATIC_DIR      = os.path.join(BASE_DIR, env("STATIC_DIR", "static"))
 UPLOAD_DIR      = os.path.join(BASE_DIR, env("UPLOAD_DIR", "uploads") or "uploads")
+# hashed + precompressed copies of STATIC_DIR (see "Static asset pipeline");
+# rebuilt from STATIC_DIR at startup, so it never needs committing
+ASSET_BUILD_DIR = os.path.join(BASE_DIR, env("ASSET_BUILD_DIR", "static_build"))
+ASSET_PIPELINE  = env("ASSET_PIPELINE", "1") == "1"
 
 # Email is sent via Brevo's HTTPS transactional API, not raw SMTP. GoDaddy's
 # SMTP (smtpout.secureserver.net) turned out to silently blackhole connections
@@ -55,7 +71,7 @@ UPLOAD_DIR      = os.path.join(BASE_DIR, env("UPLOAD_DIR", "uploads") or "upload
 # ever started. Plain HTTPS to a provider built for this (Brevo) sidesteps
 # that whole class of "some host blocks some SMTP port" problem.
 BREVO_API_KEY   = env("BREVO_API_KEY", "")
-BREVO_API_URL   = "https://api.brevo.com/v3/smtp/email"
+BREVO_API_URL   = env("BREVO_API_URL", "https://api.brevo.com/v3/smtp/email")
 EMAIL_USER      = env("EMAIL_USER")
 SMTP_FROM       = env("SMTP_FROM", EMAIL_USER or "no-reply@localhost")  # "Name <email>" - used as the Brevo sender
 ADMIN_EMAIL     = env("ADMIN_EMAIL", EMAIL_USER or "")
@@ -77,6 +93,27 @@ ADMIN_PASS      = env("ADMIN_PASS", "password")
 SUBMIT_LOG      = os.path.join(BASE_DIR, env("SUBMIT_LOG", "submissions.jsonl"))     # supports .jsonl and .json
 SUBMIT_STATE    = os.path.join(BASE_DIR, env("SUBMIT_STATE", "ticket_state.json"))   # stores status/remarks/history
 ALERT_EMAIL     = env("ALERT_EMAIL", "info@amcspark.com")    # overdue alerts recipient
+# Ticket storage engine. "files" is the original layout (SUBMIT_LOG +
+# SUBMIT_STATE above). "sqlite" keeps submissions and their state in one
+# WAL-mode database with indexed columns, so filtering/sorting/lookups are
+# queries instead of full scans; the first time it opens an empty database
+# it imports whatever SUBMIT_LOG/SUBMIT_STATE already hold (see also the
+# `flask --app app import-tickets` command).
+TICKET_STORE    = (env("TICKET_STORE", "files") or "files").strip().lower()
+TICKET_DB       = os.path.join(BASE_DIR, env("TICKET_DB", "tickets.sqlite3"))
+
+# Public form throttling (see "Rate limiting"): token buckets per client IP
+# and for the whole site, shared by every gunicorn worker via this database.
+# BURST is how many submissions can arrive back to back, PER_HOUR the
+# steady rate after that. Render puts one proxy in front of the app, so the
+# client is the last X-Forwarded-For entry that proxy appended.
+RATE_LIMIT                 = env("RATE_LIMIT", "1") == "1"
+RATE_LIMIT_DB              = os.path.join(BASE_DIR, env("RATE_LIMIT_DB", "ratelimit.sqlite3"))
+RATE_LIMIT_IP_BURST        = float(env("RATE_LIMIT_IP_BURST", "5"))
+RATE_LIMIT_IP_PER_HOUR     = float(env("RATE_LIMIT_IP_PER_HOUR", "20"))
+RATE_LIMIT_GLOBAL_BURST    = float(env("RATE_LIMIT_GLOBAL_BURST", "30"))
+RATE_LIMIT_GLOBAL_PER_HOUR = float(env("RATE_LIMIT_GLOBAL_PER_HOUR", "120"))
+TRUSTED_PROXY_HOPS         = int(env("TRUSTED_PROXY_HOPS", "1"))
 
 # Invoice number sequence lives here (server-side, shared across every device/
 # person using the invoice generator) instead of each browser's own
@@ -84,9 +121,19 @@ ALERT_EMAIL     = env("ALERT_EMAIL", "info@amcspark.com")    # overdue alerts re
 # same invoice number.
 INVOICE_SEQ_STATE = os.path.join(BASE_DIR, env("INVOICE_SEQ_STATE", "invoice_seq.json"))
 INVOICE_PREFIX     = env("INVOICE_PREFIX", "ASAS")
+# most numbers one /admin/api/invoice/reserve-block call may hand out
+INVOICE_BLOCK_MAX  = int(env("INVOICE_BLOCK_MAX", "100"))
+# committed invoices, searchable from any device (see "Invoice history")
+INVOICE_DB         = os.path.join(BASE_DIR, env("INVOICE_DB", "invoices.sqlite3"))
+
+# Form-submission emails are written here and delivered by a background
+# sender instead of inside the request (see "Email outbox" below).
+OUTBOX_DIR = os.path.join(BASE_DIR, env("OUTBOX_DIR", "outbox"))
 
 HEALTH_CHECK_EMAIL = env("HEALTH_CHECK_EMAIL", "akshitbatrax@gmail.com")
 HEALTH_CHECK_STATE = os.path.join(BASE_DIR, env("HEALTH_CHECK_STATE", "health_check_state.json"))
+# last/next run of every scheduled job, kept across restarts (see "Job scheduler")
+SCHEDULER_STATE = os.path.join(BASE_DIR, env("SCHEDULER_STATE", "scheduler_state.json"))
 
 # GitHub Actions dispatch - lets the admin "Login Healthcheck (Video)" button
 # kick off qa/admin_login_test.js on a GitHub-hosted runner, since this
@@ -98,9 +145,15 @@ GITHUB_DISPATCH_REF   = env("GITHUB_DISPATCH_REF", "uat")
 GITHUB_DISPATCH_TOKEN = env("GITHUB_DISPATCH_TOKEN", "")
 
 os.makedirs(UPLOAD_DIR, exist_ok=True)
+for _d in ("", "sending", "failed"):
+    os.makedirs(os.path.join(OUTBOX_DIR, _d), exist_ok=True)
 
 app = Flask(__name__, static_folder=STATIC_DIR, static_url_path="/static")
 app.config["SECRET_KEY"] = SECRET_KEY
+# Whole request body, i.e. the attachment budget plus room for the form
+# fields. When request.form is first touched, Werkzeug refuses a declared
+# Content-Length over this without reading the body, and stops reading a
+# chunked body once it passes this many bytes; either way -> 413.
 app.config["MAX_CONTENT_LENGTH"] = (MAX_EMAIL_MB + 5) * 1024 * 1024
 app.config["SESSION_COOKIE_HTTPONLY"] = True
 app.config["SESSION_COOKIE_SAMESITE"] = "Lax"
@@ -159,6 +212,8 @@ def _ext_allowed(name: str) -> bool:
     return ext.lower() in ALLOWED_EXTS
 
 def _plain_from_html(html: str) -> str:
+    # fallback for callers that pass send_email() HTML only; the templates
+    # below produce their own text part
     text = re.sub(r"(?is)<style.*?>.*?</style>", "", html or "")
     text = re.sub(r"(?is)<script.*?>.*?</script>", "", text)
     text = re.sub(r"(?i)<br\s*/?>", "\n", text)
@@ -185,62 +240,701 @@ def _age_hours(ts: str) -> float:
     dt = _parse_ts(ts)
     return max(0.0, (now - dt).total_seconds() / 3600.0)
 
+# ---------------- Storage primitives ----------------
+# Every persistent file (submission log, ticket state + journal, invoice
+# counter, health-check marker) goes through these, so they all follow the
+# same rules whichever worker process or thread is writing:
+#   - a sidecar "<file>.lock" flock serialises writers across processes
+#     (shared for appenders that can safely interleave, exclusive for
+#     anything that replaces the file);
+#   - whole-file rewrites go to a temp file that is fsync'd and renamed over
+#     the original, so readers see the old or the new file, never half;
+#   - appends are group-committed: callers that arrive while a write+fsync
+#     is in flight queue up, and the next leader writes all of their records
+#     with one write() and one fsync(), so N concurrent requests cost about
+#     one disk flush, not N. Nobody returns before their record is on disk.
+class _file_lock:
+    def __init__(self, path: str, mode=fcntl.LOCK_EX):
+        self.path, self.mode = path + ".lock", mode
+    def __enter__(self):
+        self.f = open(self.path, "a+")
+        fcntl.flock(self.f, self.mode)
+        return self
+    def __exit__(self, *exc):
+        fcntl.flock(self.f, fcntl.LOCK_UN)
+        self.f.close()
+
+def _atomic_write_json(path: str, obj, **dump_kw):
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False, **dump_kw)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+_COMMIT_LOCK = threading.Lock()
+_COMMIT_QUEUES: dict[str, dict] = {}   # path -> group-commit queue
+
+def _group_commit(path: str, data: bytes, *, lock_path: str | None = None, lock_mode=fcntl.LOCK_EX) -> int:
+    """Durably append `data` to `path` (flock on `lock_path`, default `path`
+    itself); returns the file size afterwards."""
+    with _COMMIT_LOCK:
+        q = _COMMIT_QUEUES.get(path)
+        if q is None:
+            q = _COMMIT_QUEUES[path] = {"cond": threading.Condition(), "pending": [], "busy": False,
+                                        "commits": 0, "records": 0}
+    entry = {"data": data, "done": False, "size": 0, "error": None}
+    with q["cond"]:
+        q["pending"].append(entry)
+        while q["busy"] and not entry["done"]:
+            q["cond"].wait()
+        if not entry["done"]:
+            # we lead this round: take everything queued so far
+            q["busy"] = True
+            batch, q["pending"] = q["pending"], []
+    if not entry["done"]:
+        size, error = 0, None
+        try:
+            with _file_lock(lock_path or path, lock_mode):
+                fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    os.write(fd, b"".join(e["data"] for e in batch))
+                    os.fsync(fd)
+                    size = os.fstat(fd).st_size
+                finally:
+                    os.close(fd)
+        except Exception as e:
+            error = e
+        with q["cond"]:
+            for e in batch:
+                e.update(done=True, size=size, error=error)
+            q["busy"] = False
+            q["commits"] += 1
+            q["records"] += len(batch)
+            q["cond"].notify_all()
+    if entry["error"] is not None:
+        raise entry["error"]
+    return entry["size"]
+
+def _read_json_dict(path: str) -> dict:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except (FileNotFoundError, ValueError):
+        return {}
+
+# ---------------- Background threads ----------------
+# The app runs as several gunicorn gthread workers (see gunicorn.conf.py),
+# and every worker imports this module - so a thread started at import time
+# used to mean one keep-alive pinger, one 6 AM health check and one overdue
+# scanner per worker, i.e. duplicate emails. Jobs that must run once per
+# deployment are started with singleton=True: every process starts the
+# thread, but it idles until it holds an exclusive flock on
+# BACKGROUND_LEADER_LOCK, which only one live process can have. The kernel
+# drops the lock when that process exits (gunicorn recycling a worker), and
+# a standby picks it up within BACKGROUND_LEADER_RETRY seconds. Per-process
+# jobs (the outbox sender - its claims are already safe across workers)
+# start once per process; after a fork the parent's threads are gone, so a
+# worker's own import starts fresh ones.
+BACKGROUND_LEADER_LOCK  = os.path.join(BASE_DIR, env("BACKGROUND_LEADER_LOCK", "background.lock"))
+BACKGROUND_LEADER_RETRY = int(env("BACKGROUND_LEADER_RETRY", "30"))
+_BG_LOCK = threading.Lock()
+_BG_THREADS: dict[str, threading.Thread] = {}
+_BG_LEADER = {"pid": None, "fd": None}
+
+def _bg_leader() -> bool:
+    """Whether this process is the background leader, taking the lock if
+    it's free."""
+    with _BG_LOCK:
+        if _BG_LEADER["pid"] == os.getpid():
+            return True
+        fd = os.open(BACKGROUND_LEADER_LOCK, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        _BG_LEADER.update(pid=os.getpid(), fd=fd)
+        return True
+
+def _start_background(name: str, target, *, singleton: bool = False):
+    """Run `target` in a daemon thread, at most one per name per process
+    (and with singleton=True, in only one process at a time)."""
+    def run():
+        if singleton:
+            while not _bg_leader():
+                time.sleep(BACKGROUND_LEADER_RETRY)
+        target()
+    with _BG_LOCK:
+        t = _BG_THREADS.get(name)
+        if t is not None and t.is_alive():
+            return
+        t = _BG_THREADS[name] = threading.Thread(target=run, name=name, daemon=True)
+        t.start()
+
+def _background_status() -> dict:
+    with _BG_LOCK:
+        threads = {name: t.is_alive() for name, t in _BG_THREADS.items()}
+        leader = _BG_LEADER["pid"] == os.getpid()
+    return {"pid": os.getpid(), "leader": leader, "threads": threads}
+
+# ---------------- Job scheduler ----------------
+# Periodic work (keep-alive pings, the overdue scan, the 6 AM health check)
+# is registered here as jobs instead of each running its own sleep loop.
+# One thread - started as a background singleton, so only the leader
+# process runs jobs - keeps a heap of next-run times and runs whatever is
+# due, one job at a time. A job is either every=N seconds or a 5-field cron
+# spec ("m h dom mon dow", with * , - and /) evaluated at a fixed UTC
+# offset; each next run gets up to `jitter` random seconds added. After
+# every run the job's last run, duration, outcome and next run are written
+# to SCHEDULER_STATE, so a restart picks the schedule up where it left off
+# (a run missed while the app was down happens once, straight away) and
+# /admin/api/jobs can report on them from any worker.
+_JOBS_LOCK = threading.Lock()
+_JOBS: dict[str, dict] = {}       # name -> {"fn", "every", "cron", "offset", "jitter", "spec"}
+_JOBS_WAKE = threading.Event()
+
+def _cron_field(field: str, lo: int, hi: int) -> set[int]:
+    out = set()
+    for part in field.split(","):
+        rng, _, step = part.partition("/")
+        if rng == "*":
+            a, b = lo, hi
+        elif "-" in rng:
+            a, b = (int(x) for x in rng.split("-", 1))
+        else:
+            a = b = int(rng)
+            if step:
+                b = hi
+        if not (lo <= a <= b <= hi):
+            raise ValueError(f"cron field {field!r} out of range {lo}-{hi}")
+        out.update(range(a, b + 1, int(step or 1)))
+    return out
+
+def _parse_cron(spec: str) -> tuple[set, set, set, set, set]:
+    fields = spec.split()
+    if len(fields) != 5:
+        raise ValueError(f"cron spec needs 5 fields: {spec!r}")
+    minute, hour, dom, mon, dow = fields
+    dows = {d % 7 for d in _cron_field(dow, 0, 7)}   # 0 and 7 are both Sunday
+    return (_cron_field(minute, 0, 59), _cron_field(hour, 0, 23), _cron_field(dom, 1, 31),
+            _cron_field(mon, 1, 12), dows)
+
+def _cron_next(cron: tuple, after: float, offset: timedelta) -> float:
+    """First matching minute strictly after `after` (epoch seconds), with
+    the spec read as local time at UTC+offset."""
+    minutes, hours, doms, mons, dows = cron
+    t = (datetime.fromtimestamp(after, timezone.utc) + offset).replace(second=0, microsecond=0)
+    t += timedelta(minutes=1)
+    for _ in range(366 * 24 * 60):
+        if t.month not in mons or t.day not in doms or (t.weekday() + 1) % 7 not in dows:
+            t = t.replace(hour=0, minute=0) + timedelta(days=1)
+        elif t.hour not in hours:
+            t = t.replace(minute=0) + timedelta(hours=1)
+        elif t.minute not in minutes:
+            t += timedelta(minutes=1)
+        else:
+            return (t - offset).timestamp()
+    raise ValueError("cron spec never matches")
+
+def _job_next(job: dict, after: float) -> float:
+    base = after + job["every"] if job["every"] else _cron_next(job["cron"], after, job["offset"])
+    return base + random.uniform(0, job["jitter"])
+
+def _register_job(name: str, fn, *, every: float | None = None, cron: str | None = None,
+                  utc_offset: timedelta = timedelta(0), jitter: float = 0.0):
+    """Schedule fn() every `every` seconds or on the `cron` spec, and make
+    sure the scheduler is running."""
+    if (every is None) == (cron is None):
+        raise ValueError("give exactly one of every= / cron=")
+    job = {"fn": fn, "every": every, "cron": _parse_cron(cron) if cron else None,
+           "offset": utc_offset, "jitter": jitter,
+           "spec": f"every {every:g}s" if every else f"cron {cron} (UTC{utc_offset.total_seconds() / 3600:+g}h)"}
+    with _JOBS_LOCK:
+        _JOBS[name] = job
+    _JOBS_WAKE.set()
+    _start_background("scheduler", _scheduler_loop, singleton=True)
+
+def _scheduler_state() -> dict:
+    return _read_json_dict(SCHEDULER_STATE)
+
+def _record_job_run(name: str, rec: dict):
+    """Persist one job's record (last run / next run) in SCHEDULER_STATE."""
+    with _file_lock(SCHEDULER_STATE):
+        state = _scheduler_state()
+        state[name] = rec
+        _atomic_write_json(SCHEDULER_STATE, state, indent=2)
+
+def _scheduler_loop():
+    heap: list[tuple[float, str]] = []
+    scheduled: set[str] = set()
+    saved = _scheduler_state()
+    while True:
+        now = time.time()
+        with _JOBS_LOCK:
+            # cleared before the snapshot: a job registered after this point
+            # sets it again and the wait below returns at once
+            _JOBS_WAKE.clear()
+            jobs = dict(_JOBS)
+        for name, job in jobs.items():
+            if name in scheduled:
+                continue
+            prev = saved.get(name) or {}
+            # keep the persisted next run if the job's schedule is unchanged;
+            # one that came due while we were down runs now
+            due = prev.get("next_run") if prev.get("spec") == job["spec"] else None
+            if due is None:
+                due = _job_next(job, now)
+                saved[name] = {**prev, "spec": job["spec"], "next_run": due}
+                try:
+                    _record_job_run(name, saved[name])
+                except OSError:
+                    app.logger.exception("could not persist scheduler state")
+            heapq.heappush(heap, (due, name))
+            scheduled.add(name)
+        if not heap or heap[0][0] > now:
+            _JOBS_WAKE.wait(min(heap[0][0] - now, 3600) if heap else 3600)
+            continue
+        _, name = heapq.heappop(heap)
+        job = jobs[name]
+        started = time.time()
+        error = None
+        try:
+            job["fn"]()
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            app.logger.exception("scheduled job %s failed", name)
+        finished = time.time()
+        next_run = _job_next(job, finished)
+        heapq.heappush(heap, (next_run, name))
+        rec = {"spec": job["spec"], "last_run": started, "last_duration_ms": round((finished - started) * 1000, 1),
+               "last_ok": error is None, "last_error": error, "next_run": next_run,
+               "runs": (saved.get(name) or {}).get("runs", 0) + 1}
+        saved[name] = rec
+        try:
+            _record_job_run(name, rec)
+        except OSError:
+            app.logger.exception("could not persist scheduler state")
+
+# ---------------- Upload ingestion ----------------
+# Project Desk attachments used to be read whole (f.read()) before the size
+# check, so each one - up to MAX_EMAIL_MB - sat in worker memory. They are
+# now copied to a temp ".part" file in UPLOAD_CHUNK_BYTES pieces, hashed as they
+# go, and renamed into place only once complete; a file that would push the
+# request past MAX_EMAIL_BYTES stops being copied (and its .part is deleted)
+# as soon as the running total crosses the limit. That bounds what is kept,
+# not what is received: Werkzeug has already read the whole body while
+# parsing the form - MAX_CONTENT_LENGTH is what caps that - and spooled
+# anything bigger than 500 KB to a temp file, so nothing here holds more
+# than one chunk. The first chunk must also start with a signature matching
+# the extension, so a renamed executable doesn't get stored as "drawing.pdf".
+UPLOAD_CHUNK_BYTES = 64 * 1024
+
+_OLE = (b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1",)
+_ZIP = (b"PK\x03\x04", b"PK\x05\x06")
+_UPLOAD_MAGIC = {
+    ".pdf": (b"%PDF-",),
+    ".png": (b"\x89PNG\r\n\x1a\n",),
+    ".jpg": (b"\xff\xd8\xff",), ".jpeg": (b"\xff\xd8\xff",),
+    ".zip": _ZIP, ".docx": _ZIP, ".xlsx": _ZIP,
+    ".doc": _OLE, ".xls": _OLE,
+    ".csv": None, ".txt": None,   # plain text: no signature, but no NUL bytes either
+}
+
+def _upload_magic_ok(ext: str, head: bytes) -> bool:
+    sigs = _UPLOAD_MAGIC.get(ext, ())
+    if sigs is None:
+        return b"\x00" not in head
+    return any(head.startswith(sig) for sig in sigs)
+
+# ---------------- Attachment store ----------------
+# Clients re-send the same drawings and BOQ sheets with every follow-up, so
+# attachments are stored by content: UPLOAD_DIR/blobs/ab/cd/<sha256>, each
+# distinct file once however many tickets carry it. A ticket's manifest
+# (UPLOAD_DIR/manifests/<ticket>.json) maps the names shown on the ticket to
+# digests, and blobs/refcounts.json counts manifest entries per digest, so
+# `flask --app app gc-uploads` can delete blobs nothing points at any more.
+# An upload is streamed to a temp file in blobs/tmp first; moving it into
+# the store and taking its reference happen together, under the same lock
+# the GC holds, so the GC never sees a stored blob without its reference.
+# Temp files a failed request left behind are removed after a grace period.
+# `flask --app app migrate-uploads` folds the old flat uploads/<rand8>_<name>
+# files into the store.
+BLOB_DIR       = os.path.join(UPLOAD_DIR, "blobs")
+MANIFEST_DIR   = os.path.join(UPLOAD_DIR, "manifests")
+BLOB_REFCOUNTS = os.path.join(BLOB_DIR, "refcounts.json")
+for _d in (BLOB_DIR, os.path.join(BLOB_DIR, "tmp"), MANIFEST_DIR):
+    os.makedirs(_d, exist_ok=True)
+
+def _blob_path(sha: str) -> str:
+    return os.path.join(BLOB_DIR, sha[:2], sha[2:4], sha)
+
+def _manifest_path(ticket: str) -> str:
+    return os.path.join(MANIFEST_DIR, _attach_safe(ticket) + ".json")
+
+def _ticket_manifest(ticket: str) -> dict:
+    """{name: {"sha256", "size"}} for a ticket's attachments."""
+    return _read_json_dict(_manifest_path(ticket)).get("files", {})
+
+def _store_blob(part: str, sha: str):
+    """Move a finished temp file into the store, or drop it if an identical
+    blob is already there. Caller holds the BLOB_REFCOUNTS lock."""
+    dest = _blob_path(sha)
+    if os.path.exists(dest):
+        os.remove(part)
+        os.utime(dest)  # fresh again for the GC grace period
+        return
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    os.replace(part, dest)
+
+def _attach_to_ticket(ticket: str, files: list[dict]):
+    """Record `files` ({"name", "size", "sha256"}) in the ticket's manifest
+    and take a reference on each blob. A file that still has its "part"
+    (see _ingest_upload) is moved into the store first, and loses the key."""
+    if not files:
+        return
+    with _file_lock(BLOB_REFCOUNTS):
+        for f in files:
+            if "part" in f:
+                _store_blob(f.pop("part"), f["sha256"])
+        refs = _read_json_dict(BLOB_REFCOUNTS)
+        manifest = _read_json_dict(_manifest_path(ticket))
+        entries = manifest.setdefault("files", {})
+        for f in files:
+            old = entries.get(f["name"])
+            if old:
+                refs[old["sha256"]] = refs.get(old["sha256"], 1) - 1
+            entries[f["name"]] = {"sha256": f["sha256"], "size": f["size"]}
+            refs[f["sha256"]] = refs.get(f["sha256"], 0) + 1
+        _atomic_write_json(_manifest_path(ticket), manifest)
+        _atomic_write_json(BLOB_REFCOUNTS, refs)
+
+def _ingest_upload(f, budget: int) -> dict | None:
+    """Stream one uploaded file to a temp file in the blob store. Returns
+    {"name", "size", "sha256", "part"} for _attach_to_ticket() to store, or
+    None if it was empty, not an allowed type, or bigger than `budget` bytes
+    - in which case nothing is left on disk."""
+    safe_name = _attach_safe(f.filename)
+    if not _ext_allowed(safe_name):
+        return None
+    ext = os.path.splitext(safe_name)[1].lower()
+    chunk = f.stream.read(UPLOAD_CHUNK_BYTES)
+    if not chunk or not _upload_magic_ok(ext, chunk):
+        return None
+    part = os.path.join(BLOB_DIR, "tmp", uuid.uuid4().hex + ".part")
+    digest, size = hashlib.sha256(), 0
+    try:
+        with open(part, "wb") as wf:
+            while chunk:
+                size += len(chunk)
+                if size > budget:
+                    raise OverflowError
+                digest.update(chunk)
+                wf.write(chunk)
+                chunk = f.stream.read(UPLOAD_CHUNK_BYTES)
+    except OverflowError:
+        os.remove(part)
+        return None
+    except BaseException:
+        if os.path.exists(part):
+            os.remove(part)
+        raise
+    return {"name": safe_name, "size": size, "sha256": digest.hexdigest(), "part": part}
+
+def _discard_uploads(files: list[dict]):
+    """Remove the temp files of uploads that never got attached."""
+    for f in files:
+        if "part" in f and os.path.exists(f["part"]):
+            os.remove(f.pop("part"))
+
+def _gc_blobs(grace_seconds: float, dry_run: bool = False) -> tuple[int, int]:
+    """Delete blobs with no references (and abandoned temp files) older than
+    the grace period; returns (files, bytes) removed."""
+    cutoff = time.time() - grace_seconds
+    removed = freed = 0
+    with _file_lock(BLOB_REFCOUNTS):
+        refs = _read_json_dict(BLOB_REFCOUNTS)
+        for root, dirs, names in os.walk(BLOB_DIR):
+            for name in names:
+                path = os.path.join(root, name)
+                in_tmp = os.path.basename(root) == "tmp"
+                if root == BLOB_DIR:  # refcounts.json and its lock
+                    continue
+                if not in_tmp and refs.get(name, 0) > 0:
+                    continue
+                st = os.stat(path)
+                if st.st_mtime > cutoff:
+                    continue
+                removed += 1
+                freed += st.st_size
+                if not dry_run:
+                    os.remove(path)
+                    refs.pop(name, None)
+        if not dry_run:
+            _atomic_write_json(BLOB_REFCOUNTS, {k: v for k, v in refs.items() if v > 0})
+    return removed, freed
+
+def _migrate_legacy_uploads() -> dict:
+    """Move flat UPLOAD_DIR files that a submission references into the
+    blob store and the tickets' manifests (under the same names, so the
+    submissions' attachment lists still resolve). Files no submission
+    mentions are left where they are."""
+    owners: dict[str, list[str]] = {}
+    for it in _read_submissions():
+        for name in it.get("attachments") or []:
+            owners.setdefault(name, []).append(it.get("ticket", ""))
+    report = {"files": 0, "duplicates": 0, "bytes_before": 0, "bytes_after": 0, "unreferenced": 0}
+    for name in sorted(os.listdir(UPLOAD_DIR)):
+        path = os.path.join(UPLOAD_DIR, name)
+        if not os.path.isfile(path) or name.endswith((".part", ".lock")):
+            continue
+        if name not in owners:
+            report["unreferenced"] += 1
+            continue
+        digest, size = hashlib.sha256(), 0
+        with open(path, "rb") as src:
+            for chunk in iter(lambda: src.read(UPLOAD_CHUNK_BYTES), b""):
+                digest.update(chunk)
+                size += len(chunk)
+        sha = digest.hexdigest()
+        existed = os.path.exists(_blob_path(sha))
+        report["files"] += 1
+        report["bytes_before"] += size
+        if existed:
+            report["duplicates"] += 1
+        else:
+            report["bytes_after"] += size
+        files = [{"name": name, "size": size, "sha256": sha, "part": path}]
+        for ticket in owners[name]:
+            _attach_to_ticket(ticket, files)  # the first one moves the file into the store
+    report["bytes_reclaimed"] = report["bytes_before"] - report["bytes_after"]
+    return report
+
+@app.cli.command("migrate-uploads")
+def migrate_uploads_command():
+    """Fold legacy UPLOAD_DIR files into the content-addressed store."""
+    r = _migrate_legacy_uploads()
+    print(f"Migrated {r['files']} files ({r['duplicates']} duplicates): {r['bytes_before']:,} bytes -> "
+          f"{r['bytes_after']:,} bytes, {r['bytes_reclaimed']:,} reclaimed; "
+          f"{r['unreferenced']} unreferenced files left in place")
+
+@app.cli.command("gc-uploads")
+@click.option("--grace-hours", default=24.0, show_default=True, help="Keep unreferenced blobs younger than this.")
+@click.option("--dry-run", is_flag=True, help="Only report what would be deleted.")
+def gc_uploads_command(grace_hours, dry_run):
+    """Delete attachment blobs no ticket references any more."""
+    n, freed = _gc_blobs(grace_hours * 3600, dry_run)
+    print(f"{'Would remove' if dry_run else 'Removed'} {n} blobs, {freed:,} bytes")
+
 # ---------------- Email templates ----------------
-def email_shell_html(preheader: str, inner_html: str) -> str:
-    return f"""<!DOCTYPE html><html><head><meta charset="utf-8"><meta name="viewport" content="width=device-width,initial-scale=1"></head>
+# Every email is the branded shell around a list of content blocks. The
+# shell only depends on BRAND, so it is rendered once here and split into
+# static chunks around the two slots (preheader, body); a message is then a
+# handful of string joins. Each block carries both renderings - (html, text)
+# - built from the same structured values, so the plain-text part comes out
+# of the same pass instead of regex-stripping the finished HTML afterwards.
+# Field values may contain the "<br>" line breaks the form handlers insert;
+# the text rendering turns those back into newlines.
+def _split_shell(template: str, *slots: str) -> list[str]:
+    chunks = []
+    for slot in slots:
+        head, template = template.split(slot, 1)
+        chunks.append(head)
+    return chunks + [template]
+
+_SHELL_HTML = _split_shell(f"""<!DOCTYPE html><html><head><meta charset="utf-8"><meta name="viewport" content="width=device-width,initial-scale=1"></head>
 <body style="margin:0;padding:0;background:{BRAND['bg']};">
-  <span style="display:none!important;opacity:0;visibility:hidden">{preheader}</span>
+  <span style="display:none!important;opacity:0;visibility:hidden">\0PRE\0</span>
   <table role="presentation" cellpadding="0" cellspacing="0" width="100%" style="background:{BRAND['bg']};padding:24px 0;">
     <tr><td align="center">
       <table role="presentation" width="600" style="max-width:600px;background:#fff;border:1px solid {BRAND['line']};border-radius:14px;overflow:hidden">
         <tr><td style="padding:18px 22px;border-bottom:1px solid {BRAND['line']};background:linear-gradient(90deg,{BRAND['brand']},{BRAND['brand2']});color:#00121b;font:800 18px Arial">
           ⚡ {BRAND['name']} <span style="float:right;font:700 12px Arial"><a href="{BRAND['site']}" style="color:#00121b;text-decoration:none">Visit Website →</a></span>
         </td></tr>
-        <tr><td style="padding:22px">{inner_html}</td></tr>
+        <tr><td style="padding:22px">\0BODY\0</td></tr>
         <tr><td style="padding:14px 22px;border-top:1px solid {BRAND['line']};background:#f9fbff;font:12px Arial;color:{BRAND['muted']}">
           📍 {BRAND['addr']} • 📞 {BRAND['phone']} • ✉️ {BRAND['email']}
         </td></tr>
       </table>
     </td></tr>
   </table>
-</body></html>"""
+</body></html>""", "\0PRE\0", "\0BODY\0")
+_SHELL_TEXT_HEAD = f"⚡ {BRAND['name']} — {BRAND['site']}\n\n"
+_SHELL_TEXT_TAIL = f"\n\n--\n📍 {BRAND['addr']} • 📞 {BRAND['phone']} • ✉️ {BRAND['email']}\n"
+
+_ES_H2      = f"margin:0 0 8px;font:700 18px Arial;color:{BRAND['ink']}"
+_ES_H1      = f"margin:0 0 8px;font:800 22px Arial;color:{BRAND['ink']}"
+_ES_LEAD    = f"margin:0 0 12px;font:400 14px Arial;color:{BRAND['muted']}"
+_ES_NOTE    = f"font:13px Arial;color:{BRAND['muted']}"
+_ES_TABLE   = f"border:1px solid {BRAND['line']};border-radius:10px"
+_ES_ROW_K   = f'<tr>\n<td style="padding:8px 10px;border-bottom:1px solid {BRAND["line"]};font:700 13px Arial;color:{BRAND["muted"]};width:35%">'
+_ES_ROW_V   = f'</td>\n<td style="padding:8px 10px;border-bottom:1px solid {BRAND["line"]};font:400 13px Arial;color:{BRAND["ink"]};">'
+_ES_CELL    = f"padding:8px 10px;border-bottom:1px solid {BRAND['line']};font:13px Arial;color:{BRAND['ink']}"
+_ES_TD      = f'<td style="{_ES_CELL}">'
+
+def _text_value(v) -> str:
+    return str(v).replace("<br>", "\n")
 
 def _row(k, v):
-    return f"""<tr>
-<td style="padding:8px 10px;border-bottom:1px solid {BRAND['line']};font:700 13px Arial;color:{BRAND['muted']};width:35%">{k}</td>
-<td style="padding:8px 10px;border-bottom:1px solid {BRAND['line']};font:400 13px Arial;color:{BRAND['ink']};">{v}</td>
-</tr>"""
+    return f"{_ES_ROW_K}{k}{_ES_ROW_V}{v}</td>\n</tr>"
+
+def _eb_heading(text: str, *, style: str = _ES_H2, tag: str = "h2") -> tuple[str, str]:
+    return f'<{tag} style="{style}">{html.escape(text, quote=False)}</{tag}>', text
+
+def _eb_para(html_part: str, text_part: str, *, style: str = _ES_NOTE) -> tuple[str, str]:
+    return f'<p style="{style}">{html_part}</p>', text_part
+
+def _eb_table(rows, *, style: str = _ES_TABLE) -> tuple[str, str]:
+    """Key/value rows; a value may be an (html, text) pair when the two
+    renderings differ (links, markup)."""
+    h, t = [], []
+    for k, v in rows:
+        vh, vt = v if isinstance(v, tuple) else (v, _text_value(v))
+        h.append(_row(k, vh))
+        t.append(f"{k}: {vt}")
+    return (f'<table role="presentation" cellpadding="0" cellspacing="0" width="100%" style="{style}">'
+            + "".join(h) + "</table>", "\n".join(t))
+
+def _eb_grid(headers, rows) -> tuple[str, str]:
+    """A multi-column table (escaped cell values); one " | "-joined line per
+    row in the text part."""
+    head = "".join(f'<th align="left" style="{_ES_CELL};font-weight:700;background:#f7f9fc">{x}</th>' for x in headers)
+    td, esc = _ES_TD, html.escape
+    body = "".join("<tr>" + "".join(td + esc(str(v)) + "</td>" for v in r) + "</tr>" for r in rows)
+    return (f'<table role="presentation" cellpadding="0" cellspacing="0" width="100%" '
+            f'style="{_ES_TABLE};border-collapse:separate"><tr>{head}</tr>{body}</table>',
+            "\n".join(" | ".join(str(v) for v in r) for r in [headers, *rows]))
+
+def _render_email(preheader: str, *blocks: tuple[str, str]) -> tuple[str, str]:
+    """(html, text) for a message made of `blocks`."""
+    pre, mid, tail = _SHELL_HTML
+    return (pre + preheader + mid + "\n".join(b[0] for b in blocks) + tail,
+            _SHELL_TEXT_HEAD + "\n\n".join(b[1] for b in blocks if b[1]) + _SHELL_TEXT_TAIL)
+
+def admin_email(title: str, fields: dict, attachments: list, ticket: str) -> tuple[str, str]:
+    rows = [(k, fields.get(k, "")) for k in fields] + [("File", a) for a in attachments]
+    return _render_email(
+        f"New {title} — Ticket {ticket}",
+        _eb_para(f"New submission received. Ticket: <b>{ticket}</b>", f"New submission received. Ticket: {ticket}",
+                 style=f"margin:0 0 6px;font:400 13px Arial;color:{BRAND['muted']}"),
+        _eb_heading(f"🔎 {title}"),
+        _eb_table(rows, style=_ES_TABLE + ";overflow:hidden"),
+    )
 
-def admin_email_html(title: str, fields: dict, attachments: list, ticket: str) -> str:
-    rows = "".join([_row(k, fields.get(k,"")) for k in fields])
-    if attachments:
-        rows += "".join([_row("File", a) for a in attachments])
-    inner = f"""
-<p style="margin:0 0 6px;font:400 13px Arial;color:{BRAND['muted']}">New submission received. Ticket: <b>{ticket}</b></p>
-<h2 style="margin:0 0 8px;font:700 18px Arial;color:{BRAND['ink']}">🔎 {title}</h2>
-<table role="presentation" cellpadding="0" cellspacing="0" width="100%" style="border:1px solid {BRAND['line']};border-radius:10px;overflow:hidden">{rows}</table>
-"""
-    return email_shell_html(f"New {title} — Ticket {ticket}", inner)
-
-def client_ack_html(kind: str, name: str, ticket: str) -> str:
-    desc = {
-        "Contact": "Thanks for your message. We’ll get back within 24 hours (Mon–Fri).",
-        "Quick Quote": "We’ve logged your request. Expect a quote or clarifications in 24 hours.",
-        "Project Desk": "We’ve received your scope and files. Our engineers will review and respond soon."
-    }.get(kind, "We’ve received your submission.")
-    inner = f"""
-<h1 style="margin:0 0 8px;font:800 22px Arial;color:{BRAND['ink']}">✅ Received — {kind}</h1>
-<p style="margin:0 10px 12px 0;font:400 14px Arial;color:{BRAND['muted']}">
-  Hi <b>{name or 'there'}</b>, {desc}
-</p>
-<table role="presentation" cellpadding="0" cellspacing="0" width="100%" style="border:1px dashed {BRAND['line']};border-radius:10px">
-  {_row("Ticket ID", ticket)}
-  {_row("Support Window", "Mon–Fri, 9:00–18:00 IST")}
-  {_row("Hotline", BRAND["phone"])}
-  {_row("Email", BRAND["email"])}
-</table>
-"""
-    return email_shell_html(f"{kind} received — Ticket {ticket}", inner)
+_CLIENT_ACK_DESC = {
+    "Contact": "Thanks for your message. We’ll get back within 24 hours (Mon–Fri).",
+    "Quick Quote": "We’ve logged your request. Expect a quote or clarifications in 24 hours.",
+    "Project Desk": "We’ve received your scope and files. Our engineers will review and respond soon."
+}
+
+def client_ack_email(kind: str, name: str, ticket: str) -> tuple[str, str]:
+    desc = _CLIENT_ACK_DESC.get(kind, "We’ve received your submission.")
+    return _render_email(
+        f"{kind} received — Ticket {ticket}",
+        _eb_heading(f"✅ Received — {kind}", style=_ES_H1, tag="h1"),
+        _eb_para(f"Hi <b>{name or 'there'}</b>, {desc}", f"Hi {name or 'there'}, {desc}",
+                 style=f"margin:0 10px 12px 0;font:400 14px Arial;color:{BRAND['muted']}"),
+        _eb_table([("Ticket ID", ticket), ("Support Window", "Mon–Fri, 9:00–18:00 IST"),
+                   ("Hotline", BRAND["phone"]), ("Email", BRAND["email"])],
+                  style=f"border:1px dashed {BRAND['line']};border-radius:10px"),
+    )
+
+def ticket_update_email(ticket: str, status: str, note: str) -> tuple[str, str]:
+    return _render_email(
+        "Ticket update",
+        _eb_heading(f"Ticket Update — {ticket}"),
+        _eb_table([("Ticket", ticket), ("Status", status.upper()), ("Remark", note or "(no remarks)")]),
+        _eb_para("If you have questions, just reply to this email.", "If you have questions, just reply to this email."),
+    )
+
+# ---------------- Outbound HTTPS (keep-alive pool) ----------------
+# urlopen() opens a fresh TCP + TLS connection for every call, which is
+# several round-trips to api.brevo.com before each email even starts - and
+# a form post alone sends two. Connections are kept open per host instead
+# and handed out LIFO (the most recently used is the least likely to have
+# been dropped by the server). Idle ones past HTTP_POOL_IDLE_SECONDS, and
+# ones the server has visibly closed already (an idle connection only turns
+# readable on EOF), are closed rather than reused. A reused connection that
+# still fails while the request is being written is retried once on a new
+# one - the server never got the request. Once it has been sent in full the
+# server may already have acted on it (accepted the email) before the
+# connection dropped, so a failure waiting for the response is only retried
+# for idempotent methods; for a POST it is raised, and the outbox's backoff
+# decides what happens next.
+HTTP_POOL_IDLE_SECONDS = float(env("HTTP_POOL_IDLE_SECONDS", "30"))
+HTTP_POOL_MAX_PER_HOST = int(env("HTTP_POOL_MAX_PER_HOST", "4"))
+
+_HTTP_SSL_CONTEXT = ssl.create_default_context()
+_HTTP_POOL_LOCK = threading.Lock()
+_HTTP_POOL: dict[tuple, list] = {}   # (host, port) -> [(connection, last used)]
+_HTTP_POOL_STATS = {"new": 0, "reused": 0, "retried": 0, "evicted": 0}
+_HTTP_IDEMPOTENT = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+# the server closed a kept-alive connection first (RemoteDisconnected is
+# both a reset and a bad status line)
+_HTTP_CLOSED_ERRORS = (ConnectionResetError, BrokenPipeError, http.client.BadStatusLine,
+                       ssl.SSLEOFError, ssl.SSLZeroReturnError)
+
+def _http_conn_dropped(conn) -> bool:
+    try:
+        return bool(select.select([conn.sock], [], [], 0)[0])
+    except (OSError, ValueError):
+        return True
+
+def _http_pool_get(key: tuple, timeout: float):
+    now = time.monotonic()
+    with _HTTP_POOL_LOCK:
+        idle = _HTTP_POOL.get(key, [])
+        while idle:
+            conn, last = idle.pop()
+            if now - last <= HTTP_POOL_IDLE_SECONDS and not _http_conn_dropped(conn):
+                _HTTP_POOL_STATS["reused"] += 1
+                conn.sock.settimeout(timeout)
+                return conn, True
+            _HTTP_POOL_STATS["evicted"] += 1
+            conn.close()
+        _HTTP_POOL_STATS["new"] += 1
+    return http.client.HTTPSConnection(key[0], key[1], timeout=timeout, context=_HTTP_SSL_CONTEXT), False
+
+def _http_pool_put(key: tuple, conn):
+    with _HTTP_POOL_LOCK:
+        idle = _HTTP_POOL.setdefault(key, [])
+        if len(idle) < HTTP_POOL_MAX_PER_HOST:
+            idle.append((conn, time.monotonic()))
+            return
+    conn.close()
+
+def _https_request(method: str, url: str, *, body: bytes | None = None,
+                   headers: dict | None = None, timeout: float = 15) -> tuple[int, bytes]:
+    """(status, response body) over a pooled keep-alive connection. Network
+    failures raise OSError (http.client / ssl / socket errors); an HTTP
+    error status is returned, not raised."""
+    parts = urlsplit(url)
+    key = (parts.hostname, parts.port or 443)
+    path = parts.path + (f"?{parts.query}" if parts.query else "")
+    while True:
+        conn, reused = _http_pool_get(key, timeout)
+        sent = False
+        try:
+            conn.request(method, path, body=body, headers=headers or {})
+            sent = True
+            resp = conn.getresponse()
+            data = resp.read()
+        except _HTTP_CLOSED_ERRORS as e:
+            conn.close()
+            if reused and (not sent or method.upper() in _HTTP_IDEMPOTENT):
+                with _HTTP_POOL_LOCK:
+                    _HTTP_POOL_STATS["retried"] += 1
+                continue
+            raise ConnectionError(str(e) or type(e).__name__) from e
+        except Exception:
+            conn.close()
+            raise
+        if resp.will_close:
+            conn.close()
+        else:
+            _http_pool_put(key, conn)
+        return resp.status, data
 
 # ---------------- Email (Brevo HTTPS API) ----------------
 def smtp_ready() -> bool:
@@ -255,7 +949,8 @@ def _sender_name_and_email():
         return name, m.group(2).strip()
     return BRAND["name"], (SMTP_FROM or EMAIL_USER or "no-reply@localhost")
 
-def send_email(subject: str, html_body: str, *, to, reply_to=None, cc=None, bcc=None, inline_images=None):
+def send_email(subject: str, html_body: str, *, to, reply_to=None, cc=None, bcc=None, inline_images=None,
+               text_body: str | None = None):
     if not BREVO_API_KEY: raise RuntimeError("BREVO_API_KEY not set")
     if not EMAIL_USER:    raise RuntimeError("EMAIL_USER not set")
 
@@ -277,7 +972,7 @@ def send_email(subject: str, html_body: str, *, to, reply_to=None, cc=None, bcc=
         "to": [{"email": addr} for addr in to_list],
         "subject": subject,
         "htmlContent": html_body,
-        "textContent": _plain_from_html(html_body),
+        "textContent": text_body if text_body is not None else _plain_from_html(html_body),
     }
     if cc_list:  payload["cc"]  = [{"email": a} for a in cc_list]
     if bcc_list: payload["bcc"] = [{"email": a} for a in bcc_list]
@@ -291,44 +986,182 @@ def send_email(subject: str, html_body: str, *, to, reply_to=None, cc=None, bcc=
         payload["attachment"] = [{"name": name, "content": base64.b64encode(data).decode("ascii")}
                                   for name, data in inline_images]
 
-    req = Request(
-        BREVO_API_URL,
-        data=json.dumps(payload).encode("utf-8"),
-        headers={
-            "api-key": BREVO_API_KEY,
-            "Content-Type": "application/json",
-            "Accept": "application/json",
-        },
-        method="POST",
-    )
     try:
-        with urlopen(req, timeout=EMAIL_SEND_TIMEOUT) as resp:
-            resp.read()  # drain; Brevo returns 201 with a messageId on success
-    except HTTPError as e:
-        detail = e.read().decode("utf-8", "replace")
-        raise RuntimeError(f"Brevo API error {e.code}: {detail}") from e
-    except URLError as e:
-        raise RuntimeError(f"Brevo API unreachable: {e.reason}") from e
+        # Brevo returns 201 with a messageId on success
+        status, detail = _https_request(
+            "POST", BREVO_API_URL,
+            body=json.dumps(payload).encode("utf-8"),
+            headers={
+                "api-key": BREVO_API_KEY,
+                "Content-Type": "application/json",
+                "Accept": "application/json",
+            },
+            timeout=EMAIL_SEND_TIMEOUT,
+        )
+    except OSError as e:
+        raise RuntimeError(f"Brevo API unreachable: {e}") from e
+    if status >= 300:
+        raise RuntimeError(f"Brevo API error {status}: {detail.decode('utf-8', 'replace')}")
+
+# ---------------- Email outbox ----------------
+# The admin notification and client acknowledgement for a form submission
+# used to be two Brevo calls inside the request, so a slow provider held the
+# visitor (and a worker) for up to 2 x EMAIL_SEND_TIMEOUT. Now the request
+# only renders both messages and writes them to OUTBOX_DIR - one fsync'd
+# file each - and a sender thread in every worker delivers them.
+#
+# Queue files are named "<due epoch ms>-<id>.json", so a sorted listing is
+# also the delivery order and a scan stops at the first one not yet due. A
+# worker claims a message by renaming it into sending/ (only one rename can
+# win); a failure re-queues it under a later due time with exponential
+# backoff, and after OUTBOX_MAX_ATTEMPTS it is moved to failed/. A claim
+# older than OUTBOX_CLAIM_TTL (worker died mid-send) goes back to the queue.
+# Each message's progress is kept on its ticket as email_admin/email_client.
+OUTBOX_POLL_SECONDS  = float(env("OUTBOX_POLL_SECONDS", "5"))
+OUTBOX_MAX_ATTEMPTS  = int(env("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_BACKOFF_BASE  = float(env("OUTBOX_BACKOFF_BASE", "30"))      # seconds; doubles per attempt
+OUTBOX_BACKOFF_MAX   = float(env("OUTBOX_BACKOFF_MAX", "3600"))
+OUTBOX_CLAIM_TTL     = float(env("OUTBOX_CLAIM_TTL", str(max(300, 3 * EMAIL_SEND_TIMEOUT))))
+
+_OUTBOX_WAKE = threading.Event()
+_OUTBOX_RUNNING = {"sender": False}
+
+def _outbox_name(due: float, msg_id: str) -> str:
+    return f"{int(due * 1000):015d}-{msg_id}.json"
+
+def _email_status(status: str, msg: dict, error: str | None = None) -> dict:
+    out = {"status": status, "attempts": msg.get("attempts", 0),
+           "ts": datetime.utcnow().isoformat() + "Z", "id": msg["id"]}
+    if error:
+        out["error"] = error[:300]
+    return out
+
+def _outbox_message(ticket: str, role: str, subject: str, body: tuple[str, str], *, to, reply_to=None) -> dict:
+    return {"id": uuid.uuid4().hex, "ticket": ticket, "role": role, "subject": subject, "html": body[0],
+            "text": body[1], "to": to, "reply_to": reply_to, "attempts": 0, "created": time.time()}
+
+def _outbox_enqueue(msgs: list[dict]):
+    # the ticket's "queued" status is written first: once a file is in the
+    # queue a sender may deliver it and record "sent" at any moment
+    _update_ticket_states({m["ticket"]: {f"email_{m['role']}": _email_status("queued", m)} for m in msgs})
+    for m in msgs:
+        _atomic_write_json(os.path.join(OUTBOX_DIR, _outbox_name(m["created"], m["id"])), m)
+    _OUTBOX_WAKE.set()
+
+def _outbox_recover_stale(now: float):
+    sending = os.path.join(OUTBOX_DIR, "sending")
+    for name in os.listdir(sending):
+        path = os.path.join(sending, name)
+        try:
+            if now - os.stat(path).st_mtime > OUTBOX_CLAIM_TTL:
+                os.rename(path, os.path.join(OUTBOX_DIR, name))
+        except FileNotFoundError:
+            continue  # finished or recovered by another worker
+
+def _outbox_deliver(name: str, now: float) -> bool:
+    """Claim, send and settle one queued message; False if another worker
+    got it first."""
+    claimed = os.path.join(OUTBOX_DIR, "sending", name)
+    try:
+        os.rename(os.path.join(OUTBOX_DIR, name), claimed)
+    except FileNotFoundError:
+        return False
+    os.utime(claimed)  # the claim's age is what stale-claim recovery looks at
+    with open(claimed, "r", encoding="utf-8") as f:
+        msg = json.load(f)
+    msg["attempts"] = msg.get("attempts", 0) + 1
+    key = f"email_{msg['role']}"
+    try:
+        send_email(msg["subject"], msg["html"], text_body=msg.get("text"), to=msg["to"], reply_to=msg.get("reply_to"))
+    except Exception as e:
+        msg["last_error"] = str(e)
+        app.logger.warning("outbox: %s for %s attempt %d failed: %s", key, msg["ticket"], msg["attempts"], e)
+        if msg["attempts"] >= OUTBOX_MAX_ATTEMPTS:
+            _update_ticket_states({msg["ticket"]: {key: _email_status("failed", msg, msg["last_error"])}})
+            dest = os.path.join(OUTBOX_DIR, "failed", name)
+        else:
+            # status before re-queueing, same reason as in _outbox_enqueue
+            _update_ticket_states({msg["ticket"]: {key: _email_status("retrying", msg, msg["last_error"])}})
+            delay = min(OUTBOX_BACKOFF_MAX, OUTBOX_BACKOFF_BASE * 2 ** (msg["attempts"] - 1))
+            dest = os.path.join(OUTBOX_DIR, _outbox_name(now + delay * random.uniform(0.8, 1.2), msg["id"]))
+        _atomic_write_json(dest, msg)
+        os.remove(claimed)
+        return True
+    # Sent: the claim has to go whatever happens next, or stale-claim
+    # recovery would put it back and the message would go out twice.
+    try:
+        _update_ticket_states({msg["ticket"]: {key: _email_status("sent", msg)}})
+    except Exception as e:
+        app.logger.exception("outbox: %s for %s sent, but recording it failed: %s", key, msg["ticket"], e)
+    finally:
+        os.remove(claimed)
+    return True
+
+def _outbox_pass(now: float | None = None) -> int:
+    """Deliver every message that is due; returns how many were handled."""
+    now = time.time() if now is None else now
+    _outbox_recover_stale(now)
+    done = 0
+    for name in sorted(n for n in os.listdir(OUTBOX_DIR) if n.endswith(".json")):
+        if int(name.split("-", 1)[0]) > now * 1000:
+            break
+        try:
+            done += _outbox_deliver(name, now)
+        except Exception as e:
+            app.logger.exception("outbox: delivering %s failed: %s", name, e)
+    return done
+
+def _outbox_loop():
+    while True:
+        _OUTBOX_WAKE.wait(OUTBOX_POLL_SECONDS)
+        _OUTBOX_WAKE.clear()
+        try:
+            _outbox_pass()
+        except Exception as e:
+            app.logger.exception("outbox pass failed: %s", e)
+
+def _outbox_depth() -> dict:
+    now_ms = time.time() * 1000
+    queued = sorted(n for n in os.listdir(OUTBOX_DIR) if n.endswith(".json"))
+    due = [n for n in queued if int(n.split("-", 1)[0]) <= now_ms]
+    return {
+        "queued": len(queued),
+        "due": len(due),
+        "sending": len(os.listdir(os.path.join(OUTBOX_DIR, "sending"))),
+        "failed": len(os.listdir(os.path.join(OUTBOX_DIR, "failed"))),
+        "oldest_due_age_s": round((now_ms - int(due[0].split("-", 1)[0])) / 1000, 1) if due else 0,
+        "sender_running": _OUTBOX_RUNNING["sender"],
+    }
+
+if (env("OUTBOX_SENDER", "1") or "1") == "1" and smtp_ready():
+    _OUTBOX_RUNNING["sender"] = True
+    _start_background("outbox-sender", _outbox_loop)
 
 def notify_admin_and_client(kind: str, admin_fields: dict, *,
                             client_name: str, client_email: str,
-                            attachments_saved: list | None = None,
+                            attachments: list[dict] | None = None,
                             reply_to: str | None = None,
-                            meta: dict | None = None):
+                            meta: dict | None = None) -> str:
+    """Attach the uploads (see _ingest_upload) to a new ticket, log the
+    submission and hand both emails to the outbox; returns the ticket. The
+    uploads are attached first, so nothing after that can leave them
+    stored without a manifest. Without a running sender (email not configured, or
+    OUTBOX_SENDER=0) the emails are sent inline instead. The ticket already
+    exists by then, so a failed send doesn't fail the request - a 500 would
+    only have the visitor submit again and open a duplicate ticket. It is
+    logged and recorded on the ticket as a "failed" email status, the same
+    one the outbox uses, so the dashboard shows it."""
     ticket = _ticket(kind[:2], client_email or admin_fields.get("Email","") or "anon")
-    admin_html  = admin_email_html(kind, admin_fields, attachments_saved or [], ticket)
-    client_html = client_ack_html(kind, client_name, ticket)
-    # send admin
-    send_email(f"{kind} — Ticket {ticket}", admin_html, to=_recipients(), reply_to=reply_to)
-    # send client ack
-    if _valid_email(client_email):
-        send_email(f"{kind} received — {ticket}", client_html, to=[client_email], reply_to=BRAND["email"])
+    attachments_saved = [a["name"] for a in attachments or []]
+    _attach_to_ticket(ticket, attachments or [])
+    admin_body  = admin_email(kind, admin_fields, attachments_saved, ticket)
+    client_body = client_ack_email(kind, client_name, ticket)
     # log to JSONL
     _log_submission({
         "ticket": ticket,
         "kind": kind,
         "fields": admin_fields,
-        "attachments": attachments_saved or [],
+        "attachments": attachments_saved,
         "client_name": client_name,
         "client_email": client_email,
         "meta": meta or {},
@@ -337,27 +1170,34 @@ def notify_admin_and_client(kind: str, admin_fields: dict, *,
     # ensure state has an entry
     _ensure_ticket_state(ticket)
 
+    messages = [("admin", f"{kind} — Ticket {ticket}", admin_body, _recipients(), reply_to)]
+    if _valid_email(client_email):
+        messages.append(("client", f"{kind} received — {ticket}", client_body, [client_email], BRAND["email"]))
+    if not _OUTBOX_RUNNING["sender"]:
+        failed = {}
+        for role, subject, (html_body, text_body), to, rt in messages:
+            try:
+                send_email(subject, html_body, text_body=text_body, to=to, reply_to=rt)
+            except Exception as e:
+                app.logger.exception("inline %s email for %s failed: %s", role, ticket, e)
+                failed[f"email_{role}"] = _email_status("failed", {"id": uuid.uuid4().hex, "attempts": 1}, str(e))
+        if failed:
+            _update_ticket_states({ticket: failed})
+        return ticket
+    _outbox_enqueue([_outbox_message(ticket, role, subject, body, to=to, reply_to=rt)
+                     for role, subject, body, to, rt in messages])
+    return ticket
+
 # ---------------- JSON logging & state ----------------
 def _log_submission(obj: dict):
     try:
-        with open(SUBMIT_LOG, "a", encoding="utf-8") as f:
-            f.write(json.dumps(obj, ensure_ascii=False) + "\n")
+        if TICKET_STORE == "sqlite":
+            _db_log_submission(obj)
+            return
+        _group_commit(SUBMIT_LOG, (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8"))
     except Exception as e:
         app.logger.error("Failed to log submission: %s", e)
 
-def _read_jsonl(path):
-    items = []
-    if not os.path.exists(path): return items
-    with open(path, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line: continue
-            try:
-                items.append(json.loads(line))
-            except Exception:
-                continue
-    return items
-
 def _read_json(path):
     if not os.path.exists(path): return []
     try:
@@ -371,106 +1211,1054 @@ def _read_json(path):
         app.logger.error("Failed to read JSON: %s", e)
     return []
 
-def _read_submissions():
-    items = []
+# ---------------- Submission index (incremental, per process) ----------------
+# The admin dashboard polls /admin/api/tickets every 30s, and every ticket
+# GET/PATCH also needs the submissions. Re-reading and re-parsing the whole
+# log each time made every one of those requests O(total tickets ever). This
+# keeps one parsed, de-duplicated, sorted copy per process and, on each call,
+# only parses the bytes appended to the .jsonl since the last call. A full
+# rebuild happens only if the .jsonl was truncated/rotated (different inode,
+# or smaller than what was already consumed) or the legacy .json sibling
+# changed. A trailing partial line (another worker mid-write) is left for the
+# next call instead of being consumed half-written.
+#
+# Readers get a newest-first view over the index's ascending list rather
+# than a reversed copy of it, so a read after an append costs nothing extra.
+# A view covers the first n items it was made with; appends only add items
+# past that, and the rare change that isn't an append (an out-of-order ts, a
+# ticket logged again) copies the list first if a view may still be using it.
+_SUBMISSION_INDEX_LOCK = threading.Lock()
+_SUBMISSION_INDEX = {
+    "jsonl_id": None,     # (st_dev, st_ino) of the .jsonl being tailed
+    "offset": 0,          # bytes of the .jsonl consumed (always at a line boundary)
+    "json_sig": None,     # (st_mtime_ns, st_size) of the whole-file .json
+    "items": {},          # ticket -> newest item (de-dup: newest ts wins)
+    "order": [],          # (ts, ticket) keys, ascending
+    "sorted": [],         # items, parallel to "order"
+    "shared": False,      # a view of "sorted" has been handed out since it was last copied
+    "generation": 0,      # bumped on every full rebuild
+    "changes": [],        # tickets added/replaced since the last rebuild, in order
+}
+
+def _submission_paths():
+    """(jsonl_path, json_path) - the append-only log that gets tailed and the
+    whole-file JSON that gets reloaded only when it changes. Either may be
+    None if SUBMIT_LOG has neither extension."""
     if SUBMIT_LOG.endswith(".json"):
-        items += _read_json(SUBMIT_LOG)
-        alt = SUBMIT_LOG.replace(".json", ".jsonl")
-        if os.path.exists(alt): items += _read_jsonl(alt)
+        return SUBMIT_LOG.replace(".json", ".jsonl"), SUBMIT_LOG
+    alt = SUBMIT_LOG.replace(".jsonl", ".json")
+    return SUBMIT_LOG, (alt if alt != SUBMIT_LOG else None)
+
+class _NewestFirst(Sequence):
+    """The first `n` items of the ascending list `items`, newest first,
+    without copying them."""
+    __slots__ = ("_items", "_n")
+
+    def __init__(self, items: list, n: int):
+        self._items, self._n = items, n
+
+    def __len__(self):
+        return self._n
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._n))]
+        if i < 0:
+            i += self._n
+        if not 0 <= i < self._n:
+            raise IndexError(i)
+        return self._items[self._n - 1 - i]
+
+    def __iter__(self):
+        items = self._items
+        for i in range(self._n - 1, -1, -1):
+            yield items[i]
+
+def _index_unshare():
+    """Give the index a private copy of "sorted" before changing anything
+    but its end - views handed out earlier keep the old one."""
+    idx = _SUBMISSION_INDEX
+    if idx["shared"]:
+        idx["sorted"] = list(idx["sorted"])
+        idx["shared"] = False
+
+def _index_add(it: dict):
+    idx = _SUBMISSION_INDEX
+    key = it.get("ticket") or ""
+    ts = it.get("ts", "")
+    cur = idx["items"].get(key)
+    if cur is not None:
+        if not ts > cur.get("ts", ""):
+            return
+        old = (cur.get("ts", ""), key)
+        i = bisect.bisect_left(idx["order"], old)
+        if i < len(idx["order"]) and idx["order"][i] == old:
+            _index_unshare()
+            del idx["order"][i]
+            del idx["sorted"][i]
+    idx["items"][key] = it
+    idx["changes"].append(key)
+    k = (ts, key)
+    if not idx["order"] or k >= idx["order"][-1]:
+        idx["order"].append(k)
+        idx["sorted"].append(it)
     else:
-        items += _read_jsonl(SUBMIT_LOG)
-        alt = SUBMIT_LOG.replace(".jsonl", ".json")
-        if os.path.exists(alt): items += _read_json(alt)
+        _index_unshare()
+        i = bisect.bisect_right(idx["order"], k)
+        idx["order"].insert(i, k)
+        idx["sorted"].insert(i, it)
+
+def _index_tail_jsonl(path: str, size: int):
+    idx = _SUBMISSION_INDEX
+    with open(path, "rb") as f:
+        f.seek(idx["offset"])
+        chunk = f.read(size - idx["offset"])
+    end = chunk.rfind(b"\n")
+    if end < 0:
+        return
+    for line in chunk[:end].split(b"\n"):
+        line = line.strip()
+        if not line: continue
+        try:
+            _index_add(json.loads(line))
+        except Exception:
+            continue
+    idx["offset"] += end + 1
 
-    # de-dup by ticket (newest ts wins)
-    dedup = {}
-    for it in items:
-        key = it.get("ticket") or ""
-        ts = it.get("ts","")
-        if key not in dedup or ts > dedup[key].get("ts",""): dedup[key] = it
-    out = list(dedup.values())
-    out.sort(key=lambda x: x.get("ts",""), reverse=True)
-    return out
+def _refresh_submission_index():
+    idx = _SUBMISSION_INDEX
+    jsonl_path, json_path = _submission_paths()
+    try:
+        jst = os.stat(jsonl_path) if jsonl_path else None
+    except FileNotFoundError:
+        jst = None
+    try:
+        sst = os.stat(json_path) if json_path else None
+    except FileNotFoundError:
+        sst = None
+    jsonl_id = (jst.st_dev, jst.st_ino) if jst else None
+    json_sig = (sst.st_mtime_ns, sst.st_size) if sst else None
+
+    rebuild = (
+        jsonl_id != idx["jsonl_id"]
+        or json_sig != idx["json_sig"]
+        or (jst is not None and jst.st_size < idx["offset"])
+    )
+    if rebuild:
+        idx.update(jsonl_id=jsonl_id, offset=0, json_sig=json_sig,
+                   items={}, order=[], sorted=[], shared=False,
+                   generation=idx["generation"] + 1, changes=[])
+        if json_sig is not None:
+            for it in _read_json(json_path):
+                if isinstance(it, dict):
+                    _index_add(it)
+    if jst is not None and jst.st_size > idx["offset"]:
+        _index_tail_jsonl(jsonl_path, jst.st_size)
+
+def _read_submissions_files(before: tuple | None = None) -> Sequence:
+    """All submissions, de-duplicated by ticket, newest first - or only
+    those whose (ts, ticket) key sorts below `before`. The view and its
+    dicts are shared with the index - treat them as read-only. It never
+    changes underneath a caller iterating it, whatever is appended since."""
+    with _SUBMISSION_INDEX_LOCK:
+        _refresh_submission_index()
+        idx = _SUBMISSION_INDEX
+        n = len(idx["sorted"]) if before is None else bisect.bisect_left(idx["order"], tuple(before))
+        idx["shared"] = True
+        return _NewestFirst(idx["sorted"], n)
+
+# ---------------- Ticket state: snapshot + journal ----------------
+# ticket_state.json is a snapshot; every change since then is one small JSON
+# line appended to ticket_state.json.journal:
+#   {"ticket": ..., "set": {changed keys}, "history_add": [new entries]}
+#   {"ticket": ..., "ensure": true}      (create with defaults if missing)
+# so a status change or new submission costs one short append instead of
+# rewriting every ticket's state and history. State is the snapshot with the
+# journal replayed on top; once the journal passes STATE_JOURNAL_MAX_BYTES a
+# background thread folds it into a fresh snapshot and starts an empty one.
+#
+# Writers append under a shared flock on ticket_state.json.lock and the
+# compactor swaps both files under an exclusive one, so nobody - in this or
+# any other worker - sees the new snapshot next to the old journal or loses
+# an append made mid-compaction.
+#
+# Parsed state is cached process-wide. A change in the snapshot's stat
+# signature or the journal's inode means a full reload; a journal that only
+# grew is replayed from the last offset. Every update builds a new dict
+# (copy-on-write), so the dict a caller got back never changes underneath
+# it - treat it as read-only and copy before changing anything.
+STATE_JOURNAL           = SUBMIT_STATE + ".journal"
+STATE_JOURNAL_MAX_BYTES = int(env("STATE_JOURNAL_MAX_BYTES", str(1 << 20)))
+
+_STATE_CACHE_LOCK = threading.Lock()
+_STATE_CACHE = {"sig": None, "journal_ino": None, "offset": 0, "state": {}}
+_STATE_COMPACTING = threading.Event()
+
+def _stat_or_none(path):
+    try:
+        return os.stat(path)
+    except FileNotFoundError:
+        return None
 
-def _load_state():
-    if not os.path.exists(SUBMIT_STATE): return {}
+def _state_apply(state: dict, rec: dict):
+    """Replay one journal record into `state` (a dict private to the caller;
+    the ticket's entry is replaced, never modified in place)."""
+    ticket = rec.get("ticket")
+    if not ticket:
+        return
+    cur = state.get(ticket)
+    if rec.get("ensure"):
+        if cur is None:
+            state[ticket] = dict(_DEFAULT_TICKET_STATE, history=[])
+        return
+    st = dict(cur or _DEFAULT_TICKET_STATE)
+    st.update(rec.get("set") or {})
+    if rec.get("history_add"):
+        st["history"] = list(st.get("history") or []) + rec["history_add"]
+    state[ticket] = st
+
+def _state_journal_read(offset: int, stop: int | None = None) -> tuple[list[dict], int]:
+    """Complete journal records between `offset` and `stop` (end of file by
+    default), and the offset just past the last one."""
+    try:
+        with open(STATE_JOURNAL, "rb") as f:
+            f.seek(offset)
+            chunk = f.read() if stop is None else f.read(max(stop - offset, 0))
+    except FileNotFoundError:
+        return [], offset
+    end = chunk.rfind(b"\n") + 1  # a line still being written waits for the next call
+    records = []
+    for line in chunk[:end].splitlines():
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            continue
+    return records, offset + end
+
+def _state_replay(state: dict, offset: int) -> int:
+    """Apply complete journal lines from `offset` on; returns the new offset."""
+    records, offset = _state_journal_read(offset)
+    for rec in records:
+        _state_apply(state, rec)
+    return offset
+
+def _read_state_snapshot() -> dict:
     try:
         with open(SUBMIT_STATE, "r", encoding="utf-8") as f:
             return json.load(f)
     except Exception:
         return {}
 
+def _write_state_snapshot(state: dict):
+    """Replace the snapshot with `state` and start an empty journal. Caller
+    holds the exclusive flock."""
+    _atomic_write_json(SUBMIT_STATE, state, indent=2)
+    open(STATE_JOURNAL + ".tmp", "wb").close()
+    os.replace(STATE_JOURNAL + ".tmp", STATE_JOURNAL)
+
+def _load_state_files():
+    c = _STATE_CACHE
+    snap, jrnl = _stat_or_none(SUBMIT_STATE), _stat_or_none(STATE_JOURNAL)
+    if (c["sig"] == ((snap.st_ino, snap.st_size, snap.st_mtime_ns) if snap else None)
+            and c["journal_ino"] == (jrnl.st_ino if jrnl else None)
+            and (jrnl.st_size if jrnl else 0) == c["offset"]):
+        return c["state"]  # nothing changed - no lock, no read
+    # flock before the thread lock, everywhere - the other order deadlocks
+    # against a compaction running in this same process
+    with _file_lock(SUBMIT_STATE, fcntl.LOCK_SH), _STATE_CACHE_LOCK:
+        snap, jrnl = _stat_or_none(SUBMIT_STATE), _stat_or_none(STATE_JOURNAL)
+        sig = (snap.st_ino, snap.st_size, snap.st_mtime_ns) if snap else None
+        jino = jrnl.st_ino if jrnl else None
+        if sig != c["sig"] or jino != c["journal_ino"] or (jrnl and jrnl.st_size < c["offset"]):
+            state = _read_state_snapshot() if snap else {}
+            offset = _state_replay(state, 0) if jrnl else 0
+            c.update(sig=sig, journal_ino=jino, offset=offset, state=state)
+        elif jrnl and jrnl.st_size > c["offset"]:
+            state = dict(c["state"])
+            c["offset"] = _state_replay(state, c["offset"])
+            c["state"] = state
+        return c["state"]
+
+def _state_journal_append(records: list[dict]):
+    """Append records as a single write, then compact in the background if
+    the journal has grown past the threshold."""
+    if not records:
+        return
+    data = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode("utf-8")
+    # shared: appends only need to be kept out of a compaction's way
+    size = _group_commit(STATE_JOURNAL, data, lock_path=SUBMIT_STATE, lock_mode=fcntl.LOCK_SH)
+    if size > STATE_JOURNAL_MAX_BYTES and not _STATE_COMPACTING.is_set():
+        _STATE_COMPACTING.set()
+        threading.Thread(target=_compact_state_journal, daemon=True).start()
+
+def _save_state_files(state: dict):
+    """Write `state` as the new snapshot and start an empty journal."""
+    with _file_lock(SUBMIT_STATE), _STATE_CACHE_LOCK:
+        _write_state_snapshot(state)
+        snap, jrnl = os.stat(SUBMIT_STATE), os.stat(STATE_JOURNAL)
+        _STATE_CACHE.update(sig=(snap.st_ino, snap.st_size, snap.st_mtime_ns),
+                            journal_ino=jrnl.st_ino, offset=0, state=state)
+
+def _compact_state_journal():
+    try:
+        with _file_lock(SUBMIT_STATE):
+            jrnl = _stat_or_none(STATE_JOURNAL)
+            if not jrnl or jrnl.st_size <= STATE_JOURNAL_MAX_BYTES:
+                return  # another worker got here first
+            state = _read_state_snapshot()
+            _state_replay(state, 0)
+            _write_state_snapshot(state)
+    except Exception as e:
+        app.logger.exception("state journal compaction failed: %s", e)
+    finally:
+        _STATE_COMPACTING.clear()
+
+def _state_changed_since(pos: tuple | None, key: str):
+    """(state, pos, tickets) for indexes kept in step with ticket state: the
+    current state, the position to pass back next time, and the tickets
+    whose `key` was set in the journal lines appended since `pos` - or None
+    if the snapshot was replaced since (or `pos` is None) and every ticket
+    has to be looked at again."""
+    _load_state_files()
+    with _STATE_CACHE_LOCK:  # the state and the journal offset it was replayed to, together
+        c = _STATE_CACHE
+        state, base, offset = c["state"], (c["sig"], c["journal_ino"]), c["offset"]
+    if pos is None or pos[0] != base:
+        touched = None
+    elif offset > pos[1]:
+        records, _ = _state_journal_read(pos[1], offset)
+        touched = {r.get("ticket") for r in records if key in (r.get("set") or {})}
+    else:
+        touched = set()
+    return state, (base, offset), touched
+
+# ---------------- Ticket search index ----------------
+# The dashboard's search box used to json.dumps() every ticket on every
+# request and substring-scan the result. Instead, each ticket's searchable
+# text (form fields, ticket id, kind, client name/email, admin remark) is
+# split on whitespace into tokens with posting lists (token -> tickets), and
+# the token vocabulary gets its own trigram index (trigram -> tokens). A
+# query term is then answered by intersecting a few trigram sets to find the
+# vocabulary tokens that contain it, and unioning their postings - so
+# "gmail", "@acme.co" or a ticket-id fragment still match anywhere inside a
+# token, exactly like the old substring scan. A query with spaces in it is
+# confirmed against the ticket's text so it keeps matching as a phrase.
+# In file mode this is kept in sync incrementally from the submission
+# index's change log, and remarks from the state journal: only tickets whose
+# note was set in the lines appended since the last sync are re-indexed, and
+# every remark is re-read only when the snapshot itself is replaced (a
+# compaction). SQLite mode uses an FTS5 trigram table instead (see below).
+_SEARCH_LOCK = threading.Lock()
+_SEARCH_INDEX = {
+    "generation": None,   # submission-index generation the docs came from
+    "consumed": 0,        # entries of its change log already indexed
+    "state_pos": None,    # where in the state journal remarks were synced to
+    "docs": {},           # ticket -> (submission text, remark text), lowercased
+    "postings": {},       # token -> set of tickets
+    "grams": {},          # trigram -> set of tokens
+}
+
+def _search_text(item: dict) -> str:
+    fields = item.get("fields") or {}
+    parts = [item.get("ticket",""), item.get("kind",""), item.get("client_name",""),
+             item.get("client_email","")]
+    parts += [str(v) for v in fields.values()]
+    return "\n".join(p for p in parts if p).lower()
+
+def _search_put(ticket: str, sub_text: str | None = None, note: str | None = None):
+    idx = _SEARCH_INDEX
+    old = idx["docs"].get(ticket, ("", ""))
+    doc = (old[0] if sub_text is None else sub_text, old[1] if note is None else note.lower())
+    if doc == old and ticket in idx["docs"]:
+        return
+    old_tokens = set((old[0] + "\n" + old[1]).split())
+    new_tokens = set((doc[0] + "\n" + doc[1]).split())
+    idx["docs"][ticket] = doc
+    for tok in old_tokens - new_tokens:
+        posting = idx["postings"].get(tok)
+        if posting is None: continue
+        posting.discard(ticket)
+        if not posting:
+            del idx["postings"][tok]
+            for i in range(len(tok) - 2):
+                toks = idx["grams"].get(tok[i:i+3])
+                if toks is not None:
+                    toks.discard(tok)
+                    if not toks: del idx["grams"][tok[i:i+3]]
+    postings, grams = idx["postings"], idx["grams"]
+    for tok in new_tokens - old_tokens:
+        posting = postings.get(tok)
+        if posting is not None:
+            posting.add(ticket)
+            continue
+        postings[tok] = {ticket}
+        for g in {tok[i:i+3] for i in range(len(tok) - 2)}:
+            toks = grams.get(g)
+            if toks is None:
+                grams[g] = {tok}
+            else:
+                toks.add(tok)
+
+def _search_sync():
+    """Bring the index up to date with the submission log and remarks."""
+    idx = _SEARCH_INDEX
+    with _SUBMISSION_INDEX_LOCK:
+        _refresh_submission_index()
+        sub = _SUBMISSION_INDEX
+        if idx["generation"] != sub["generation"]:
+            idx.update(generation=sub["generation"], consumed=0, state_pos=None,
+                       docs={}, postings={}, grams={})
+        fresh = [(t, sub["items"][t]) for t in sub["changes"][idx["consumed"]:]]
+        idx["consumed"] = len(sub["changes"])
+    for ticket, it in fresh:
+        _search_put(ticket, sub_text=_search_text(it))
+
+    state, idx["state_pos"], touched = _state_changed_since(idx["state_pos"], "note")
+    for ticket in (state.keys() if touched is None else touched):
+        st = state.get(ticket)
+        if ticket in idx["docs"] and isinstance(st, dict):
+            _search_put(ticket, note=st.get("note") or "")
+
+def _search_term_grams(term: str):
+    """Candidate vocabulary tokens for `term` (a superset - still needs the
+    substring check)."""
+    idx = _SEARCH_INDEX
+    if len(term) < 3:
+        return idx["postings"].keys()
+    grams = sorted((idx["grams"].get(term[i:i+3], set()) for i in range(len(term) - 2)), key=len)
+    return grams[0].intersection(*grams[1:]) if len(grams[0]) else set()
+
+def _search_term_hits(term: str) -> set:
+    postings = _SEARCH_INDEX["postings"]
+    return set().union(*(postings[tok] for tok in _search_term_grams(term) if term in tok))
+
+def _search_tickets(q: str) -> set:
+    """Tickets whose searchable text contains `q` (case-insensitive)."""
+    q = (q or "").lower().strip()
+    with _SEARCH_LOCK:
+        _search_sync()
+        idx = _SEARCH_INDEX
+        if not q:
+            return set()
+        # Most selective term first (fewest candidate tokens for its rarest
+        # trigram); after that, once there are fewer candidates left than a
+        # term has tokens, checking their text beats building its union.
+        estimate = lambda term: (len(idx["postings"]) if len(term) < 3 else
+                                 min(len(idx["grams"].get(term[i:i+3], ())) for i in range(len(term) - 2)))
+        terms = sorted(set(q.split()), key=estimate)
+        result = _search_term_hits(terms[0])
+        docs = idx["docs"]
+        for term in terms[1:]:
+            if not result:
+                break
+            if len(result) <= estimate(term):
+                result = {t for t in result if term in docs[t][0] or term in docs[t][1]}
+            else:
+                result &= _search_term_hits(term)
+        if result and len(terms) > 1:
+            result = {t for t in result if q in docs[t][0] + "\n" + docs[t][1]}
+        return result
+
+# ---------------- Ticket counts (file store) ----------------
+# The dashboard shows per-status totals next to every page of tickets. In
+# file mode those used to come from walking every submission and its state
+# on each request, so a 100-ticket page cost as much as the whole list.
+# Instead every ticket is counted under its (kind, status), kept in step the
+# same way as the search index: new submissions from the index's change log,
+# status changes from the state journal lines appended since the last call.
+_TICKET_COUNTS_LOCK = threading.Lock()
+_TICKET_COUNTS = {
+    "generation": None,   # submission-index generation the counts came from
+    "consumed": 0,        # entries of its change log already counted
+    "state_pos": None,    # where in the state journal statuses were synced to
+    "of": {},             # ticket -> (kind, status) it is counted under
+    "counts": {},         # (kind, status) -> number of tickets
+}
+
+def _ticket_counts_sync():
+    tc = _TICKET_COUNTS
+    with _SUBMISSION_INDEX_LOCK:
+        _refresh_submission_index()
+        sub = _SUBMISSION_INDEX
+        if tc["generation"] != sub["generation"]:
+            tc.update(generation=sub["generation"], consumed=0, state_pos=None, of={}, counts={})
+        fresh = [(t, sub["items"][t].get("kind","")) for t in sub["changes"][tc["consumed"]:]]
+        tc["consumed"] = len(sub["changes"])
+    state, tc["state_pos"], touched = _state_changed_since(tc["state_pos"], "status")
+    of, counts = tc["of"], tc["counts"]
+
+    def put(ticket, kind):
+        key = (kind, (state.get(ticket) or _DEFAULT_TICKET_STATE).get("status","open"))
+        old = of.get(ticket)
+        if old == key:
+            return
+        if old is not None:
+            counts[old] -= 1
+            if not counts[old]: del counts[old]
+        of[ticket] = key
+        counts[key] = counts.get(key, 0) + 1
+
+    for ticket, kind in fresh:
+        put(ticket, kind)
+    for ticket in (list(of) if touched is None else touched):
+        if ticket in of:
+            put(ticket, of[ticket][0])
+
+def _ticket_counts(kind: str = "", status: str = "") -> dict:
+    """Per-status ticket counts, for one kind and/or one status if given."""
+    with _TICKET_COUNTS_LOCK:
+        _ticket_counts_sync()
+        out = {}
+        for (k, s), n in _TICKET_COUNTS["counts"].items():
+            if (not kind or k == kind) and (not status or s == status):
+                out[s] = out.get(s, 0) + n
+        return out
+
+# ---------------- SQLite ticket store (TICKET_STORE=sqlite) ----------------
+# One connection per thread (sqlite3 connections can't be shared across
+# threads) and per process (never reuse one inherited across a fork). WAL
+# lets the dashboard's reads run alongside a form submission's write, across
+# gunicorn workers too. Each submission/state row keeps its full JSON in
+# `body`; the columns next to it exist only to be indexed and filtered on.
+_DB_LOCAL = threading.local()
+
+_TICKET_DB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS submissions (
+    ticket       TEXT PRIMARY KEY,
+    ts           TEXT NOT NULL DEFAULT '',
+    kind         TEXT NOT NULL DEFAULT '',
+    client_email TEXT NOT NULL DEFAULT '',
+    body         TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS submissions_ts ON submissions(ts, ticket);
+CREATE INDEX IF NOT EXISTS submissions_kind_ts ON submissions(kind, ts, ticket);
+CREATE INDEX IF NOT EXISTS submissions_client_email ON submissions(client_email);
+
+CREATE TABLE IF NOT EXISTS ticket_state (
+    ticket TEXT PRIMARY KEY,
+    status TEXT NOT NULL DEFAULT 'open',
+    body   TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ticket_state_status ON ticket_state(status);
+
+CREATE TABLE IF NOT EXISTS store_meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+INSERT OR IGNORE INTO store_meta (key, value) VALUES ('version', '0');
+"""
+
+def _ticket_db() -> sqlite3.Connection:
+    conn = getattr(_DB_LOCAL, "conn", None)
+    if conn is not None and _DB_LOCAL.pid == os.getpid():
+        return conn
+    conn = sqlite3.connect(TICKET_DB, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(_TICKET_DB_SCHEMA)
+    try:
+        # Substring search over each ticket's text (see _search_text); the
+        # trigram tokenizer needs SQLite 3.34+, so without it searches fall
+        # back to a scan in Python.
+        conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS ticket_search "
+                     "USING fts5(ticket UNINDEXED, body, note, tokenize='trigram')")
+        _DB_LOCAL.fts = True
+    except sqlite3.OperationalError:
+        _DB_LOCAL.fts = False
+    _DB_LOCAL.conn, _DB_LOCAL.pid = conn, os.getpid()
+    if not conn.execute("SELECT 1 FROM store_meta WHERE key = 'files_imported'").fetchone():
+        _import_ticket_files(conn, only_once=True)
+    if _DB_LOCAL.fts and not conn.execute("SELECT 1 FROM store_meta WHERE key = 'search_indexed'").fetchone():
+        # rechecked under the write lock, as with the import above
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if not conn.execute("SELECT 1 FROM store_meta WHERE key = 'search_indexed'").fetchone():
+                for (ticket,) in conn.execute("SELECT ticket FROM submissions").fetchall():
+                    _db_search_index(conn, ticket)
+                conn.execute("INSERT OR REPLACE INTO store_meta (key, value) VALUES ('search_indexed', '1')")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    return conn
+
+def _db_bump_version(conn: sqlite3.Connection):
+    """Every write bumps this, so readers (ETags) can tell "nothing changed"
+    from one indexed lookup."""
+    conn.execute("UPDATE store_meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'version'")
+
+def _db_has_fts() -> bool:
+    _ticket_db()
+    return _DB_LOCAL.fts
+
+def _db_search_index(conn: sqlite3.Connection, ticket: str):
+    """(Re)write one ticket's row in the FTS table from its stored
+    submission and remark. Its rowid mirrors the submissions rowid so
+    updates and the join back stay index lookups."""
+    if not getattr(_DB_LOCAL, "fts", False):
+        return
+    row = conn.execute("SELECT s.rowid, s.body, t.body FROM submissions s "
+                       "LEFT JOIN ticket_state t ON t.ticket = s.ticket WHERE s.ticket = ?",
+                       (ticket,)).fetchone()
+    if not row:
+        return
+    rowid, sub_body, st_body = row
+    note = (json.loads(st_body).get("note") or "") if st_body else ""
+    conn.execute("DELETE FROM ticket_search WHERE rowid = ?", (rowid,))
+    conn.execute("INSERT INTO ticket_search (rowid, ticket, body, note) VALUES (?, ?, ?, ?)",
+                 (rowid, ticket, _search_text(json.loads(sub_body)), note.lower()))
+
+def _submission_row(obj: dict):
+    email = obj.get("client_email") or (obj.get("fields") or {}).get("Email", "") or ""
+    return (obj.get("ticket") or "", obj.get("ts", "") or "", obj.get("kind", "") or "",
+            email.strip().lower(), json.dumps(obj, ensure_ascii=False))
+
+def _state_row(ticket: str, st: dict):
+    return (ticket, (st.get("status") or "open"), json.dumps(st, ensure_ascii=False))
+
+_UPSERT_SUBMISSION_SQL = """
+INSERT INTO submissions (ticket, ts, kind, client_email, body) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT(ticket) DO UPDATE SET
+    ts = excluded.ts, kind = excluded.kind,
+    client_email = excluded.client_email, body = excluded.body
+WHERE excluded.ts > submissions.ts
+"""
+_UPSERT_STATE_SQL = """
+INSERT INTO ticket_state (ticket, status, body) VALUES (?, ?, ?)
+ON CONFLICT(ticket) DO UPDATE SET status = excluded.status, body = excluded.body
+"""
+_INSERT_STATE_SQL = """
+INSERT INTO ticket_state (ticket, status, body) VALUES (?, ?, ?)
+ON CONFLICT(ticket) DO NOTHING
+"""
+
+def _import_ticket_files(conn: sqlite3.Connection, *, only_once: bool = False) -> tuple[int, int]:
+    """Copy SUBMIT_LOG (+ its legacy sibling) and SUBMIT_STATE into the
+    database. Safe to run more than once: submissions keep the newest ts per
+    ticket, and a ticket that already has a state row keeps it - once the
+    app has run in sqlite mode the database copy is the live one, and the
+    files' copy would revert every status/note change made since. With
+    only_once, nothing happens if an import already ran; that check is made
+    inside the write transaction, so workers opening a fresh database at the
+    same time don't each import it."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if only_once and conn.execute("SELECT 1 FROM store_meta WHERE key = 'files_imported'").fetchone():
+            conn.execute("ROLLBACK")
+            return 0, 0
+        subs = _read_submissions_files()
+        state = _load_state_files()
+        conn.executemany(_UPSERT_SUBMISSION_SQL, [_submission_row(x) for x in subs])
+        conn.executemany(_INSERT_STATE_SQL, [_state_row(t, st) for t, st in state.items()
+                                             if isinstance(st, dict)])
+        for x in subs:
+            _db_search_index(conn, x.get("ticket") or "")
+        _db_bump_version(conn)
+        conn.execute("INSERT OR REPLACE INTO store_meta (key, value) VALUES ('files_imported', ?)",
+                     (datetime.utcnow().isoformat() + "Z",))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return len(subs), len(state)
+
+@app.cli.command("import-tickets")
+def import_tickets_command():
+    """Import SUBMIT_LOG/SUBMIT_STATE into TICKET_DB (idempotent)."""
+    subs, states = _import_ticket_files(_ticket_db())
+    print(f"Imported {subs} submissions and {states} ticket states into {TICKET_DB} "
+          "(tickets already in the database keep their current state)")
+
+def _db_log_submission(obj: dict):
+    conn = _ticket_db()
+    conn.execute(_UPSERT_SUBMISSION_SQL, _submission_row(obj))
+    _db_search_index(conn, obj.get("ticket") or "")
+    _db_bump_version(conn)
+
+def _db_query_submissions(kind: str = "", status: str = ""):
+    """(submission, state-or-None) pairs, newest first, filtered in SQL."""
+    sql = ("SELECT s.body, t.body FROM submissions s "
+           "LEFT JOIN ticket_state t ON t.ticket = s.ticket")
+    where, args = [], []
+    if kind:
+        where.append("s.kind = ?"); args.append(kind)
+    if status:
+        where.append("COALESCE(t.status, 'open') = ?"); args.append(status)
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY s.ts DESC, s.ticket DESC"
+    return [(json.loads(sb), json.loads(tb) if tb else None)
+            for sb, tb in _ticket_db().execute(sql, args)]
+
+# ---------------- Ticket storage (dispatches on TICKET_STORE) ----------------
+_DEFAULT_TICKET_STATE = {"status": "open", "note": "", "history": []}
+
+def _read_submissions():
+    if TICKET_STORE == "sqlite":
+        return [sub for sub, _ in _db_query_submissions()]
+    return _read_submissions_files()
+
+def _get_submission(ticket: str) -> dict | None:
+    if TICKET_STORE == "sqlite":
+        row = _ticket_db().execute("SELECT body FROM submissions WHERE ticket = ?", (ticket,)).fetchone()
+        return json.loads(row[0]) if row else None
+    with _SUBMISSION_INDEX_LOCK:
+        _refresh_submission_index()
+        return _SUBMISSION_INDEX["items"].get(ticket)
+
+def _load_state():
+    if TICKET_STORE == "sqlite":
+        return {t: json.loads(b) for t, b in _ticket_db().execute("SELECT ticket, body FROM ticket_state")}
+    return _load_state_files()
+
 def _save_state(state: dict):
-    tmp = SUBMIT_STATE + ".tmp"
-    with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(state, f, ensure_ascii=False, indent=2)
-    os.replace(tmp, SUBMIT_STATE)
+    if TICKET_STORE == "sqlite":
+        conn = _ticket_db()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(_UPSERT_STATE_SQL, [_state_row(t, st) for t, st in state.items()])
+            for t in state:
+                _db_search_index(conn, t)
+            _db_bump_version(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return
+    _save_state_files(state)
 
-def _ensure_ticket_state(ticket: str):
-    state = _load_state()
-    if ticket not in state:
-        state[ticket] = {"status": "open", "note": "", "history": []}
-        _save_state(state)
+def _get_ticket_state(ticket: str) -> dict | None:
+    if TICKET_STORE == "sqlite":
+        row = _ticket_db().execute("SELECT body FROM ticket_state WHERE ticket = ?", (ticket,)).fetchone()
+        return json.loads(row[0]) if row else None
+    return _load_state().get(ticket)
 
-def _merge_ticket(item: dict) -> dict:
-    state = _load_state()
-    st = state.get(item.get("ticket",""), {"status":"open","note":"","history":[]})
+def _ensure_ticket_state(ticket: str):
+    if TICKET_STORE == "sqlite":
+        conn = _ticket_db()
+        if conn.execute("INSERT OR IGNORE INTO ticket_state (ticket, status, body) VALUES (?, ?, ?)",
+                        _state_row(ticket, _DEFAULT_TICKET_STATE)).rowcount:
+            _db_bump_version(conn)
+        return
+    if ticket not in _load_state():
+        _state_journal_append([{"ticket": ticket, "ensure": True}])
+
+def _update_ticket_states(changes: dict[str, dict], history: dict[str, dict] | None = None):
+    """Merge `changes` ({ticket: {key: value}}) into each ticket's state and
+    append `history` ({ticket: entry}) to its history, as one write however
+    many tickets are involved. Only the given keys are written - never a
+    whole state read earlier - so two workers updating one ticket at the
+    same time can't undo each other's change."""
+    history = history or {}
+    tickets = list(dict.fromkeys([*changes, *history]))
+    if not tickets:
+        return
+    if TICKET_STORE == "sqlite":
+        conn = _ticket_db()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for ticket in tickets:
+                row = conn.execute("SELECT body FROM ticket_state WHERE ticket = ?", (ticket,)).fetchone()
+                st = json.loads(row[0]) if row else dict(_DEFAULT_TICKET_STATE, history=[])
+                st.update(changes.get(ticket) or {})
+                if ticket in history:
+                    st["history"] = list(st.get("history") or []) + [history[ticket]]
+                conn.execute(_UPSERT_STATE_SQL, _state_row(ticket, st))
+                _db_search_index(conn, ticket)
+            _db_bump_version(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return
+    records = []
+    for ticket in tickets:
+        rec = {"ticket": ticket, "set": changes.get(ticket) or {}}
+        if ticket in history:
+            rec["history_add"] = [history[ticket]]
+        records.append(rec)
+    _state_journal_append(records)
+
+def _tickets_version() -> str:
+    """Cheap token that changes whenever any submission or ticket state
+    does: the store's write counter in SQLite mode, or the identity/size/
+    mtime of each backing file in file mode (a stat() per file, no reads)."""
+    if TICKET_STORE == "sqlite":
+        return "db:" + _ticket_db().execute("SELECT value FROM store_meta WHERE key = 'version'").fetchone()[0]
+    sig = []
+    for path in (*_submission_paths(), SUBMIT_STATE, STATE_JOURNAL):
+        try:
+            st = os.stat(path) if path else None
+        except FileNotFoundError:
+            st = None
+        sig.append(f"{st.st_ino}:{st.st_size}:{st.st_mtime_ns}" if st else "-")
+    return "files:" + "|".join(sig)
+
+def _merge_ticket(item: dict, st: dict | None = None) -> dict:
+    if st is None:
+        st = _get_ticket_state(item.get("ticket", "")) or _DEFAULT_TICKET_STATE
     merged = dict(item)
     merged["status"] = st.get("status","open")
     merged["note"] = st.get("note","")
     merged["history"] = st.get("history",[])
+    for key in ("email_admin", "email_client"):
+        if key in st:
+            merged[key] = st[key]
     return merged
 
-def _maybe_send_overdue_alert(items: list[dict]) -> int:
-    """Send a one-time email alert for tickets older than 20h (non-resolved)."""
-    count = 0
-    state = _load_state()
-    now_iso = datetime.utcnow().isoformat() + "Z"
-
-    for it in items:
-        ticket = it.get("ticket")
-        status = (it.get("status") or "open").lower()
-        if not ticket:
-            continue
+def _db_page_submissions(kind: str, status: str, q: str, limit: int, after: tuple | None):
+    """One page of (submission, state-or-None) pairs in (ts, ticket) DESC
+    order strictly after the `after` key, plus the total/per-status counts
+    for the whole filtered set. `q` needs the FTS table (_DB_LOCAL.fts)."""
+    conn = _ticket_db()
+    base = " FROM submissions s LEFT JOIN ticket_state t ON t.ticket = s.ticket"
+    where, args = [], []
+    if kind:
+        where.append("s.kind = ?"); args.append(kind)
+    if status:
+        where.append("COALESCE(t.status, 'open') = ?"); args.append(status)
+    if len(q) >= 3:
+        where.append("s.rowid IN (SELECT rowid FROM ticket_search WHERE ticket_search MATCH ?)")
+        args.append('"' + q.replace('"', '""') + '"')
+    elif q:
+        # too short for a trigram - LIKE still only scans the FTS text
+        like = "%" + q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        where.append("s.rowid IN (SELECT rowid FROM ticket_search "
+                     "WHERE body LIKE ? ESCAPE '\\' OR note LIKE ? ESCAPE '\\')")
+        args += [like, like]
+    filt = (" WHERE " + " AND ".join(where)) if where else ""
+    counts = dict(conn.execute(
+        "SELECT COALESCE(t.status, 'open'), COUNT(*)" + base + filt + " GROUP BY 1", args).fetchall())
+    page_where, page_args = list(where), list(args)
+    if after:
+        page_where.append("(s.ts, s.ticket) < (?, ?)"); page_args += list(after)
+    sql = "SELECT s.body, t.body" + base
+    if page_where:
+        sql += " WHERE " + " AND ".join(page_where)
+    sql += " ORDER BY s.ts DESC, s.ticket DESC LIMIT ?"
+    rows = [(json.loads(sb), json.loads(tb) if tb else None)
+            for sb, tb in conn.execute(sql, page_args + [limit])]
+    return rows, counts
+
+def _page_tickets(kind: str = "", status: str = "", q: str = "", *,
+                  limit: int | None = None, after: tuple | None = None):
+    """Submissions merged with their state, ordered newest first by
+    (ts, ticket) so the order is stable even for identical timestamps, and
+    filtered by kind/status and the search text `q` (see _search_tickets).
+
+    Returns (items, counts, next_after): at most `limit` items (all if None)
+    after the `after` key, the per-status counts of everything that matches
+    (ignoring the page), and the key to pass as `after` for the next page
+    (None on the last page)."""
+    q = (q or "").lower().strip()
+    if TICKET_STORE == "sqlite" and (not q or _db_has_fts()):
+        rows, counts = _db_page_submissions(kind, status, q, -1 if limit is None else limit + 1, after)
+        items = [_merge_ticket(sub, st or _DEFAULT_TICKET_STATE) for sub, st in rows]
+    elif TICKET_STORE != "sqlite" and not q:
+        # counts are kept up to date separately, and the page starts right
+        # after the cursor and stops once it's full - only the tickets shown
+        # (plus any skipped by a filter) are looked at
+        counts = _ticket_counts(kind, status)
+        state = _load_state()
+        items = []
+        for x in _read_submissions_files(after):
+            st = state.get(x.get("ticket","")) or _DEFAULT_TICKET_STATE
+            if kind and x.get("kind","") != kind: continue
+            if status and st.get("status","open") != status: continue
+            items.append(_merge_ticket(x, st))
+            if limit is not None and len(items) > limit: break
+    else:
+        if TICKET_STORE == "sqlite":
+            pairs = [(x, st) for x, st in _db_query_submissions(kind, status)
+                     if q in _search_text(x) + "\n" + ((st or {}).get("note") or "").lower()]
+        else:
+            state = _load_state()
+            hits = _search_tickets(q)
+            with _SUBMISSION_INDEX_LOCK:
+                subs = [_SUBMISSION_INDEX["items"][t] for t in hits if t in _SUBMISSION_INDEX["items"]]
+            subs.sort(key=lambda x: (x.get("ts",""), x.get("ticket","")), reverse=True)
+            pairs = ((x, state.get(x.get("ticket",""))) for x in subs)
+        items, counts = [], {}
+        for x, st in pairs:
+            st = st or _DEFAULT_TICKET_STATE
+            st_status = st.get("status","open")
+            if kind and x.get("kind","") != kind: continue
+            if status and st_status != status: continue
+            counts[st_status] = counts.get(st_status, 0) + 1
+            if limit is not None and len(items) > limit: continue
+            if after is None or (x.get("ts",""), x.get("ticket","")) < tuple(after):
+                items.append(_merge_ticket(x, st))
+    next_after = None
+    if limit is not None and len(items) > limit:
+        items = items[:limit]
+        next_after = (items[-1].get("ts",""), items[-1].get("ticket",""))
+    return items, counts, next_after
+
+def _encode_cursor(key: tuple) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode("utf-8")).decode("ascii").rstrip("=")
+
+def _decode_cursor(cursor: str) -> tuple | None:
+    try:
+        ts, ticket = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if isinstance(ts, str) and isinstance(ticket, str):
+            return ts, ticket
+    except Exception:
+        pass
+    return None
+
+# ---------------- Overdue alerts (background) ----------------
+# A ticket still not resolved OVERDUE_HOURS after submission gets one alert
+# email to ALERT_EMAIL. This used to run inside the dashboard's ticket-list
+# GET, so a page refresh could block on several Brevo calls and rewrote the
+# state file once per overdue ticket. It now runs as a scheduled job (see
+# "Job scheduler"), every OVERDUE_SCAN_INTERVAL seconds: a min-heap of (deadline, ticket) means each tick only looks at tickets whose
+# deadline just passed, new submissions are pushed as they show up, and all
+# of a tick's "alerted" flags are saved in one write. A ticket that was
+# resolved when its deadline passed is dropped; if a PATCH later reopens it,
+# that request appends it to OVERDUE_REQUEUE (the PATCH may run in any
+# worker, the scan only in the scheduler's) and the next tick takes it back.
+#
+# OVERDUE_ALERT_MODE "digest" (default) puts every ticket that went overdue
+# in one scan into a single email, so a Monday morning with dozens of
+# weekend tickets is one Brevo call, not dozens; "each" sends one email per
+# ticket as before. Either way a ticket is alerted at most once.
+OVERDUE_HOURS         = 20.0
+OVERDUE_SCAN_INTERVAL = int(env("OVERDUE_SCAN_INTERVAL", "60"))
+OVERDUE_ALERT_MODE    = (env("OVERDUE_ALERT_MODE", "digest") or "digest").strip().lower()
+OVERDUE_REQUEUE       = SUBMIT_STATE + ".requeue"
+
+_OVERDUE_LOCK = threading.Lock()
+_OVERDUE = {
+    "source": None,        # submission-index generation (file store) the heap follows
+    "seen": 0,             # change-log entries / submission rowids already pushed
+    "heap": [],            # (deadline epoch seconds, ticket)
+}
 
-        overdue = bool(it.get("overdue"))
-        if not overdue:
-            continue
+def _overdue_new_submissions() -> list[tuple[str, str]]:
+    """(ticket, ts) of submissions not yet pushed onto the heap."""
+    ov = _OVERDUE
+    if TICKET_STORE == "sqlite":
+        rows = _ticket_db().execute("SELECT rowid, ticket, ts FROM submissions WHERE rowid > ? ORDER BY rowid",
+                                    (ov["seen"],)).fetchall()
+        if rows:
+            ov["seen"] = rows[-1][0]
+        return [(t, ts) for _, t, ts in rows]
+    with _SUBMISSION_INDEX_LOCK:
+        _refresh_submission_index()
+        sub = _SUBMISSION_INDEX
+        if ov["source"] != sub["generation"]:
+            ov.update(source=sub["generation"], seen=0, heap=[])
+        fresh = [(t, sub["items"][t].get("ts", "")) for t in sub["changes"][ov["seen"]:]]
+        ov["seen"] = len(sub["changes"])
+    return fresh
+
+def _overdue_requeue(ticket: str):
+    """A resolved ticket was reopened after its deadline: hand it back to
+    the scan, whichever process runs it."""
+    _group_commit(OVERDUE_REQUEUE, (ticket + "\n").encode("utf-8"))
+
+def _overdue_take_requeued() -> list[str]:
+    if not os.path.exists(OVERDUE_REQUEUE):
+        return []
+    with _file_lock(OVERDUE_REQUEUE):
+        with open(OVERDUE_REQUEUE, "r+", encoding="utf-8") as f:
+            tickets = [t for t in f.read().split("\n") if t]
+            f.truncate(0)
+    return tickets
+
+def _ticket_states(tickets) -> dict:
+    if TICKET_STORE == "sqlite":
+        return {t: st for t in tickets if (st := _get_ticket_state(t)) is not None}
+    state = _load_state()
+    return {t: state[t] for t in tickets if t in state}
+
+def _overdue_summary(it: dict) -> tuple[str, str, str]:
+    """(client name, client email, age in hours) as shown in the alerts."""
+    fields = it.get("fields", {}) or {}
+    client_email = it.get("client_email") or fields.get("Email", "")
+    name = fields.get("Name") or fields.get("Organisation / Dept", "") or "(no name)"
+    return name, client_email or "(n/a)", f"{_age_hours(it.get('ts','')):.1f}"
+
+def _overdue_alert_email(it: dict, status: str) -> tuple[str, str]:
+    ticket = it.get("ticket", "")
+    name, client_email, age_h = _overdue_summary(it)
+    return _render_email(
+        "Overdue ticket",
+        _eb_heading(f"⚠️ Overdue Ticket > 20h — {ticket}"),
+        _eb_table([("Ticket", ticket), ("Status", status.upper()), ("Age (hours)", age_h),
+                   ("Submitted (UTC)", it.get("ts", "")), ("Kind", it.get("kind", "")),
+                   ("Name", name), ("Client Email", client_email)]),
+        _eb_para("This alert is sent once per ticket. Update status/remarks from Admin → Table/Drawer.",
+                 "This alert is sent once per ticket. Update status/remarks from Admin → Table/Drawer."),
+    )
 
-        st = state.setdefault(ticket, {"status": status, "note": "", "history": []})
-        if st.get("overdue_alerted"):
-            continue  # already alerted once
+def _overdue_digest_email(alerts: list[tuple[dict, str]]) -> tuple[str, str]:
+    rows = []
+    for it, status in alerts:
+        name, client_email, age_h = _overdue_summary(it)
+        rows.append((it.get("ticket", ""), status.upper(), age_h, it.get("kind", ""), name, client_email))
+    return _render_email(
+        f"{len(alerts)} overdue tickets",
+        _eb_heading(f"⚠️ {len(alerts)} tickets overdue > 20h"),
+        _eb_grid(("Ticket", "Status", "Age (h)", "Kind", "Name", "Client Email"), rows),
+        _eb_para("Each ticket is alerted once. Update status/remarks from Admin → Table/Drawer.",
+                 "Each ticket is alerted once. Update status/remarks from Admin → Table/Drawer."),
+    )
 
+def _send_overdue_alerts(alerts: list[tuple[dict, str]]):
+    """Email ALERT_EMAIL about `alerts` ((submission, status) pairs): one
+    message for the whole batch in digest mode, else one per ticket."""
+    if OVERDUE_ALERT_MODE == "digest" and len(alerts) > 1:
+        batches = [alerts]
+    else:
+        batches = [[a] for a in alerts]
+    for batch in batches:
+        if len(batch) == 1:
+            it, status = batch[0]
+            subject, body = f"[ALERT] Ticket overdue (>20h): {it.get('ticket', '')}", _overdue_alert_email(it, status)
+        else:
+            subject, body = f"[ALERT] {len(batch)} tickets overdue (>20h)", _overdue_digest_email(batch)
         try:
-            fields = it.get("fields", {}) or {}
-            client_email = it.get("client_email") or fields.get("Email", "")
-            name = fields.get("Name") or fields.get("Organisation / Dept", "") or "(no name)"
-            age_h = f"{it.get('age_hours', _age_hours(it.get('ts',''))):.1f}"
-
-            inner = f"""
-<h2 style="margin:0 0 8px;font:700 18px Arial;color:{BRAND['ink']}">⚠️ Overdue Ticket &gt; 20h — {ticket}</h2>
-<table role="presentation" cellpadding="0" cellspacing="0" width="100%" style="border:1px solid {BRAND['line']};border-radius:10px">
-  {_row("Ticket", ticket)}
-  {_row("Status", status.upper())}
-  {_row("Age (hours)", age_h)}
-  {_row("Submitted (UTC)", it.get("ts",""))}
-  {_row("Kind", it.get("kind",""))}
-  {_row("Name", name)}
-  {_row("Client Email", client_email or "(n/a)")}
-</table>
-<p style="font:13px Arial;color:{BRAND['muted']}">This alert is sent once per ticket. Update status/remarks from Admin → Table/Drawer.</p>
-"""
-            subject = f"[ALERT] Ticket overdue (>20h): {ticket}"
-            try:
-                send_email(subject, email_shell_html("Overdue ticket", inner), to=[ALERT_EMAIL], reply_to=BRAND["email"])
-            except Exception as e:
-                app.logger.exception("overdue alert email failed: %s", e)
-            st["overdue_alerted"] = True
-            st["overdue_alerted_ts"] = now_iso
-            count += 1
-        finally:
-            _save_state(state)
-    return count
+            send_email(subject, body[0], text_body=body[1], to=[ALERT_EMAIL], reply_to=BRAND["email"])
+        except Exception as e:
+            app.logger.exception("overdue alert email failed: %s", e)
+
+def _overdue_tick(now: float | None = None) -> int:
+    """One scan: alert every ticket that became overdue since the last one.
+    Returns how many tickets were alerted."""
+    now = time.time() if now is None else now
+    with _OVERDUE_LOCK:
+        ov = _OVERDUE
+        for ticket, ts in _overdue_new_submissions():
+            if ticket:
+                heapq.heappush(ov["heap"], (_parse_ts(ts).timestamp() + OVERDUE_HOURS * 3600, ticket))
+
+        due = set(_overdue_take_requeued())
+        while ov["heap"] and ov["heap"][0][0] <= now:
+            due.add(heapq.heappop(ov["heap"])[1])
+        if not due:
+            return 0
+
+        states = _ticket_states(due)
+        to_alert = []
+        for ticket in sorted(due):
+            st = states.get(ticket) or _DEFAULT_TICKET_STATE
+            if st.get("overdue_alerted"):
+                continue  # already alerted once
+            if (st.get("status") or "open").lower() == "resolved":
+                continue  # back via _overdue_requeue() if it's reopened
+            it = _get_submission(ticket)
+            if it:
+                to_alert.append((it, (st.get("status") or "open").lower()))
+
+    _send_overdue_alerts(to_alert)
+    now_iso = datetime.utcnow().isoformat() + "Z"
+    changes = {it.get("ticket", ""): {"overdue_alerted": True, "overdue_alerted_ts": now_iso} for it, _ in to_alert}
+    _update_ticket_states(changes)
+    return len(changes)
+
+if (env("OVERDUE_ALERTS", "1") or "1") == "1" and smtp_ready():
+    _register_job("overdue-alerts", _overdue_tick, every=OVERDUE_SCAN_INTERVAL)
 
 # ---------------- API: health & smtp_ready ----------------
 @app.get("/api/health")
@@ -484,15 +2272,144 @@ def api_health():
         "static_dir": STATIC_DIR,
         "upload_dir": UPLOAD_DIR,
         "max_email_mb": MAX_EMAIL_MB,
-        "log_file": SUBMIT_LOG
+        "log_file": SUBMIT_LOG,
+        "ticket_store": TICKET_STORE,
+        "http_pool": dict(_HTTP_POOL_STATS),
+        "static_cache": dict(_HOT_STATS, files=len(_HOT_FILES)),
+        "background": _background_status()
     })
 
 @app.get("/admin/api/smtp_ready")
 def api_smtp_ready():
     return jsonify({"ok": True, "ready": smtp_ready()})
 
+@app.get("/admin/api/outbox")
+def admin_api_outbox():
+    """Email outbox depth, plus the next few messages waiting to go out."""
+    guard = _require_authed_api()
+    if guard: return guard
+    pending = []
+    for name in sorted(n for n in os.listdir(OUTBOX_DIR) if n.endswith(".json"))[:50]:
+        try:
+            with open(os.path.join(OUTBOX_DIR, name), "r", encoding="utf-8") as f:
+                msg = json.load(f)
+        except (FileNotFoundError, ValueError):
+            continue  # claimed or rewritten meanwhile
+        pending.append({"id": msg["id"], "ticket": msg["ticket"], "role": msg["role"],
+                        "attempts": msg.get("attempts", 0), "last_error": msg.get("last_error"),
+                        "next_try": datetime.utcfromtimestamp(int(name.split("-", 1)[0]) / 1000).isoformat() + "Z"})
+    return jsonify({"ok": True, **_outbox_depth(), "pending": pending})
+
+@app.get("/admin/api/jobs")
+def admin_api_jobs():
+    """Scheduled jobs with their last/next run, as recorded by whichever
+    process is running the scheduler."""
+    guard = _require_authed_api()
+    if guard: return guard
+    iso = lambda t: datetime.utcfromtimestamp(t).isoformat() + "Z" if t else None
+    state = _scheduler_state()
+    with _JOBS_LOCK:
+        jobs = dict(_JOBS)
+    items = []
+    for name in sorted(set(jobs) | set(state)):
+        rec = state.get(name) or {}
+        items.append({"name": name, "spec": jobs[name]["spec"] if name in jobs else rec.get("spec"),
+                      "registered": name in jobs, "runs": rec.get("runs", 0),
+                      "last_run": iso(rec.get("last_run")), "last_duration_ms": rec.get("last_duration_ms"),
+                      "last_ok": rec.get("last_ok"), "last_error": rec.get("last_error"),
+                      "next_run": iso(rec.get("next_run"))})
+    return jsonify({"ok": True, "jobs": items, "background": _background_status()})
+
+# ---------------- Rate limiting (public forms) ----------------
+# A bot hammering the public forms used to tie workers up on Brevo calls
+# and burn the day's sending quota. Each submission now has to take one
+# token from its client's bucket and one from the global bucket - both or
+# neither - in a single BEGIN IMMEDIATE transaction on RATE_LIMIT_DB, so
+# every worker process sees the same counts. A refused request gets 429 +
+# Retry-After before its body is parsed or anything is written or sent.
+# Buckets are stored as (tokens, as-of time) and refilled lazily on read.
+# If the database itself is unavailable, requests are let through rather
+# than turning a disk hiccup into an outage of the contact forms.
+_RL_LOCAL = threading.local()
+_RL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    key    TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    ts     REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+def _client_ip() -> str:
+    hops = [h.strip() for h in request.headers.get("X-Forwarded-For", "").split(",") if h.strip()]
+    if hops and TRUSTED_PROXY_HOPS > 0:
+        return hops[-min(TRUSTED_PROXY_HOPS, len(hops))]
+    return request.remote_addr or ""
+
+def _ratelimit_db() -> sqlite3.Connection:
+    conn = getattr(_RL_LOCAL, "conn", None)
+    if conn is not None and _RL_LOCAL.pid == os.getpid():
+        return conn
+    conn = sqlite3.connect(RATE_LIMIT_DB, timeout=5, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")  # losing the last few takes in a crash is harmless
+    conn.executescript(_RL_SCHEMA)
+    _RL_LOCAL.conn, _RL_LOCAL.pid = conn, os.getpid()
+    return conn
+
+def _take_tokens(buckets: list[tuple[str, float, float]], now: float | None = None) -> float:
+    """Take one token from every (key, burst, per_second) bucket, or from
+    none of them. Returns 0.0 on success, else the seconds until all of
+    them would have a token again."""
+    now = time.time() if now is None else now
+    conn = _ratelimit_db()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        wait, levels = 0.0, []
+        for key, burst, rate in buckets:
+            row = conn.execute("SELECT tokens, ts FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens = burst if row is None else min(burst, row[0] + max(0.0, now - row[1]) * rate)
+            levels.append((key, tokens - 1, now))
+            if tokens < 1:
+                wait = max(wait, (1 - tokens) / rate)
+        if not wait:
+            conn.executemany("INSERT OR REPLACE INTO buckets (key, tokens, ts) VALUES (?, ?, ?)", levels)
+            if random.random() < 0.01:
+                # a bucket idle this long has refilled completely - same as no row
+                conn.execute("DELETE FROM buckets WHERE ts < ?", (now - 86400,))
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return wait
+
+def _rate_limited(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if RATE_LIMIT:
+            try:
+                wait = _take_tokens([
+                    (f"ip:{_client_ip()}", RATE_LIMIT_IP_BURST, RATE_LIMIT_IP_PER_HOUR / 3600),
+                    ("global", RATE_LIMIT_GLOBAL_BURST, RATE_LIMIT_GLOBAL_PER_HOUR / 3600),
+                ])
+            except sqlite3.Error:
+                app.logger.exception("rate limiter unavailable; letting request through")
+                wait = 0.0
+            if wait:
+                resp = jsonify({"ok": False, "error": "Too many requests - please try again shortly."})
+                resp.status_code = 429
+                resp.headers["Retry-After"] = str(max(1, math.ceil(wait)))
+                return resp
+        return view(*args, **kwargs)
+    return wrapper
+
 # ---------------- API: forms ----------------
+@app.errorhandler(RequestEntityTooLarge)
+def _request_too_large(e):
+    # the forms show `error` to the user; Werkzeug's default is an HTML page
+    return jsonify({"ok": False, "error": f"Request too large - attachments are limited to {MAX_EMAIL_MB} MB in total."}), 413
+
 @app.post("/api/contact")
+@_rate_limited
 def api_contact():
     data = request.get_json(silent=True) or {}
     name = (data.get("name") or "").strip()
@@ -501,7 +2418,7 @@ def api_contact():
     if not name or not _valid_email(email) or not message:
         return jsonify({"ok": False, "error": "Missing/invalid fields"}), 400
     fields = {"Name": name, "Email": email, "Message": message.replace("\n","<br>")}
-    meta = {"ip": request.remote_addr, "ua": request.headers.get("User-Agent","")}
+    meta = {"ip": _client_ip(), "ua": request.headers.get("User-Agent","")}
     try:
         notify_admin_and_client("Contact", fields, client_name=name, client_email=email, reply_to=email, meta=meta)
         return jsonify({"ok": True})
@@ -510,6 +2427,7 @@ def api_contact():
         return jsonify({"ok": False, "error": str(e)}), 500
 
 @app.post("/api/quote")
+@_rate_limited
 def api_quote():
     data = request.get_json(silent=True) or {}
     required = ("name", "email", "phone", "ptype")
@@ -528,7 +2446,7 @@ def api_quote():
         "When": data.get("when",""),
         "Notes": (data.get("notes") or "").replace("\n","<br>")
     }
-    meta = {"ip": request.remote_addr, "ua": request.headers.get("User-Agent","")}
+    meta = {"ip": _client_ip(), "ua": request.headers.get("User-Agent","")}
     try:
         notify_admin_and_client("Quick Quote", fields,
                                 client_name=data.get("name",""),
@@ -541,6 +2459,7 @@ def api_quote():
         return jsonify({"ok": False, "error": str(e)}), 500
 
 @app.post("/api/project")
+@_rate_limited
 def api_project():
     fx = lambda k: (request.form.get(k) or "").strip()
     fields = {
@@ -561,33 +2480,31 @@ def api_project():
     if not client_name or not _valid_email(client_email):
         return jsonify({"ok": False, "error": "Missing/invalid name/email"}), 400
 
-    attachments_saved, total = [], 0
+    attachments, total = [], 0
     for f in request.files.getlist("files"):
         if not f or not f.filename:
             continue
-        safe_name = _attach_safe(f.filename)
-        if not _ext_allowed(safe_name):
-            continue
-        blob = f.read()
-        if not blob:
-            continue
-        if total + len(blob) > MAX_EMAIL_BYTES:
-            continue
-        safe_name = f"{uuid.uuid4().hex[:8]}_{safe_name}"
-        path = os.path.join(UPLOAD_DIR, safe_name)
-        with open(path, "wb") as wf:
-            wf.write(blob)
-        attachments_saved.append(safe_name)
-        total += len(blob)
-
-    meta = {"ip": request.remote_addr, "ua": request.headers.get("User-Agent","")}
+        saved = _ingest_upload(f, MAX_EMAIL_BYTES - total)
+        if saved:
+            # names are per ticket now (no random prefix), so two uploads
+            # called "drawing.pdf" in one request need telling apart
+            stem, ext = os.path.splitext(saved["name"])
+            n = 1
+            while any(a["name"] == saved["name"] for a in attachments):
+                n += 1
+                saved["name"] = f"{stem}-{n}{ext}"
+            attachments.append(saved)
+            total += saved["size"]
+
+    meta = {"ip": _client_ip(), "ua": request.headers.get("User-Agent","")}
     try:
         notify_admin_and_client("Project Desk", fields,
                                 client_name=client_name, client_email=client_email,
-                                attachments_saved=attachments_saved,
+                                attachments=attachments,
                                 reply_to=client_email, meta=meta)
         return jsonify({"ok": True})
     except Exception as e:
+        _discard_uploads(attachments)
         app.logger.exception("project send failed")
         return jsonify({"ok": False, "error": str(e)}), 500
 
@@ -603,7 +2520,7 @@ def _require_authed_api():
 # ---------------- Admin: login/logout/dashboard (STATIC files) ----------------
 @app.get("/admin/login")
 def admin_login_page():
-    return send_from_directory(STATIC_DIR, "admin-login.html")
+    return _send_static("admin-login.html")
 
 @app.post("/admin/login")
 def admin_login_post():
@@ -635,7 +2552,7 @@ def admin_verify_page():
     next_path = _safe_next(request.args.get("next"))
     if session.get("access_logged") is True:
         return redirect(next_path)
-    return send_from_directory(STATIC_DIR, "admin-verify.html")
+    return _send_static("admin-verify.html")
 
 # Without this, the generic static-file catch-all below would serve the raw
 # page at its literal filename with no auth check at all (the same class of
@@ -646,6 +2563,69 @@ def admin_verify_page():
 def admin_verify_html_direct():
     return redirect(url_for("admin_login_page"))
 
+# The access-log endpoint accepts a face photo of up to 8 MB and eye crops of
+# up to 2 MB each, and used to base64 every byte of them straight back into
+# the Brevo payload. Each image is now opened lazily (header only), checked
+# against ACCESS_PHOTO_MAX_PIXELS before any pixel is decoded, decoded at
+# reduced scale where the format allows (JPEG draft), turned upright from
+# its EXIF orientation, shrunk to a max edge and re-encoded as the best
+# JPEG quality that fits a byte budget. A JPEG already within both limits
+# (what the verify page itself sends) is passed through untouched.
+ACCESS_PHOTO_MAX_EDGE   = int(env("ACCESS_PHOTO_MAX_EDGE", "960"))
+ACCESS_PHOTO_MAX_BYTES  = int(env("ACCESS_PHOTO_MAX_BYTES", str(150 * 1024)))
+ACCESS_IRIS_MAX_EDGE    = 192   # shown at 96px in the email
+ACCESS_IRIS_MAX_BYTES   = 24 * 1024
+ACCESS_PHOTO_MAX_PIXELS = 12_000_000
+_JPEG_QUALITY_STEPS = (85, 75, 65, 55, 45)
+_EXIF_TRANSPOSE = {  # EXIF orientation -> what turns it upright
+    2: Image.Transpose.FLIP_LEFT_RIGHT, 3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM, 5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270, 7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+def _fit_photo_jpeg(raw: bytes, max_edge: int, max_bytes: int) -> bytes:
+    """Upright JPEG of a captured photo, at most max_edge px on its long side
+    and max_bytes long (smaller dimensions are tried if even the lowest
+    quality step doesn't fit). Raises ValueError for anything that isn't a
+    readable JPEG or PNG."""
+    try:
+        src = Image.open(BytesIO(raw), formats=["JPEG", "PNG"])
+    except Exception as e:
+        raise ValueError("not a JPEG or PNG image") from e
+    with src:
+        if src.width * src.height > ACCESS_PHOTO_MAX_PIXELS:
+            raise ValueError(f"image is {src.width}x{src.height}, too many pixels")
+        orientation = src.getexif().get(0x0112, 1)
+        if src.format == "JPEG" and orientation == 1 and max(src.size) <= max_edge and len(raw) <= max_bytes:
+            return raw
+        scale = min(1.0, max_edge / max(src.size))
+        size = (max(1, round(src.width * scale)), max(1, round(src.height * scale)))
+        src.draft("RGB", size)
+        try:
+            # thumbnail() works in place: a JPEG is decoded at reduced scale
+            # by draft(), anything else is decoded once and reduce()d by an
+            # integer factor before the final resample. Only the small result
+            # is rotated upright and converted, never the full-size image.
+            src.thumbnail((max_edge, max_edge), Image.LANCZOS, reducing_gap=1.0)
+            method = _EXIF_TRANSPOSE.get(orientation)
+            img = (src.transpose(method) if method is not None else src).convert("RGB")
+        except (OSError, SyntaxError) as e:  # truncated / corrupt pixel data
+            raise ValueError("could not decode image") from e
+
+    while True:
+        for quality in _JPEG_QUALITY_STEPS:
+            out = BytesIO()
+            img.save(out, format="JPEG", quality=quality, optimize=True)
+            if out.tell() <= max_bytes:
+                return out.getvalue()
+        if max(img.size) <= 64:
+            return out.getvalue()
+        img = img.resize((max(1, img.width * 3 // 4), max(1, img.height * 3 // 4)), Image.LANCZOS)
+
+def _fmt_size(n: int) -> str:
+    return f"{n / 1024 / 1024:.1f} MB" if n >= 1024 * 1024 else f"{n / 1024:.0f} KB"
+
 @app.post("/admin/api/access-log")
 def admin_api_access_log():
     guard = _require_authed_api()
@@ -658,13 +2638,16 @@ def admin_api_access_log():
     if not name or not m:
         return jsonify({"ok": False, "error": "A name and a captured photo are both required."}), 400
 
-    ext = "png" if m.group(1) == "png" else "jpg"
+    # size limits are checked on the base64 text, before decoding any of it
+    if len(m.group(2)) > (8 * 1024 * 1024) * 4 // 3 + 4:
+        return jsonify({"ok": False, "error": "Photo too large."}), 400
     try:
-        photo_bytes = base64.b64decode(m.group(2))
-    except Exception:
+        photo_raw = base64.b64decode(m.group(2))
+        photo_bytes = _fit_photo_jpeg(photo_raw, ACCESS_PHOTO_MAX_EDGE, ACCESS_PHOTO_MAX_BYTES)
+    except ValueError:  # binascii.Error is one too
         return jsonify({"ok": False, "error": "Could not decode photo."}), 400
-    if len(photo_bytes) > 8 * 1024 * 1024:
-        return jsonify({"ok": False, "error": "Photo too large."}), 400
+    ext = "jpg"
+    bytes_in, bytes_out = len(photo_raw), len(photo_bytes)
 
     # Optional close-up eye/iris crops captured alongside the main photo -
     # supplementary imagery only (a regular camera can't do real biometric
@@ -672,28 +2655,28 @@ def admin_api_access_log():
     # just extra visual detail, not a biometric match.
     iris_urls = body.get("iris") or []
     inline_images = [(f"access-photo.{ext}", photo_bytes)]
-    iris_html = ""
+    iris_html, iris_count = "", 0
     if isinstance(iris_urls, list):
         for i, url in enumerate(iris_urls[:2]):
             im = re.match(r"^data:image/(png|jpeg);base64,(.+)$", url or "", re.DOTALL)
-            if not im:
+            if not im or len(im.group(2)) > (2 * 1024 * 1024) * 4 // 3 + 4:
                 continue
             try:
-                iris_bytes = base64.b64decode(im.group(2))
-            except Exception:
+                iris_raw = base64.b64decode(im.group(2))
+                iris_bytes = _fit_photo_jpeg(iris_raw, ACCESS_IRIS_MAX_EDGE, ACCESS_IRIS_MAX_BYTES)
+            except ValueError:
                 continue
-            if len(iris_bytes) > 2 * 1024 * 1024:
-                continue
-            iris_ext = "png" if im.group(1) == "png" else "jpg"
-            cid = f"access-iris-{i}.{iris_ext}"
+            bytes_in, bytes_out = bytes_in + len(iris_raw), bytes_out + len(iris_bytes)
+            cid = f"access-iris-{i}.jpg"
             inline_images.append((cid, iris_bytes))
+            iris_count += 1
             iris_html += f'<img src="cid:{cid}" alt="Eye close-up" style="width:96px;height:96px;object-fit:cover;border-radius:8px;border:1px solid {BRAND["line"]};margin-right:8px">'
 
     # Optional device location (the browser's own geolocation prompt gates
     # this - best-effort only, a legitimate admin shouldn't be locked out
     # just because GPS/permission wasn't available).
     loc = body.get("location")
-    loc_row = f'<tr><td style="padding:10px 12px;font:700 13px Arial;color:{BRAND["muted"]}">Location</td><td style="padding:10px 12px;font:400 13px Arial;color:{BRAND["muted"]}">Not available (denied or unsupported)</td></tr>'
+    loc_value = "Not available (denied or unsupported)"
     if isinstance(loc, dict):
         try:
             lat = float(loc.get("lat"))
@@ -702,32 +2685,34 @@ def admin_api_access_log():
                 acc = loc.get("accuracy")
                 acc_txt = f" (±{int(acc)}m)" if isinstance(acc, (int, float)) else ""
                 maps_url = f"https://www.google.com/maps?q={lat},{lng}"
-                loc_row = (
-                    f'<tr><td style="padding:10px 12px;font:700 13px Arial;color:{BRAND["muted"]}">Location</td>'
-                    f'<td style="padding:10px 12px;font:400 13px Arial"><a href="{maps_url}" style="color:{BRAND["brand"]}">{lat:.6f}, {lng:.6f}</a>'
-                    f'<span style="color:{BRAND["muted"]}">{acc_txt}</span></td></tr>'
-                )
+                loc_value = (f'<a href="{maps_url}" style="color:{BRAND["brand"]}">{lat:.6f}, {lng:.6f}</a>'
+                             f'<span style="color:{BRAND["muted"]}">{acc_txt}</span>',
+                             f"{lat:.6f}, {lng:.6f}{acc_txt} {maps_url}")
         except (TypeError, ValueError):
             pass
 
     stamp = _now_ist().strftime("%Y-%m-%d %H:%M:%S IST")
     safe_name = html.escape(name)[:200]
-    inner = f"""
-<h2 style="margin:0 0 8px;font:700 18px Arial;color:{BRAND['ink']}">🔐 Office Use Only — Access Log</h2>
-<p style="margin:0 0 12px;font:400 14px Arial;color:{BRAND['muted']}">Someone logged into the admin/office area and completed the access-verification step (live face + blink check).</p>
-<table role="presentation" cellpadding="0" cellspacing="0" width="100%" style="border:1px solid {BRAND['line']};border-radius:10px">
-  <tr><td style="padding:10px 12px;font:700 13px Arial;width:110px;color:{BRAND['muted']}">Name</td><td style="padding:10px 12px;font:700 14px Arial;color:{BRAND['ink']}">{safe_name}</td></tr>
-  <tr><td style="padding:10px 12px;font:700 13px Arial;color:{BRAND['muted']}">Time</td><td style="padding:10px 12px;font:400 13px Arial;color:{BRAND['ink']}">{stamp}</td></tr>
-  <tr><td style="padding:10px 12px;font:700 13px Arial;color:{BRAND['muted']}">IP</td><td style="padding:10px 12px;font:400 13px Arial;color:{BRAND['ink']}">{html.escape(request.headers.get('X-Forwarded-For', request.remote_addr) or '')}</td></tr>
-  {loc_row}
-</table>
-<p style="margin:14px 0 0"><img src="cid:access-photo.{ext}" alt="Access photo" style="max-width:100%;border-radius:10px;border:1px solid {BRAND['line']}"></p>
-{f'<p style="margin:12px 0 0">{iris_html}</p>' if iris_html else ""}
-"""
+    ip = request.headers.get('X-Forwarded-For', request.remote_addr) or ''
+    blocks = [
+        _eb_heading("🔐 Office Use Only — Access Log"),
+        _eb_para("Someone logged into the admin/office area and completed the access-verification step (live face + blink check).",
+                 "Someone logged into the admin/office area and completed the access-verification step (live face + blink check).",
+                 style=_ES_LEAD),
+        _eb_table([("Name", (f"<b>{safe_name}</b>", name[:200])), ("Time", stamp),
+                   ("IP", (html.escape(ip), ip)), ("Location", loc_value),
+                   ("Photos", f"{_fmt_size(bytes_out)} attached ({_fmt_size(bytes_in)} received)")]),
+        _eb_para(f'<img src="cid:access-photo.{ext}" alt="Access photo" style="max-width:100%;border-radius:10px;border:1px solid {BRAND["line"]}">',
+                 "Access photo attached.", style="margin:14px 0 0"),
+    ]
+    if iris_html:
+        blocks.append(_eb_para(iris_html, f"{iris_count} eye close-up(s) attached.", style="margin:12px 0 0"))
+    html_body, text_body = _render_email(f"Access log: {name}", *blocks)
     try:
         send_email(
             f"Office Use Only — Access Log: {name}",
-            email_shell_html(f"Access log: {name}", inner),
+            html_body,
+            text_body=text_body,
             to=[HEALTH_CHECK_EMAIL],
             inline_images=inline_images,
         )
@@ -736,7 +2721,7 @@ def admin_api_access_log():
         return jsonify({"ok": False, "error": "Could not send the access log email - please try again."}), 502
 
     session["access_logged"] = True
-    return jsonify({"ok": True})
+    return jsonify({"ok": True, "photo_bytes": {"received": bytes_in, "sent": bytes_out}})
 
 @app.get("/admin")
 def admin_dashboard_page():
@@ -744,7 +2729,7 @@ def admin_dashboard_page():
         return redirect(url_for("admin_login_page"))
     if not session.get("access_logged"):
         return redirect(url_for("admin_verify_page", next="/admin"))
-    return send_from_directory(STATIC_DIR, "admin.html")
+    return _send_static("admin.html")
 
 # The invoice generator used to be gated only by a password hardcoded in its
 # own JS (readable by anyone via view-source, and the page content was
@@ -756,54 +2741,120 @@ def invoice_generator_page():
         return redirect(url_for("admin_login_page"))
     if not session.get("access_logged"):
         return redirect(url_for("admin_verify_page", next="/invoice-generator.html"))
-    return send_from_directory(STATIC_DIR, "invoice-generator.html")
+    return _send_static("invoice-generator.html")
 
 # ---------------- Admin APIs (protected) ----------------
+TICKETS_PAGE_MAX = 500
+
+# The dashboard polls the ticket list every 30s, and nearly every poll finds
+# nothing new. The ETag covers the store version, the exact request (path +
+# query) and the current 6-minute slot - age_hours is shown to 0.1h and the
+# overdue flag moves with it, so an unchanged store still gets fresh ages
+# that often. A match answers 304 before anything is read or serialized.
+def _tickets_etag() -> str:
+    key = "|".join([
+        _tickets_version(), request.path,
+        json.dumps(sorted(request.args.items(multi=True))),
+        str(int(time.time() // 360)),
+    ])
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+def _not_modified_or_none(etag: str):
+    if request.if_none_match.contains(etag):
+        resp = app.response_class(status=304)
+        resp.set_etag(etag)
+        resp.headers["Cache-Control"] = "private, no-cache"
+        return resp
+    return None
+
+def _with_etag(resp, etag: str):
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp
+
 @app.get("/admin/api/tickets")
 def admin_api_tickets():
     guard = _require_authed_api()
     if guard: return guard
-
-    items = [_merge_ticket(x) for x in _read_submissions()]
-
-    # compute age + overdue (only for non-resolved)
-    for it in items:
-        it["age_hours"] = _age_hours(it.get("ts",""))
-        st = (it.get("status") or "open").lower()
-        it["overdue"] = (it["age_hours"] > 20.0) and (st != "resolved")
+    etag = _tickets_etag()
+    not_modified = _not_modified_or_none(etag)
+    if not_modified: return not_modified
 
     # optional filters
     q = (request.args.get("q") or "").lower().strip()
     kind = (request.args.get("kind") or "").strip()
     status = (request.args.get("status") or "").strip()
 
-    def blob(i):
-        return json.dumps(i, ensure_ascii=False).lower()
-
-    if kind:
-        items = [i for i in items if i.get("kind","")==kind]
-    if status:
-        items = [i for i in items if i.get("status","")==status]
-    if q:
-        items = [i for i in items if q in blob(i)]
+    # optional paging: ?limit=N returns one page plus `next_cursor`, to be
+    # passed back as ?cursor=... for the page after it. Without `limit` the
+    # full list is returned, as before.
+    limit, after = None, None
+    if request.args.get("limit"):
+        try:
+            limit = int(request.args["limit"])
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= TICKETS_PAGE_MAX:
+            return jsonify({"ok": False, "error": f"limit must be 1-{TICKETS_PAGE_MAX}"}), 400
+    if request.args.get("cursor"):
+        after = _decode_cursor(request.args["cursor"])
+        if after is None:
+            return jsonify({"ok": False, "error": "Invalid cursor"}), 400
+
+    items, counts, next_after = _page_tickets(kind, status, q, limit=limit, after=after)
+
+    # compute age + overdue (only for non-resolved); the alert emails for
+    # these are sent by the background overdue scan, never from here
+    for it in items:
+        it["age_hours"] = _age_hours(it.get("ts",""))
+        st = (it.get("status") or "open").lower()
+        it["overdue"] = (it["age_hours"] > OVERDUE_HOURS) and (st != "resolved")
 
-    # one-time alerts for overdue
-    try:
-        _maybe_send_overdue_alert(items)
-    except Exception as e:
-        app.logger.exception("overdue alert pass failed: %s", e)
+    if limit is not None:
+        # Paged listing rows skip the heavy per-ticket parts; the drawer
+        # fetches /admin/api/tickets/<ticket> for those when it opens.
+        for it in items:
+            it.pop("meta", None)
+            it.pop("history", None)
 
-    return jsonify({"ok": True, "items": items})
+    return _with_etag(jsonify({
+        "ok": True,
+        "items": items,
+        "total": sum(counts.values()),
+        "counts": counts,
+        "next_cursor": _encode_cursor(next_after) if next_after else None,
+    }), etag)
 
 @app.get("/admin/api/tickets/<ticket>")
 def admin_api_ticket_get(ticket):
     guard = _require_authed_api()
     if guard: return guard
-    all_items = {x.get("ticket"): _merge_ticket(x) for x in _read_submissions()}
-    it = all_items.get(ticket)
+    etag = _tickets_etag()
+    not_modified = _not_modified_or_none(etag)
+    if not_modified: return not_modified
+    it = _get_submission(ticket)
     if not it:
         return jsonify({"ok": False, "error": "Not found"}), 404
-    return jsonify({"ok": True, "item": it})
+    return _with_etag(jsonify({"ok": True, "item": _merge_ticket(it)}), etag)
+
+@app.get("/admin/api/tickets/<ticket>/files/<name>")
+def admin_api_ticket_file(ticket, name):
+    guard = _require_authed_api()
+    if guard: return guard
+    entry = _ticket_manifest(ticket).get(name)
+    if entry:
+        path = _blob_path(entry["sha256"])
+    else:
+        # tickets filed before the blob store, not migrated yet
+        it = _get_submission(ticket)
+        if not it or name not in (it.get("attachments") or []):
+            return jsonify({"ok": False, "error": "Not found"}), 404
+        path = os.path.join(UPLOAD_DIR, _attach_safe(name))
+    if not os.path.isfile(path):
+        return jsonify({"ok": False, "error": "Not found"}), 404
+    # blobs are immutable, so the digest is a perfect validator
+    return send_file(path, download_name=name, conditional=True,
+                     etag=entry["sha256"] if entry else True, max_age=0)
 
 @app.patch("/admin/api/tickets/<ticket>")
 def admin_api_ticket_patch(ticket):
@@ -819,36 +2870,25 @@ def admin_api_ticket_patch(ticket):
     if status and status not in ("open","wip","resolved"):
         return jsonify({"ok": False, "error": "Invalid status"}), 400
 
-    # load state & item
-    state = _load_state()
-    if ticket not in state:
-        state[ticket] = {"status":"open","note":"","history":[]}
-
-    old_status = state[ticket]["status"]
+    # load state & item; only the fields this request sets are written back
+    st = _get_ticket_state(ticket) or _DEFAULT_TICKET_STATE
+    old_status = st.get("status", "open")
+    patch = {}
     if status:
-        state[ticket]["status"] = status
+        patch["status"] = status
     if note_provided:
-        state[ticket]["note"] = note
+        patch["note"] = note
 
     # for email we need client email from submissions
-    items = {x.get("ticket"): x for x in _read_submissions()}
-    item = items.get(ticket, {})
+    item = _get_submission(ticket) or {}
     client_email = item.get("client_email") or (item.get("fields") or {}).get("Email","")
     email_sent = False
     err_msg = None
 
     if email_client and _valid_email(client_email):
         try:
-            inner = f"""
-<h2 style="margin:0 0 8px;font:700 18px Arial;color:{BRAND['ink']}">Ticket Update — {ticket}</h2>
-<table role="presentation" cellpadding="0" cellspacing="0" width="100%" style="border:1px solid {BRAND['line']};border-radius:10px">
-  {_row("Ticket", ticket)}
-  {_row("Status", (status or old_status).upper())}
-  {_row("Remark", note or "(no remarks)")}
-</table>
-<p style="font:13px Arial;color:{BRAND['muted']}">If you have questions, just reply to this email.</p>
-"""
-            send_email(email_subject, email_shell_html("Ticket update", inner), to=[client_email], reply_to=BRAND["email"])
+            html_body, text_body = ticket_update_email(ticket, status or old_status, note)
+            send_email(email_subject, html_body, text_body=text_body, to=[client_email], reply_to=BRAND["email"])
             email_sent = True
         except Exception as e:
             app.logger.exception("remark email failed")
@@ -858,14 +2898,18 @@ def admin_api_ticket_patch(ticket):
     history_entry = {
         "ts": datetime.utcnow().isoformat() + "Z",
         "by": session.get("who") or "admin",
-        "status": state[ticket]["status"],
+        "status": status or old_status,
         "note": note,
         "email_sent": email_sent
     }
-    state[ticket].setdefault("history", []).append(history_entry)
-    _save_state(state)
-
-    resp = {"ok": True, "item": _merge_ticket(item), "email_sent": email_sent}
+    _update_ticket_states({ticket: patch}, {ticket: history_entry})
+    st = _get_ticket_state(ticket) or _DEFAULT_TICKET_STATE
+    if (old_status == "resolved" and status and status != "resolved" and not st.get("overdue_alerted")
+            and _age_hours(item.get("ts", "")) > OVERDUE_HOURS):
+        # the overdue scan dropped it when its deadline passed while resolved
+        _overdue_requeue(ticket)
+
+    resp = {"ok": True, "item": _merge_ticket(item, st), "email_sent": email_sent}
     if err_msg: resp["email_error"] = err_msg
     return jsonify(resp)
 
@@ -899,19 +2943,11 @@ def _with_invoice_seq_lock(mutate_fn):
     """Read-modify-write invoice_seq.json under an exclusive file lock on a
     sidecar .lock file, so the read-then-write below is atomic across
     concurrent requests regardless of how many worker processes are running."""
-    lock_path = INVOICE_SEQ_STATE + ".lock"
-    with open(lock_path, "a+") as lockf:
-        fcntl.flock(lockf, fcntl.LOCK_EX)
-        try:
-            seq = _load_invoice_seq()
-            result = mutate_fn(seq)
-            tmp = INVOICE_SEQ_STATE + ".tmp"
-            with open(tmp, "w", encoding="utf-8") as f:
-                json.dump(seq, f, ensure_ascii=False, indent=2)
-            os.replace(tmp, INVOICE_SEQ_STATE)
-            return result
-        finally:
-            fcntl.flock(lockf, fcntl.LOCK_UN)
+    with _file_lock(INVOICE_SEQ_STATE):
+        seq = _load_invoice_seq()
+        result = mutate_fn(seq)
+        _atomic_write_json(INVOICE_SEQ_STATE, seq, indent=2)
+        return result
 
 @app.get("/admin/api/invoice/next-number")
 def admin_api_invoice_peek():
@@ -924,33 +2960,718 @@ def admin_api_invoice_peek():
     n = _load_invoice_seq().get(key, 0) + 1
     return jsonify({"ok": True, "number": _format_invoice_number(fy_short, mon_abbr, n)})
 
+def _requested_invoice_n(body: dict):
+    """Trailing digits of the caller's invoice_number, if it sent one."""
+    requested = str(body.get("invoice_number") or "").strip()
+    m = re.search(r"(\d+)$", requested)
+    return int(m.group(1)) if m else None
+
+def _claim_invoice_numbers(count: int, requested_n=None):
+    """Advance this month's counter by `count` under one lock acquisition and
+    return (fy_short, mon_abbr, first). The block starts at requested_n when
+    that is still ahead of the counter (a manual edit), otherwise right after
+    it - so a block can never overlap anything already issued."""
+    fy_short, mon_abbr = _invoice_fy_month_key(_now_ist())
+    key = f"{fy_short}_{mon_abbr}"
+
+    def mutate(seq):
+        current = seq.get(key, 0)
+        first = requested_n if requested_n is not None and requested_n > current else current + 1
+        seq[key] = first + count - 1
+        return first
+
+    return fy_short, mon_abbr, _with_invoice_seq_lock(mutate)
+
 @app.post("/admin/api/invoice/commit-number")
 def admin_api_invoice_commit():
     """Authoritative assignment, called once a bill is actually saved (Download
     PDF). If the caller's current number is still ahead of the server's
     counter, it's honored (respects manual edits); otherwise - including the
     case where another device already claimed it - the next free number is
-    issued instead, so two invoices can never end up with the same number."""
+    issued instead, so two invoices can never end up with the same number.
+    An optional `invoice` ({taxable, gst, total, data}) is recorded in the
+    shared history under the number actually assigned."""
     guard = _require_authed_api()
     if guard: return guard
     body = request.get_json(silent=True) or {}
-    requested = str(body.get("invoice_number") or "").strip()
-    m = re.search(r"(\d+)$", requested)
-    requested_n = int(m.group(1)) if m else None
+    fy_short, mon_abbr, n = _claim_invoice_numbers(1, _requested_invoice_n(body))
+    number = _format_invoice_number(fy_short, mon_abbr, n)
+    resp = {"ok": True, "number": number}
+    if isinstance(body.get("invoice"), dict):
+        # the number is already taken either way; a failed history write is
+        # reported alongside it rather than failing the commit
+        try:
+            resp["invoice"] = _store_invoice(number, body["invoice"])
+        except Exception as e:
+            resp["history_error"] = str(e)
+    return jsonify(resp)
 
-    fy_short, mon_abbr = _invoice_fy_month_key(_now_ist())
-    key = f"{fy_short}_{mon_abbr}"
+@app.post("/admin/api/invoice/reserve-block")
+def admin_api_invoice_reserve_block():
+    """Month-end batches (dozens of AMC renewals in a row) reserve a
+    contiguous block of `count` numbers in one call - one lock, one read and
+    one rewrite of invoice_seq.json instead of one of each per bill. Same
+    guarantees as commit-number: an optional invoice_number still ahead of
+    the counter is honored as the block's first number, and no number in
+    the block can have been issued before or be issued again."""
+    guard = _require_authed_api()
+    if guard: return guard
+    body = request.get_json(silent=True) or {}
+    try:
+        count = int(body.get("count"))
+    except (TypeError, ValueError):
+        count = 0
+    if not 1 <= count <= INVOICE_BLOCK_MAX:
+        return jsonify({"ok": False, "error": f"count must be between 1 and {INVOICE_BLOCK_MAX}"}), 400
+    fy_short, mon_abbr, first = _claim_invoice_numbers(count, _requested_invoice_n(body))
+    numbers = [_format_invoice_number(fy_short, mon_abbr, n) for n in range(first, first + count)]
+    return jsonify({"ok": True, "numbers": numbers, "first": numbers[0], "last": numbers[-1]})
+
+# ---------------- Invoice history (server-side, shared) ----------------
+# The generator's history used to live only in each browser's localStorage:
+# invisible from every other device, and re-parsed in full on each render
+# once it held a few hundred bills. Committed invoices are now recorded here
+# by commit-number itself - one compact row per invoice (number, client,
+# date, month, taxable/GST/total in paise so sums stay exact), with the full
+# draft kept in `data` and only sent back when that one invoice is opened.
+# invoice_months / invoice_clients are running totals updated in the same
+# transaction as the row, so the month strip and the filtered totals above
+# a page of results are single-row reads, never a scan of every invoice.
+_INV_LOCAL = threading.local()
+INVOICES_PAGE_MAX = 100
+INVOICE_DATA_MAX = 256 * 1024  # one invoice's draft JSON (fields + line items)
+
+_INVOICE_DB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS invoices (
+    number     TEXT PRIMARY KEY,
+    client     TEXT NOT NULL DEFAULT '',
+    client_key TEXT NOT NULL DEFAULT '',
+    gstin      TEXT NOT NULL DEFAULT '',
+    date       TEXT NOT NULL DEFAULT '',
+    month      TEXT NOT NULL DEFAULT '',
+    cur        TEXT NOT NULL DEFAULT '',
+    tax_type   TEXT NOT NULL DEFAULT '',
+    taxable    INTEGER NOT NULL DEFAULT 0,
+    gst        INTEGER NOT NULL DEFAULT 0,
+    total      INTEGER NOT NULL DEFAULT 0,
+    updated    REAL NOT NULL DEFAULT 0,
+    data       TEXT NOT NULL DEFAULT '{}'
+);
+CREATE INDEX IF NOT EXISTS invoices_month ON invoices(month, number);
+CREATE INDEX IF NOT EXISTS invoices_client ON invoices(client_key, month, number);
+
+CREATE TABLE IF NOT EXISTS invoice_months (
+    month   TEXT PRIMARY KEY,
+    count   INTEGER NOT NULL,
+    taxable INTEGER NOT NULL,
+    gst     INTEGER NOT NULL,
+    total   INTEGER NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS invoice_clients (
+    client_key TEXT PRIMARY KEY,
+    client     TEXT NOT NULL,
+    count      INTEGER NOT NULL,
+    taxable    INTEGER NOT NULL,
+    gst        INTEGER NOT NULL,
+    total      INTEGER NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS invoice_meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+INSERT OR IGNORE INTO invoice_meta (key, value) VALUES ('version', '0');
+"""
 
-    def mutate(seq):
-        current = seq.get(key, 0)
-        if requested_n is not None and requested_n > current:
-            seq[key] = requested_n
+_INVOICE_COLS = "number, client, gstin, date, month, cur, tax_type, taxable, gst, total, updated"
+
+def _invoice_db() -> sqlite3.Connection:
+    conn = getattr(_INV_LOCAL, "conn", None)
+    if conn is not None and _INV_LOCAL.pid == os.getpid():
+        return conn
+    conn = sqlite3.connect(INVOICE_DB, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(_INVOICE_DB_SCHEMA)
+    _INV_LOCAL.conn, _INV_LOCAL.pid = conn, os.getpid()
+    return conn
+
+def _paise(v) -> int:
+    try:
+        return int(round(float(v) * 100))
+    except (TypeError, ValueError):
+        return 0
+
+def _client_key(name: str) -> str:
+    return " ".join(str(name or "").split()).lower()
+
+def _invoice_month(date_str: str) -> str:
+    """'2026-10' from the generator's '17 Oct 2026' dates; this month if the
+    date can't be read."""
+    for fmt in ("%d %b %Y", "%Y-%m-%d", "%d/%m/%Y"):
+        try:
+            return datetime.strptime(str(date_str or "").strip(), fmt).strftime("%Y-%m")
+        except ValueError:
+            pass
+    return _now_ist().strftime("%Y-%m")
+
+def _invoice_row_dict(row) -> dict:
+    keys = _INVOICE_COLS.split(", ")
+    d = dict(zip(keys, row))
+    for k in ("taxable", "gst", "total"):
+        d[k] = d[k] / 100
+    return d
+
+def _bump_invoice_totals(conn: sqlite3.Connection, row: dict, sign: int):
+    """Add (sign=1) or take back (sign=-1) one invoice's amounts in both
+    running-total tables; rows whose count drops to zero are removed."""
+    amounts = (sign, sign * row["taxable"], sign * row["gst"], sign * row["total"])
+    conn.execute("INSERT INTO invoice_months (month, count, taxable, gst, total) VALUES (?, ?, ?, ?, ?) "
+                 "ON CONFLICT(month) DO UPDATE SET count = count + excluded.count, "
+                 "taxable = taxable + excluded.taxable, gst = gst + excluded.gst, total = total + excluded.total",
+                 (row["month"], *amounts))
+    conn.execute("INSERT INTO invoice_clients (client_key, client, count, taxable, gst, total) VALUES (?, ?, ?, ?, ?, ?) "
+                 "ON CONFLICT(client_key) DO UPDATE SET count = count + excluded.count, "
+                 "taxable = taxable + excluded.taxable, gst = gst + excluded.gst, total = total + excluded.total"
+                 + (", client = excluded.client" if sign > 0 else ""),
+                 (row["client_key"], row["client"], *amounts))
+    conn.execute("DELETE FROM invoice_months WHERE month = ? AND count <= 0", (row["month"],))
+    conn.execute("DELETE FROM invoice_clients WHERE client_key = ? AND count <= 0", (row["client_key"],))
+
+def _invoice_write(fn):
+    """Run fn(conn) in one BEGIN IMMEDIATE transaction that also bumps the
+    store version (the listing ETags)."""
+    conn = _invoice_db()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        result = fn(conn)
+        conn.execute("UPDATE invoice_meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'version'")
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return result
+
+def _store_invoice(number: str, rec: dict, *, replace: bool = True) -> dict | None:
+    """Insert or update one invoice from the generator's {taxable, gst,
+    total, data}; client, GSTIN, date etc. come from data["fields"]. With
+    replace=False an existing number is left alone (returns None)."""
+    data = rec.get("data") if isinstance(rec.get("data"), dict) else {}
+    fields = data.get("fields") if isinstance(data.get("fields"), dict) else {}
+    fields["inv_no"] = number
+    data["fields"] = fields
+    data_json = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    if len(data_json) > INVOICE_DATA_MAX:
+        raise ValueError("Invoice data too large")
+    row = {
+        "number": number,
+        "client": str(fields.get("b_name") or "").strip()[:200],
+        "gstin": str(fields.get("b_gstin") or "").strip()[:20],
+        "date": str(fields.get("inv_date") or "").strip()[:40],
+        "cur": str(fields.get("cur") or "").strip()[:8],
+        "tax_type": str(fields.get("tax_type") or "").strip()[:16],
+        "taxable": _paise(rec.get("taxable")), "gst": _paise(rec.get("gst")), "total": _paise(rec.get("total")),
+        "updated": time.time(),
+    }
+    row["client_key"] = _client_key(row["client"])
+    row["month"] = _invoice_month(row["date"])
+
+    def write(conn):
+        old = conn.execute("SELECT month, client_key, client, taxable, gst, total FROM invoices WHERE number = ?",
+                           (number,)).fetchone()
+        if old:
+            if not replace:
+                return None
+            _bump_invoice_totals(conn, dict(zip(("month", "client_key", "client", "taxable", "gst", "total"), old)), -1)
+        conn.execute("INSERT OR REPLACE INTO invoices (number, client, client_key, gstin, date, month, cur, tax_type, "
+                     "taxable, gst, total, updated, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                     (number, row["client"], row["client_key"], row["gstin"], row["date"], row["month"], row["cur"],
+                      row["tax_type"], row["taxable"], row["gst"], row["total"], row["updated"], data_json))
+        _bump_invoice_totals(conn, row, 1)
+        return _invoice_row_dict(tuple(row[k] for k in _INVOICE_COLS.split(", ")))
+
+    return _invoice_write(write)
+
+def _delete_invoice(number: str) -> bool:
+    def write(conn):
+        old = conn.execute("SELECT month, client_key, client, taxable, gst, total FROM invoices WHERE number = ?",
+                           (number,)).fetchone()
+        if not old:
+            return False
+        conn.execute("DELETE FROM invoices WHERE number = ?", (number,))
+        _bump_invoice_totals(conn, dict(zip(("month", "client_key", "client", "taxable", "gst", "total"), old)), -1)
+        return True
+    return _invoice_write(write)
+
+def _invoice_totals(conn: sqlite3.Connection, where: list, args: list, month: str, ckey: str, q: str) -> dict:
+    """count/taxable/gst/total of the filtered set - straight from the
+    running totals unless a text search or both filters are involved."""
+    if not q and not (month and ckey):
+        if month:
+            row = conn.execute("SELECT count, taxable, gst, total FROM invoice_months WHERE month = ?", (month,)).fetchone()
+        elif ckey:
+            row = conn.execute("SELECT count, taxable, gst, total FROM invoice_clients WHERE client_key = ?", (ckey,)).fetchone()
         else:
-            seq[key] = current + 1
-        return seq[key]
+            row = conn.execute("SELECT SUM(count), SUM(taxable), SUM(gst), SUM(total) FROM invoice_months").fetchone()
+    else:
+        row = conn.execute("SELECT COUNT(*), SUM(taxable), SUM(gst), SUM(total) FROM invoices"
+                           + (" WHERE " + " AND ".join(where) if where else ""), args).fetchone()
+    count, taxable, gst, total = (v or 0 for v in (row or (0, 0, 0, 0)))
+    return {"count": count, "taxable": taxable / 100, "gst": gst / 100, "total": total / 100}
+
+def _invoices_etag() -> str:
+    version = _invoice_db().execute("SELECT value FROM invoice_meta WHERE key = 'version'").fetchone()[0]
+    key = "|".join([version, request.path, json.dumps(sorted(request.args.items(multi=True)))])
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+@app.get("/admin/api/invoices")
+def admin_api_invoices():
+    """One page of committed invoices, newest month first, optionally
+    filtered by ?month=YYYY-MM, ?client= (exact, case/space-insensitive) and
+    ?q= (substring of number or client). Pages are ?limit=N and the returned
+    `next_cursor`, passed back as ?cursor=...; `totals` covers the whole
+    filtered set."""
+    guard = _require_authed_api()
+    if guard: return guard
+    etag = _invoices_etag()
+    not_modified = _not_modified_or_none(etag)
+    if not_modified: return not_modified
 
-    n = _with_invoice_seq_lock(mutate)
-    return jsonify({"ok": True, "number": _format_invoice_number(fy_short, mon_abbr, n)})
+    q = (request.args.get("q") or "").strip()
+    month = (request.args.get("month") or "").strip()
+    ckey = _client_key(request.args.get("client"))
+    try:
+        limit = int(request.args.get("limit") or 20)
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= INVOICES_PAGE_MAX:
+        return jsonify({"ok": False, "error": f"limit must be 1-{INVOICES_PAGE_MAX}"}), 400
+    after = None
+    if request.args.get("cursor"):
+        after = _decode_cursor(request.args["cursor"])
+        if after is None:
+            return jsonify({"ok": False, "error": "Invalid cursor"}), 400
+
+    where, args = [], []
+    if month:
+        where.append("month = ?"); args.append(month)
+    if ckey:
+        where.append("client_key = ?"); args.append(ckey)
+    if q:
+        like = "%" + q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        where.append("(number LIKE ? ESCAPE '\\' OR client LIKE ? ESCAPE '\\')"); args += [like, like]
+    conn = _invoice_db()
+    page_where, page_args = list(where), list(args)
+    if after:
+        page_where.append("(month, number) < (?, ?)"); page_args += list(after)
+    sql = f"SELECT {_INVOICE_COLS} FROM invoices"
+    if page_where:
+        sql += " WHERE " + " AND ".join(page_where)
+    sql += " ORDER BY month DESC, number DESC LIMIT ?"
+    rows = conn.execute(sql, page_args + [limit + 1]).fetchall()
+    items = [_invoice_row_dict(r) for r in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = _encode_cursor((items[-1]["month"], items[-1]["number"]))
+    return _with_etag(jsonify({
+        "ok": True,
+        "items": items,
+        "totals": _invoice_totals(conn, where, args, month, ckey, q),
+        "next_cursor": next_cursor,
+    }), etag)
+
+@app.get("/admin/api/invoices/months")
+def admin_api_invoice_months():
+    """Per-month count and totals (newest first), from the running totals."""
+    guard = _require_authed_api()
+    if guard: return guard
+    etag = _invoices_etag()
+    not_modified = _not_modified_or_none(etag)
+    if not_modified: return not_modified
+    rows = _invoice_db().execute(
+        "SELECT month, count, taxable, gst, total FROM invoice_months ORDER BY month DESC LIMIT 36").fetchall()
+    months = [{"month": m, "count": c, "taxable": t / 100, "gst": g / 100, "total": tot / 100}
+              for m, c, t, g, tot in rows]
+    return _with_etag(jsonify({"ok": True, "months": months}), etag)
+
+@app.post("/admin/api/invoices/import")
+def admin_api_invoice_import():
+    """One-time upload of a browser's old localStorage history: each record
+    {number, taxable, gst, total, data} is added unless that number is
+    already on the server (the server's copy wins)."""
+    guard = _require_authed_api()
+    if guard: return guard
+    body = request.get_json(silent=True) or {}
+    records = body.get("records")
+    if not isinstance(records, list) or len(records) > 2000:
+        return jsonify({"ok": False, "error": "records must be a list of at most 2000 invoices"}), 400
+    added = skipped = 0
+    for rec in records:
+        number = str((rec or {}).get("number") or "").strip()[:64] if isinstance(rec, dict) else ""
+        if not number:
+            skipped += 1
+            continue
+        try:
+            stored = _store_invoice(number, rec, replace=False)
+        except ValueError:
+            stored = None
+        if stored: added += 1
+        else: skipped += 1
+    return jsonify({"ok": True, "added": added, "skipped": skipped})
+
+@app.get("/admin/api/invoices/<path:number>")
+def admin_api_invoice_get(number):
+    guard = _require_authed_api()
+    if guard: return guard
+    row = _invoice_db().execute(f"SELECT {_INVOICE_COLS}, data FROM invoices WHERE number = ?", (number,)).fetchone()
+    if not row:
+        return jsonify({"ok": False, "error": "Not found"}), 404
+    item = _invoice_row_dict(row[:-1])
+    item["data"] = json.loads(row[-1])
+    return jsonify({"ok": True, "item": item})
+
+@app.delete("/admin/api/invoices/<path:number>")
+def admin_api_invoice_delete(number):
+    guard = _require_authed_api()
+    if guard: return guard
+    if not _delete_invoice(number):
+        return jsonify({"ok": False, "error": "Not found"}), 404
+    return jsonify({"ok": True})
+
+# ---------------- Static file serving (hot cache + ranges) ----------------
+# send_file() re-does stat + open + read for every hit, and a page view hits
+# the same handful of small CSS/JS files (and their .gz/.br twins) every
+# time. Files up to STATIC_CACHE_FILE_MAX are kept in an LRU bounded at
+# STATIC_CACHE_MAX_BYTES with their validators precomputed, so a hit is one
+# stat (to notice edits by mtime/size) and no open. Bigger files - photos,
+# derivatives - still go through send_file(), which hands the open file to
+# the server's wsgi.file_wrapper (gunicorn sendfile()s it, zero-copy).
+# Either way responses are conditional (ETag/Last-Modified -> 304) and
+# honour Range/If-Range with 206s.
+STATIC_CACHE_MAX_BYTES = int(env("STATIC_CACHE_MAX_BYTES", str(8 << 20)))
+STATIC_CACHE_FILE_MAX  = int(env("STATIC_CACHE_FILE_MAX", str(256 << 10)))
+_HOT_LOCK = threading.Lock()
+_HOT_FILES: OrderedDict[str, dict] = OrderedDict()   # path -> {"key", "data", "etag", "last_modified"}
+# request headers that make a response conditional or partial
+_CONDITIONAL_ENVIRON = ("HTTP_IF_NONE_MATCH", "HTTP_IF_MODIFIED_SINCE", "HTTP_RANGE", "HTTP_IF_RANGE")
+_HOT_STATS = {"hits": 0, "misses": 0, "bytes": 0}
+
+def _hot_file(path: str, st: os.stat_result) -> dict:
+    key = (st.st_mtime_ns, st.st_size)
+    with _HOT_LOCK:
+        hit = _HOT_FILES.get(path)
+        if hit and hit["key"] == key:
+            _HOT_FILES.move_to_end(path)
+            _HOT_STATS["hits"] += 1
+            return hit
+    with open(path, "rb") as f:
+        data = f.read()
+    hit = {"key": key, "data": data, "last_modified": http_date(st.st_mtime),
+           "etag": f"{st.st_mtime_ns:x}-{len(data):x}"}
+    with _HOT_LOCK:
+        _HOT_STATS["misses"] += 1
+        old = _HOT_FILES.pop(path, None)
+        if old:
+            _HOT_STATS["bytes"] -= len(old["data"])
+        _HOT_FILES[path] = hit
+        _HOT_STATS["bytes"] += len(data)
+        while _HOT_STATS["bytes"] > STATIC_CACHE_MAX_BYTES and _HOT_FILES:
+            _HOT_STATS["bytes"] -= len(_HOT_FILES.popitem(last=False)[1]["data"])
+    return hit
+
+def _serve_file(path: str, mimetype: str, *, etag: str | None = None,
+                cache_control: str = "no-cache"):
+    """Conditional, Range-aware response for the file at `path` (raises
+    NotFound if it isn't one). `etag` overrides the mtime/size default."""
+    try:
+        st = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        raise NotFound()
+    if not stat.S_ISREG(st.st_mode):
+        raise NotFound()
+    if st.st_size > STATIC_CACHE_FILE_MAX or STATIC_CACHE_MAX_BYTES <= 0:
+        resp = send_file(path, mimetype=mimetype, conditional=True, etag=etag or True)
+        resp.headers["Accept-Ranges"] = "bytes"
+        resp.headers["Cache-Control"] = cache_control
+        return resp
+    hit = _hot_file(path, st)
+    # headers go in as one list - Headers.set() per header was a good part
+    # of the per-hit cost - and make_conditional()'s parsing is skipped
+    # entirely for the plain GETs that make up most hits
+    resp = app.response_class(hit["data"], mimetype=mimetype, headers=[
+        ("ETag", f'"{etag or hit["etag"]}"'), ("Last-Modified", hit["last_modified"]),
+        ("Accept-Ranges", "bytes"), ("Cache-Control", cache_control),
+    ])
+    if any(k in request.environ for k in _CONDITIONAL_ENVIRON):
+        resp.make_conditional(request, accept_ranges=True, complete_length=len(hit["data"]))
+    return resp
+
+# ---------------- Static asset pipeline ----------------
+# The invoice page alone pulls ~650 KB of JS (jspdf, html2canvas, the
+# generator) and index.html a dozen photos, all of which used to go out raw
+# with no caching headers - every visit re-downloaded everything. In a build
+# step (`flask --app app build-assets`), or else on first start, every file in
+# STATIC_DIR gets a content-hashed twin in ASSET_BUILD_DIR - assets/app.css
+# -> assets/app.3f2a9c01de.css - and text files also get .gz (and .br, when
+# the brotli package is installed) variants. The HTML pages are rewritten to
+# point at the hashed URLs, which are then served `immutable` for a year:
+# a changed file gets a new name, so a repeat visit only revalidates the
+# page itself. The result is recorded in ASSET_BUILD_DIR/manifest.json
+# along with a stat()-only fingerprint of STATIC_DIR; a worker starting
+# against an unchanged tree just loads the manifest, without reading or
+# hashing a single asset. When it is missing or stale, the first worker to
+# take its lock rebuilds it and the others wait and then load that.
+# Brotli's best setting (11) takes ~2s over the invoice JS, too slow for a
+# cold start, so startup uses 9 and the CLI - meant for the deploy's build
+# step, before the app first starts - uses 11.
+_ASSET_COMPRESSIBLE = {".html", ".css", ".js", ".json", ".svg", ".txt", ".xml", ".ico", ".map"}
+_ASSET_REF = re.compile(r'(\b(?:src|href)=")([^"#?:]+)(")')
+_ASSETS_LOCK = threading.Lock()
+_ASSETS: dict = {"urls": {}, "files": {}, "pages": {}}
+ASSET_MANIFEST = os.path.join(ASSET_BUILD_DIR, "manifest.json")
+# urls:  "assets/app.css" -> "assets/app.3f2a9c01de.css"
+# files: "assets/app.3f2a9c01de.css" -> {"path", "encodings": {enc: path}, "etag"}
+#        (+ "width" in px for photos, see "Responsive images")
+# pages: "index.html" -> same shape as files, for the rewritten page
+
+def _asset_write(path: str, data: bytes):
+    if os.path.exists(path):
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+def _asset_variants(rel: str, data: bytes, br_quality: int) -> dict:
+    """Write `rel` (+ .gz/.br when it's text) under ASSET_BUILD_DIR and
+    return its `files` entry. Variants that don't save anything are skipped."""
+    path = os.path.join(ASSET_BUILD_DIR, rel)
+    _asset_write(path, data)
+    entry = {"path": path, "encodings": {}, "etag": hashlib.sha256(data).hexdigest()[:20]}
+    if os.path.splitext(rel)[1].lower() not in _ASSET_COMPRESSIBLE:
+        return entry
+    for enc, ext, pack in (("br", ".br", brotli and (lambda b: brotli.compress(b, quality=br_quality))),
+                           ("gzip", ".gz", lambda b: gzip.compress(b, 9, mtime=0))):
+        if not pack:
+            continue
+        if not os.path.exists(path + ext):
+            packed = pack(data)
+            if len(packed) >= len(data):
+                continue
+            _asset_write(path + ext, packed)
+        entry["encodings"][enc] = path + ext
+    return entry
+
+def _hashed_name(rel: str, data: bytes) -> str:
+    stem, ext = os.path.splitext(rel)
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:10]}{ext}"
+
+def _asset_sources_sig() -> str:
+    """Fingerprint of everything a build depends on (stat() only): each
+    source file's path, size and mtime, plus the settings baked into it."""
+    h = hashlib.sha256(repr((ASSET_BUILD_DIR, IMAGE_WIDTHS, bool(brotli))).encode())
+    for root, dirs, names in os.walk(STATIC_DIR):
+        dirs.sort()
+        for name in sorted(names):
+            path = os.path.join(root, name)
+            st = os.stat(path)
+            h.update(f"{path}\0{st.st_size}\0{st.st_mtime_ns}\n".encode())
+    return h.hexdigest()
+
+def _read_asset_manifest(sig: str) -> dict | None:
+    """The build recorded in ASSET_MANIFEST, if it was made from `sig`."""
+    built = _read_json_dict(ASSET_MANIFEST)
+    if built.get("sources") != sig or not all(os.path.exists(e["path"]) for e in built["pages"].values()):
+        return None
+    return {k: built[k] for k in ("urls", "files", "pages")}
+
+def _build_static_assets(br_quality: int = 9) -> dict:
+    """Build every asset and record the result in ASSET_MANIFEST. Caller
+    holds the manifest's lock."""
+    sig = _asset_sources_sig()
+    urls, files, pages = {}, {}, {}
+    html_pages = []
+    for root, dirs, names in os.walk(STATIC_DIR):
+        dirs.sort()
+        for name in sorted(names):
+            src = os.path.join(root, name)
+            rel = os.path.relpath(src, STATIC_DIR).replace(os.sep, "/")
+            if name.lower().endswith(".html"):
+                html_pages.append(rel)
+                continue
+            with open(src, "rb") as f:
+                data = f.read()
+            hashed = _hashed_name(rel, data)
+            urls[rel] = hashed
+            files[hashed] = _asset_variants(hashed, data, br_quality)
+            if os.path.splitext(rel)[1].lower() in _IMAGE_EXTS:
+                files[hashed]["width"] = _image_width(src)
+
+    def to_hashed(page_dir):
+        def sub(m):
+            ref = m.group(2)
+            # page-relative ("assets/x.js") and root-relative ("/assets/x.js")
+            key = os.path.normpath(ref.lstrip("/") if ref.startswith("/") else os.path.join(page_dir, ref))
+            key = key.replace(os.sep, "/")
+            return m.group(1) + "/" + urls[key] + m.group(3) if key in urls else m.group(0)
+        return sub
+
+    for rel in html_pages:
+        with open(os.path.join(STATIC_DIR, rel), "r", encoding="utf-8") as f:
+            text = f.read()
+        text = _ASSET_REF.sub(to_hashed(os.path.dirname(rel)), text)
+        text = _IMG_TAG.sub(lambda m: _with_srcset(m.group(0), files), text)
+        data = text.encode("utf-8")
+        pages[rel] = _asset_variants(os.path.join("pages", _hashed_name(rel, data)), data, br_quality)
+
+    built = {"urls": urls, "files": files, "pages": pages}
+    _atomic_write_json(ASSET_MANIFEST, {"sources": sig, **built}, indent=1, sort_keys=True)
+    return built
+
+def _load_static_assets():
+    global _ASSETS
+    sig = _asset_sources_sig()
+    built = _read_asset_manifest(sig)
+    if built is None:
+        os.makedirs(ASSET_BUILD_DIR, exist_ok=True)
+        with _file_lock(ASSET_MANIFEST):
+            built = _read_asset_manifest(sig) or _build_static_assets()
+    with _ASSETS_LOCK:
+        _ASSETS = built
+
+def _asset_response(entry: dict, mimetype: str, cache_control: str):
+    """send_file() the best encoding of `entry` the client accepts."""
+    path, enc = entry["path"], None
+    for cand in ("br", "gzip"):
+        if cand in entry["encodings"] and request.accept_encodings[cand]:
+            path, enc = entry["encodings"][cand], cand
+            break
+    resp = _serve_file(path, mimetype, etag=entry["etag"] + (f"-{enc}" if enc else ""),
+                       cache_control=cache_control)
+    if enc:
+        resp.headers["Content-Encoding"] = enc
+    if entry["encodings"]:
+        resp.vary.add("Accept-Encoding")
+    return resp
+
+def _send_static(path: str):
+    """Serve a file from STATIC_DIR, via the asset pipeline when possible:
+    hashed asset URLs are immutable; pages are served rewritten and
+    revalidated on every visit; anything else falls back to the raw file."""
+    assets = _ASSETS
+    mimetype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    if path in assets["files"]:
+        return _asset_response(assets["files"][path], mimetype,
+                               "public, max-age=31536000, immutable")
+    if path in assets["pages"]:
+        return _asset_response(assets["pages"][path], "text/html; charset=utf-8", "no-cache")
+    full = safe_join(STATIC_DIR, path)
+    if full is None:
+        raise NotFound()
+    return _serve_file(full, mimetype)
+
+# ---------------- Responsive images ----------------
+# The slider and gallery photos are 1-3 MB originals up to 4208px wide,
+# shown at most 1280 CSS px wide, so phones downloaded megabytes they then
+# scaled away. Each <img> in the pages gets a srcset of width-bucketed
+# derivatives served from /img/<width>/<hashed name>. A derivative is
+# encoded once - on first request, or up front by `flask --app app
+# build-assets` - and cached in ASSET_BUILD_DIR/img keyed by the source's
+# content hash and the width; WebP goes to browsers that list it in Accept,
+# JPEG to the rest.
+IMAGE_WIDTHS = sorted(int(w) for w in (env("IMAGE_WIDTHS", "480,800,1280,1920") or "").split(",") if w.strip())
+_IMAGE_EXTS = {".jpg", ".jpeg", ".png"}
+_IMG_TAG = re.compile(r"<img\b[^>]*>")
+_IMAGE_LOCKS_LOCK = threading.Lock()
+_IMAGE_LOCKS: dict[str, threading.Lock] = {}   # derivative path -> lock
+
+def _image_width(path: str) -> int:
+    """Displayed width in px (EXIF-rotated), read from the header only."""
+    with Image.open(path) as im:
+        rotated = im.getexif().get(0x0112, 1) in (5, 6, 7, 8)
+        return im.height if rotated else im.width
+
+def _with_srcset(tag: str, files: dict) -> str:
+    """Add srcset/sizes to one <img> tag whose src is a hashed photo."""
+    m = re.search(r'\bsrc="/([^"]+)"', tag)
+    entry = files.get(m.group(1)) if m else None
+    if "srcset=" in tag or not entry or "width" not in entry:
+        return tag
+    name, src_w = m.group(1), entry["width"]
+    cands = [f"/img/{w}/{name} {w}w" for w in IMAGE_WIDTHS if w < src_w]
+    if not cands:
+        return tag
+    if src_w <= IMAGE_WIDTHS[-1]:
+        cands.append(f"/{name} {src_w}w")
+    shown = re.search(r'\bwidth="(\d+)"', tag)
+    sizes = f"(max-width: {shown.group(1)}px) 100vw, {shown.group(1)}px" if shown else "100vw"
+    end = "/>" if tag.endswith("/>") else ">"
+    return f'{tag[:-len(end)].rstrip()} srcset="{", ".join(cands)}" sizes="{sizes}"{end}'
+
+def _image_derivative(entry: dict, width: int, fmt: str) -> str:
+    """Path of the photo in `entry` scaled to `width` px as "webp"/"jpeg",
+    encoding it first if this is the first time it's asked for."""
+    out = os.path.join(ASSET_BUILD_DIR, "img", f"{entry['etag']}-{width}.{fmt}")
+    if os.path.exists(out):
+        return out
+    with _IMAGE_LOCKS_LOCK:
+        lock = _IMAGE_LOCKS.setdefault(out, threading.Lock())
+    with lock:
+        if os.path.exists(out):
+            return out
+        with Image.open(entry["path"]) as src:
+            # JPEGs can be decoded straight at 1/2, 1/4 or 1/8 scale - far
+            # cheaper than decoding all 13 megapixels just to throw most away
+            if src.getexif().get(0x0112, 1) in (5, 6, 7, 8):   # stored sideways
+                src.draft("RGB", (round(width * src.width / src.height), width))
+            else:
+                src.draft("RGB", (width, round(width * src.height / src.width)))
+            im = ImageOps.exif_transpose(src)
+            if fmt == "jpeg" or im.mode not in ("RGB", "RGBA"):
+                im = im.convert("RGBA" if fmt == "webp" and "A" in im.getbands() else "RGB")
+            im = im.resize((width, max(1, round(im.height * width / im.width))), Image.LANCZOS)
+            os.makedirs(os.path.dirname(out), exist_ok=True)
+            tmp = f"{out}.{os.getpid()}.{threading.get_ident()}.tmp"
+            if fmt == "webp":
+                im.save(tmp, "WEBP", quality=80, method=4)
+            else:
+                im.save(tmp, "JPEG", quality=82, optimize=True, progressive=True)
+            os.replace(tmp, out)
+    return out
+
+@app.get("/img/<int:width>/<path:name>")
+def image_derivative(width, name):
+    entry = _ASSETS["files"].get(name)
+    if width not in IMAGE_WIDTHS or not entry or width >= entry.get("width", 0):
+        return "Not found", 404
+    fmt = "webp" if "image/webp" in request.headers.get("Accept", "") else "jpeg"
+    resp = _serve_file(_image_derivative(entry, width, fmt), f"image/{fmt}",
+                       etag=f"{entry['etag']}-{width}-{fmt}",
+                       cache_control="public, max-age=31536000, immutable")
+    resp.vary.add("Accept")
+    return resp
+
+@app.cli.command("build-assets")
+def build_assets_command():
+    """Write hashed and precompressed static assets to ASSET_BUILD_DIR."""
+    os.makedirs(ASSET_BUILD_DIR, exist_ok=True)
+    with _file_lock(ASSET_MANIFEST):
+        built = _build_static_assets(br_quality=11)
+    variants = sum(len(e["encodings"]) for e in [*built["files"].values(), *built["pages"].values()])
+    images = 0
+    for entry in built["files"].values():
+        for w in IMAGE_WIDTHS:
+            if w < entry.get("width", 0):
+                for fmt in ("webp", "jpeg"):
+                    _image_derivative(entry, w, fmt)
+                    images += 1
+    print(f"Built {len(built['files'])} assets, {len(built['pages'])} pages and {images} image derivatives "
+          f"({variants} compressed variants{'' if brotli else ', no brotli'}) in {ASSET_BUILD_DIR}")
+
+if ASSET_PIPELINE:
+    _load_static_assets()
 
 # ---------------- Static / Index ----------------
 # Only ever serve files out of STATIC_DIR. Never serve arbitrary paths from
@@ -960,13 +3681,13 @@ def admin_api_invoice_commit():
 def root():
     idx_static = os.path.join(STATIC_DIR, "index.html")
     if os.path.exists(idx_static):
-        return send_from_directory(STATIC_DIR, "index.html")
+        return _send_static("index.html")
     return "OK", 200
 
 @app.get("/<path:path>")
 def serve_any(path):
     try:
-        return send_from_directory(STATIC_DIR, path)
+        return _send_static(path)
     except NotFound:
         return "Not found", 404
 
@@ -975,26 +3696,21 @@ def serve_any(path):
 # traffic. An internal timer alone can't prevent that — only a real request
 # hitting the public URL counts. This pings our own public health endpoint
 # every KEEP_ALIVE_INTERVAL seconds so the service never goes idle long enough
-# to sleep. Started at module level (not inside `if __name__ == "__main__"`)
-# so it also runs under gunicorn in production, not just `python app.py`.
+# to sleep. Registered at module level (not inside `if __name__ ==
+# "__main__"`) so it also runs under gunicorn in production, not just
+# `python app.py` - by the scheduler's leader process only.
 KEEP_ALIVE_INTERVAL = int(env("KEEP_ALIVE_INTERVAL", "300"))
 SELF_URL = env("SELF_URL") or env("RENDER_EXTERNAL_URL")
 
-def _keep_alive_loop():
-    if not SELF_URL:
-        return
-    ping_url = SELF_URL.rstrip("/") + "/api/health"
-    while True:
-        time.sleep(KEEP_ALIVE_INTERVAL)
-        try:
-            urlopen(ping_url, timeout=15).read()
-        except URLError as e:
-            app.logger.warning("keep-alive ping failed: %s", e)
-        except Exception as e:
-            app.logger.warning("keep-alive ping error: %s", e)
+def _keep_alive_ping():
+    try:
+        urlopen(SELF_URL.rstrip("/") + "/api/health", timeout=15).read()
+    except URLError as e:
+        app.logger.warning("keep-alive ping failed: %s", e)
 
 if (env("KEEP_ALIVE", "1") or "1") == "1" and SELF_URL:
-    threading.Thread(target=_keep_alive_loop, daemon=True).start()
+    # jitter stays well inside Render's ~15 min idle window
+    _register_job("keep-alive", _keep_alive_ping, every=KEEP_ALIVE_INTERVAL, jitter=30)
 
 # ---------------- Daily health-check email (6:00 AM IST) ----------------
 # India Standard Time has no DST, so a fixed UTC+5:30 offset is used instead of
@@ -1004,13 +3720,6 @@ IST_OFFSET = timedelta(hours=5, minutes=30)
 def _now_ist() -> datetime:
     return datetime.now(timezone.utc) + IST_OFFSET
 
-def _seconds_until_next_ist_6am() -> float:
-    now_ist = _now_ist()
-    target = now_ist.replace(hour=6, minute=0, second=0, microsecond=0)
-    if target <= now_ist:
-        target += timedelta(days=1)
-    return (target - now_ist).total_seconds()
-
 def _health_check_already_sent_today(date_str: str) -> bool:
     if not os.path.exists(HEALTH_CHECK_STATE):
         return False
@@ -1020,14 +3729,71 @@ def _health_check_already_sent_today(date_str: str) -> bool:
     except Exception:
         return False
 
-def _mark_health_check_sent(date_str: str):
-    tmp = HEALTH_CHECK_STATE + ".tmp"
-    with open(tmp, "w", encoding="utf-8") as f:
-        json.dump({"last_sent_date": date_str}, f)
-    os.replace(tmp, HEALTH_CHECK_STATE)
-
-SCREENSHOT_API_URL = "https://api.microlink.io/"
-SCREENSHOT_TIMEOUT = int(env("SCREENSHOT_TIMEOUT", "25"))
+# The screenshot API is a setting so the capture can be pointed at a local
+# stand-in (see `screenshot` in qa/perf_bench.py). SCREENSHOT_TIMEOUT is the
+# budget for the whole capture - API call and image download together - and
+# a capture younger than SCREENSHOT_CACHE_TTL is reused as-is, so repeated
+# manual /admin/api/health-check/test runs don't each wait on the API.
+SCREENSHOT_API_URL   = env("SCREENSHOT_API_URL", "https://api.microlink.io/")
+SCREENSHOT_TIMEOUT   = int(env("SCREENSHOT_TIMEOUT", "25"))
+SCREENSHOT_CACHE_TTL = int(env("SCREENSHOT_CACHE_TTL", "600"))
+SCREENSHOT_WIDTH     = 1280
+SCREENSHOT_MAX_BYTES = 20 * 1024 * 1024
+
+# last stamped JPEG and when it was captured; the lock also makes
+# concurrent callers share one capture
+_SCREENSHOT_CACHE = {"at": 0.0, "jpeg": None}
+_SCREENSHOT_LOCK = threading.Lock()
+
+def _fetch_until(url: str, deadline: float, max_bytes: int) -> tuple[str, bytes]:
+    """GET url -> (content type, body), giving up at `deadline` (a
+    time.monotonic() value): the connection only gets the time that's left,
+    and the body is read in chunks with the deadline checked between them,
+    so a slow trickle can't run past it either."""
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise TimeoutError("screenshot deadline passed")
+    with urlopen(url, timeout=left) as resp:
+        ctype = resp.headers.get_content_type()
+        chunks, size = [], 0
+        while chunk := resp.read1(64 << 10):
+            size += len(chunk)
+            if size > max_bytes:
+                raise ValueError(f"response over {max_bytes} bytes")
+            if time.monotonic() > deadline:
+                raise TimeoutError("screenshot deadline passed")
+            chunks.append(chunk)
+    return ctype, b"".join(chunks)
+
+def _stamp_screenshot(raw: bytes, captured: datetime) -> bytes:
+    """Scale the screenshot down to SCREENSHOT_WIDTH and burn the capture
+    time into a bar along the bottom."""
+    with Image.open(BytesIO(raw)) as src:
+        w = min(SCREENSHOT_WIDTH, src.width)
+        size = (w, max(1, round(src.height * w / src.width)))
+        # A JPEG is decoded straight at 1/2, 1/4 or 1/8 scale (draft); any
+        # other format is first shrunk by the largest whole factor with
+        # reduce() (reducing_gap=1.0) - a box average, which for a 2x
+        # capture is exactly what a 1x screen would show - so LANCZOS only
+        # ever runs over the fractional rest, not the retina-sized original.
+        src.draft("RGB", size)
+        img = src if src.mode in ("RGB", "RGBA") else src.convert("RGB")
+        if img.size != size:
+            img = img.resize(size, Image.LANCZOS, reducing_gap=1.0)
+        img = img.convert("RGB")
+
+    text = f"Captured {captured.strftime('%Y-%m-%d %H:%M:%S IST')}"
+    draw = ImageDraw.Draw(img, "RGBA")
+    font = ImageFont.load_default(size=22)
+    pad = 10
+    bbox = draw.textbbox((0, 0), text, font=font)
+    bar_h = (bbox[3] - bbox[1]) + pad * 2
+    draw.rectangle([0, img.height - bar_h, img.width, img.height], fill=(15, 23, 42, 190))
+    draw.text((pad, img.height - bar_h + pad // 2), text, font=font, fill=(255, 255, 255, 255))
+
+    out = BytesIO()
+    img.save(out, format="JPEG", quality=82)
+    return out.getvalue()
 
 def _capture_site_screenshot_jpeg() -> bytes | None:
     """Best-effort live screenshot of the public site, timestamped (IST) in the
@@ -1035,85 +3801,78 @@ def _capture_site_screenshot_jpeg() -> bytes | None:
     on this box (Render's free tier can't comfortably run one in-process).
     Returns None on any failure; the health check email must still send
     without a screenshot rather than fail outright over a secondary feature."""
-    try:
-        api_url = SCREENSHOT_API_URL + "?" + urlencode({
-            "url": BRAND["site"], "screenshot": "true", "meta": "false"
-        })
-        with urlopen(api_url, timeout=SCREENSHOT_TIMEOUT) as resp:
-            meta = json.loads(resp.read().decode("utf-8"))
-        shot_url = meta["data"]["screenshot"]["url"]
-
-        with urlopen(shot_url, timeout=SCREENSHOT_TIMEOUT) as resp:
-            raw = resp.read()
-
-        img = Image.open(BytesIO(raw)).convert("RGB")
-        max_w = 1280
-        if img.width > max_w:
-            img = img.resize((max_w, round(img.height * max_w / img.width)), Image.LANCZOS)
-
-        stamp = _now_ist().strftime("%Y-%m-%d %H:%M:%S IST")
-        text = f"Captured {stamp}"
-        draw = ImageDraw.Draw(img, "RGBA")
-        font = ImageFont.load_default(size=22)
-        pad = 10
-        bbox = draw.textbbox((0, 0), text, font=font)
-        bar_h = (bbox[3] - bbox[1]) + pad * 2
-        draw.rectangle([0, img.height - bar_h, img.width, img.height], fill=(15, 23, 42, 190))
-        draw.text((pad, img.height - bar_h + pad // 2), text, font=font, fill=(255, 255, 255, 255))
-
-        out = BytesIO()
-        img.save(out, format="JPEG", quality=82)
-        return out.getvalue()
-    except Exception as e:
-        app.logger.warning("site screenshot capture failed: %s", e)
-        return None
+    with _SCREENSHOT_LOCK:
+        c = _SCREENSHOT_CACHE
+        if c["jpeg"] and time.monotonic() - c["at"] < SCREENSHOT_CACHE_TTL:
+            return c["jpeg"]
+        deadline = time.monotonic() + SCREENSHOT_TIMEOUT
+        try:
+            # embed= has the API answer with the JPEG itself rather than JSON
+            # pointing at it - one round trip instead of two. A JSON answer
+            # (an API or stand-in without embed) still gets the second fetch.
+            api_url = SCREENSHOT_API_URL + "?" + urlencode({
+                "url": BRAND["site"], "screenshot": "true", "meta": "false",
+                "screenshot.type": "jpeg", "embed": "screenshot.url",
+            })
+            ctype, raw = _fetch_until(api_url, deadline, SCREENSHOT_MAX_BYTES)
+            if not ctype.startswith("image/"):
+                shot_url = json.loads(raw.decode("utf-8"))["data"]["screenshot"]["url"]
+                _, raw = _fetch_until(shot_url, deadline, SCREENSHOT_MAX_BYTES)
+            jpeg = _stamp_screenshot(raw, _now_ist())
+        except Exception as e:
+            app.logger.warning("site screenshot capture failed: %s", e)
+            return None
+        c.update(at=time.monotonic(), jpeg=jpeg)
+        return jpeg
 
 def send_daily_health_check_email():
     now_ist = _now_ist()
     screenshot = _capture_site_screenshot_jpeg()
     inline_images = None
     if screenshot:
-        screenshot_html = f"""
-<p style="margin:16px 0 6px;font:700 13px Arial;color:{BRAND['ink']}">Live site screenshot</p>
+        screenshot_block = _eb_para(
+            f"""<b style="display:block;margin:0 0 6px;font:700 13px Arial;color:{BRAND['ink']}">Live site screenshot</b>
 <img src="cid:site-screenshot.jpg" alt="Live site screenshot" width="100%"
-     style="max-width:100%;border:1px solid {BRAND['line']};border-radius:8px;display:block">
-"""
+     style="max-width:100%;border:1px solid {BRAND['line']};border-radius:8px;display:block">""",
+            "Live site screenshot attached.", style="margin:16px 0 0")
         inline_images = [("site-screenshot.jpg", screenshot)]
     else:
-        screenshot_html = f'<p style="margin:16px 0 0;font:400 12.5px Arial;color:{BRAND["muted"]}">(Live screenshot unavailable this run.)</p>'
-
-    inner = f"""
-<h2 style="margin:0 0 8px;font:700 18px Arial;color:{BRAND['ink']}">✅ Daily Health Check</h2>
-<p style="margin:0 0 12px;font:400 14px Arial;color:{BRAND['muted']}">This is an automated confirmation that the AMC Spark website and server are up and running.</p>
-<table role="presentation" cellpadding="0" cellspacing="0" width="100%" style="border:1px solid {BRAND['line']};border-radius:10px">
-  {_row("Checked at (IST)", now_ist.strftime("%Y-%m-%d %H:%M:%S"))}
-  {_row("Server URL", SELF_URL or "(not configured)")}
-  {_row("Mailer", f"Brevo API ({_mask_user(EMAIL_USER)})")}
-</table>
-{screenshot_html}
-"""
+        screenshot_block = _eb_para("(Live screenshot unavailable this run.)", "(Live screenshot unavailable this run.)",
+                                    style=f"margin:16px 0 0;font:400 12.5px Arial;color:{BRAND['muted']}")
+
+    html_body, text_body = _render_email(
+        "Daily health check",
+        _eb_heading("✅ Daily Health Check"),
+        _eb_para("This is an automated confirmation that the AMC Spark website and server are up and running.",
+                 "This is an automated confirmation that the AMC Spark website and server are up and running.",
+                 style=_ES_LEAD),
+        _eb_table([("Checked at (IST)", now_ist.strftime("%Y-%m-%d %H:%M:%S")),
+                   ("Server URL", SELF_URL or "(not configured)"),
+                   ("Mailer", f"Brevo API ({_mask_user(EMAIL_USER)})")]),
+        screenshot_block,
+    )
     send_email(
         "✅ AMC Spark — Daily Health Check (Server Alive)",
-        email_shell_html("Daily health check", inner),
+        html_body,
+        text_body=text_body,
         to=[HEALTH_CHECK_EMAIL],
         inline_images=inline_images
     )
 
-def _daily_health_check_loop():
-    while True:
-        try:
-            time.sleep(_seconds_until_next_ist_6am())
-            date_str = _now_ist().strftime("%Y-%m-%d")
-            if _health_check_already_sent_today(date_str):
-                continue
-            send_daily_health_check_email()
-            _mark_health_check_sent(date_str)
-        except Exception as e:
-            app.logger.exception("daily health check failed: %s", e)
-            time.sleep(3600)  # back off an hour so a persistent failure can't spin-loop
+def _daily_health_check_job():
+    # the scheduler already runs this once a day in one process; the date
+    # check (under the state file's lock, held through the send) also covers
+    # a manual run of the same job or a restart mid-send
+    date_str = _now_ist().strftime("%Y-%m-%d")
+    with _file_lock(HEALTH_CHECK_STATE):
+        if _health_check_already_sent_today(date_str):
+            return
+        send_daily_health_check_email()
+        _atomic_write_json(HEALTH_CHECK_STATE, {"last_sent_date": date_str})
 
 if (env("DAILY_HEALTH_CHECK", "1") or "1") == "1" and smtp_ready():
-    threading.Thread(target=_daily_health_check_loop, daemon=True).start()
+    _register_job("daily-health-check", _daily_health_check_job, cron="0 6 * * *",
+                  utc_offset=IST_OFFSET, jitter=60)
 
 @app.post("/admin/api/health-check/test")
 def admin_api_health_check_test():
@@ -1129,13 +3888,13 @@ def admin_api_health_check_test():
 # ---------------- Admin login healthcheck (server-side test-case runner) ----------------
 # Runs the same 5 login/logout/wrong-password test cases as
 # qa/admin_login_test.js, but via Flask's own test client instead of real
-# HTTP requests. This process runs behind a single gunicorn worker with no
-# threading (see the keep-alive comment above) - an actual outbound HTTP
-# call from a view function back to this same server would have nowhere to
-# be served and could hang the whole app until it timed out. The test
-# client runs the exact same view functions in-process over WSGI, with its
-# own independent cookie jar, so it doesn't touch the admin's real session
-# and carries zero risk of that deadlock. No screenshots/video, since there
+# HTTP requests. The gthread workers (gunicorn.conf.py) could now serve a
+# request back to this same server, but only while a thread is free - under
+# load, or with threads=1, it would wait on itself until it timed out - and
+# it would go out through Render's proxy for nothing. The test client runs
+# the exact same view functions in-process over WSGI, with its own
+# independent cookie jar, so it doesn't touch the admin's real session and
+# carries zero risk of that deadlock. No screenshots/video, since there
 # is no browser in this environment - use the Node script locally for that.
 _LOGIN_HEALTHCHECK_WRONG_PASS = "Wr0ng-Test-Password!Not-Real"
 
@@ -1181,7 +3940,7 @@ def _run_login_healthcheck():
 
     return results
 
-def _login_healthcheck_email_html(results, passed, total):
+def _login_healthcheck_email(results, passed, total) -> tuple[str, str]:
     def row(x):
         status = "PASS" if x["passed"] else "FAIL"
         color = BRAND["ok"] if x["passed"] else BRAND["danger"]
@@ -1191,15 +3950,17 @@ def _login_healthcheck_email_html(results, passed, total):
   <td style="padding:8px 10px;border-bottom:1px solid {BRAND['line']};font:400 13px Arial">{x['name']}<br><span style="color:{BRAND['muted']};font-size:11.5px">{x['note']}</span></td>
 </tr>"""
     all_passed = passed == total
-    inner = f"""
-<h2 style="margin:0 0 8px;font:700 18px Arial;color:{BRAND['ink']}">{"✅" if all_passed else "⚠️"} Admin Login Healthcheck</h2>
-<p style="margin:0 0 12px;font:400 14px Arial;color:{BRAND['muted']}">Ran at {_now_ist().strftime('%Y-%m-%d %H:%M:%S')} IST. Result: <b>{passed}/{total} passed</b>.</p>
-<table role="presentation" cellpadding="0" cellspacing="0" width="100%" style="border:1px solid {BRAND['line']};border-radius:10px">
-{''.join(row(x) for x in results)}
-</table>
-<p style="margin:14px 0 0;font:400 12px Arial;color:{BRAND['muted']}">Runs entirely in-process against this server (Flask's test client) - no screenshots, since this environment has no browser.</p>
-"""
-    return email_shell_html("Admin login healthcheck", inner)
+    ran = f"Ran at {_now_ist().strftime('%Y-%m-%d %H:%M:%S')} IST. Result: "
+    footnote = "Runs entirely in-process against this server (Flask's test client) - no screenshots, since this environment has no browser."
+    return _render_email(
+        "Admin login healthcheck",
+        _eb_heading(f"{'✅' if all_passed else '⚠️'} Admin Login Healthcheck"),
+        _eb_para(f"{ran}<b>{passed}/{total} passed</b>.", f"{ran}{passed}/{total} passed.", style=_ES_LEAD),
+        (f'<table role="presentation" cellpadding="0" cellspacing="0" width="100%" style="{_ES_TABLE}">'
+         + "".join(row(x) for x in results) + "</table>",
+         "\n".join(f"{'PASS' if x['passed'] else 'FAIL'} {x['id']} {x['name']} - {x['note']}" for x in results)),
+        _eb_para(footnote, footnote, style=f"margin:14px 0 0;font:400 12px Arial;color:{BRAND['muted']}"),
+    )
 
 @app.post("/admin/api/login-healthcheck")
 def admin_api_login_healthcheck():
@@ -1212,9 +3973,9 @@ def admin_api_login_healthcheck():
 
     email_sent, email_err = False, None
     try:
-        send_email(f"Admin Login Healthcheck — {passed}/{total} passed",
-                    _login_healthcheck_email_html(results, passed, total),
-                    to=[HEALTH_CHECK_EMAIL])
+        html_body, text_body = _login_healthcheck_email(results, passed, total)
+        send_email(f"Admin Login Healthcheck — {passed}/{total} passed", html_body,
+                   text_body=text_body, to=[HEALTH_CHECK_EMAIL])
         email_sent = True
     except Exception as e:
         app.logger.exception("login healthcheck email failed")
@@ -1231,26 +3992,23 @@ def _dispatch_github_workflow(base_url: str):
     itself (which takes a couple of minutes) finishes."""
     url = f"https://api.github.com/repos/{GITHUB_REPO}/actions/workflows/{GITHUB_WORKFLOW_FILE}/dispatches"
     payload = {"ref": GITHUB_DISPATCH_REF, "inputs": {"base_url": base_url}}
-    req = Request(
-        url,
-        data=json.dumps(payload).encode("utf-8"),
-        headers={
-            "Authorization": f"Bearer {GITHUB_DISPATCH_TOKEN}",
-            "Accept": "application/vnd.github+json",
-            "X-GitHub-Api-Version": "2022-11-28",
-            "Content-Type": "application/json",
-            "User-Agent": "amc-spark-admin-dashboard",
-        },
-        method="POST",
-    )
     try:
-        with urlopen(req, timeout=15) as resp:
-            resp.read()
-    except HTTPError as e:
-        detail = e.read().decode("utf-8", "replace")
-        raise RuntimeError(f"GitHub API error {e.code}: {detail}") from e
-    except URLError as e:
-        raise RuntimeError(f"GitHub API unreachable: {e.reason}") from e
+        status, detail = _https_request(
+            "POST", url,
+            body=json.dumps(payload).encode("utf-8"),
+            headers={
+                "Authorization": f"Bearer {GITHUB_DISPATCH_TOKEN}",
+                "Accept": "application/vnd.github+json",
+                "X-GitHub-Api-Version": "2022-11-28",
+                "Content-Type": "application/json",
+                "User-Agent": "amc-spark-admin-dashboard",
+            },
+            timeout=15,
+        )
+    except OSError as e:
+        raise RuntimeError(f"GitHub API unreachable: {e}") from e
+    if status >= 300:
+        raise RuntimeError(f"GitHub API error {status}: {detail.decode('utf-8', 'replace')}")
 
 @app.post("/admin/api/login-healthcheck/video")
 def admin_api_login_healthcheck_video():
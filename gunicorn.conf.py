@@ -0,0 +1,33 @@
+# gunicorn.conf.py - picked up automatically by `gunicorn app:app` run from
+# this directory; any of these can still be overridden on the command line.
+#
+# gthread workers: each process serves `threads` requests at once, so a
+# request stuck on a slow outbound call (Brevo, the screenshot service,
+# GitHub) holds one thread instead of the whole site. Several processes on
+# top of that keep CPU-bound work (image resizing, JSON for big ticket
+# lists) from serialising on one GIL. Everything shared -
+# ticket state, the outbox, invoice numbers, rate limits - is already
+# coordinated through file locks / SQLite, and once-per-deployment threads
+# elect a single leader (see "Background threads" in app.py).
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+worker_class = "gthread"
+# kept small for Render's 512 MB instances; raise WEB_CONCURRENCY on bigger ones
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+# above 2 x EMAIL_SEND_TIMEOUT (20s) - admin + client email when they're
+# sent inline - so a slow Brevo call ends in a clean JSON error rather than
+# the worker being killed mid-request
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = 30
+keepalive = 5
+# recycle workers now and then to cap any slow leak; the jitter stops them
+# all restarting at once
+max_requests = 2000
+max_requests_jitter = 200
+# every worker imports the app itself (no preload), so each one gets its
+# own threads, SQLite connections and HTTPS pool rather than fork-copies
+preload_app = False
+accesslog = "-"
+errorlog = "-"
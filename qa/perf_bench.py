@@ -0,0 +1,1064 @@
+"""
+Performance benchmarks for the server side of the site (app.py), run
+in-process against a throwaway data directory - never against the real
+submissions/state files and never against a live site. Each subcommand
+prints a small table and exits; nothing here is deployed or imported by
+the app itself.
+
+Run: python qa/perf_bench.py <benchmark> [options]
+     python qa/perf_bench.py --help   (lists the available benchmarks)
+"""
+
+from __future__ import annotations
+
+import argparse, json, multiprocessing, os, ssl, statistics, subprocess, sys, tempfile, threading, time, tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.request import Request, urlopen
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORK_DIR = tempfile.mkdtemp(prefix="amc-bench-")
+
+# app.py reads its config at import time - point every persistent file at the
+# scratch directory and switch off the background threads before importing.
+os.environ.setdefault("SUBMIT_LOG", os.path.join(WORK_DIR, "submissions.jsonl"))
+os.environ.setdefault("SUBMIT_STATE", os.path.join(WORK_DIR, "ticket_state.json"))
+os.environ.setdefault("UPLOAD_DIR", os.path.join(WORK_DIR, "uploads"))
+os.environ.setdefault("INVOICE_SEQ_STATE", os.path.join(WORK_DIR, "invoice_seq.json"))
+os.environ.setdefault("HEALTH_CHECK_STATE", os.path.join(WORK_DIR, "health_check_state.json"))
+os.environ.setdefault("OUTBOX_DIR", os.path.join(WORK_DIR, "outbox"))
+os.environ.setdefault("ASSET_BUILD_DIR", os.path.join(WORK_DIR, "static_build"))
+os.environ.setdefault("RATE_LIMIT_DB", os.path.join(WORK_DIR, "ratelimit.sqlite3"))
+os.environ.setdefault("INVOICE_DB", os.path.join(WORK_DIR, "invoices.sqlite3"))
+os.environ["KEEP_ALIVE"] = "0"
+os.environ["DAILY_HEALTH_CHECK"] = "0"
+os.environ["OVERDUE_ALERTS"] = "0"
+os.environ["OUTBOX_SENDER"] = "0"
+sys.path.insert(0, REPO_ROOT)
+
+import app as amc  # noqa: E402
+
+
+def _fake_submission(i: int) -> dict:
+    return {
+        "ticket": f"CO-{i:08X}",
+        "kind": ("Contact", "Quick Quote", "Project Desk")[i % 3],
+        "fields": {"Name": f"Client {i}", "Email": f"client{i}@example.com",
+                   "Phone": f"+91 98{i:08d}", "Message": "Need a quote for 33kV panel testing"},
+        "attachments": [],
+        "client_name": f"Client {i}",
+        "client_email": f"client{i}@example.com",
+        "meta": {"ip": "127.0.0.1", "ua": "bench"},
+        "ts": f"2024-01-01T00:00:00.{i:06d}Z" if i < 10**6 else "2024-01-02T00:00:00Z",
+    }
+
+
+def _timed(fn, repeat: int) -> float:
+    """Median wall time of fn() in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples)
+
+
+def _full_reparse(path: str) -> list:
+    """What _read_submissions() used to do on every call - kept here only as
+    the baseline to compare against."""
+    items = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                items.append(json.loads(line))
+    dedup = {}
+    for it in items:
+        key = it.get("ticket") or ""
+        if key not in dedup or it.get("ts", "") > dedup[key].get("ts", ""):
+            dedup[key] = it
+    out = list(dedup.values())
+    out.sort(key=lambda x: x.get("ts", ""), reverse=True)
+    return out
+
+
+def bench_tickets(args):
+    """_read_submissions() latency as the log grows: the first (cold) call
+    parses everything once, every later call only parses what was appended
+    ("+10" = 10 new lines since the last call; "idle" = a poll where nothing
+    changed, the common dashboard case). "api" is the dashboard's own
+    request, GET /admin/api/tickets?limit=100 through the test client, with
+    10 new submissions appended before every request so none of them is a
+    304 or sees an unchanged store."""
+    client = amc.app.test_client()
+    with client.session_transaction() as sess:
+        sess.update(authed=True, who=amc.ADMIN_USER_ID, access_logged=True)
+    print(f"{'tickets':>9} {'full re-parse ms':>17} {'cold index ms':>14} "
+          f"{'refresh +10 ms':>15} {'list +10 ms':>12} {'list idle ms':>13} {'api +10 ms':>11}")
+    for n in args.sizes:
+        path = os.path.join(WORK_DIR, f"submissions-{n}.jsonl")
+        with open(path, "w", encoding="utf-8") as f:
+            for i in range(n):
+                f.write(json.dumps(_fake_submission(i)) + "\n")
+        amc.SUBMIT_LOG = path
+        amc._SUBMISSION_INDEX.update(jsonl_id=None, offset=0, json_sig=None, items={}, order=[], sorted=[], shared=False)
+
+        full_ms = _timed(lambda: _full_reparse(path), 1)
+        cold_ms = _timed(amc._read_submissions, 1)
+        seq = [n]
+
+        def append10():
+            with open(path, "a", encoding="utf-8") as f:
+                for _ in range(10):
+                    f.write(json.dumps(_fake_submission(seq[0])) + "\n")
+                    seq[0] += 1
+
+        def timed_after_append(fn):
+            samples = []
+            for _ in range(args.repeat):
+                append10()
+                samples.append(_timed(fn, 1))
+            return statistics.median(samples)
+
+        def refresh_only():
+            with amc._SUBMISSION_INDEX_LOCK:
+                amc._refresh_submission_index()
+
+        refresh_ms = timed_after_append(refresh_only)
+        list_ms = timed_after_append(amc._read_submissions)
+        idle_ms = _timed(amc._read_submissions, args.repeat)
+
+        def api_page():
+            resp = client.get("/admin/api/tickets?limit=100")
+            assert resp.status_code == 200 and len(resp.get_json()["items"]) == 100
+
+        api_page()  # warm-up
+        api_ms = timed_after_append(api_page)
+        print(f"{n:>9} {full_ms:>17.1f} {cold_ms:>14.1f} "
+              f"{refresh_ms:>15.2f} {list_ms:>12.2f} {idle_ms:>13.3f} {api_ms:>11.2f}")
+
+
+def bench_search(args):
+    """Ticket search (?q=) at scale: the old json.dumps + substring scan over
+    every ticket vs. the token/trigram index (file store)."""
+    path = os.path.join(WORK_DIR, f"search-{args.size}.jsonl")
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(args.size):
+            f.write(json.dumps(_fake_submission(i)) + "\n")
+    amc.SUBMIT_LOG = path
+    items = amc._read_submissions()
+
+    t0 = time.perf_counter()
+    amc._search_tickets("warm-up")
+    print(f"{args.size} tickets, index built in {(time.perf_counter() - t0) * 1000:.0f} ms")
+    print(f"{'query':>22} {'hits':>7} {'scan ms':>9} {'index ms':>9}")
+    for q in args.queries:
+        ql = q.lower()
+        scan_ms = _timed(lambda: [i for i in items if ql in json.dumps(i, ensure_ascii=False).lower()], 1)
+        hits = amc._search_tickets(q)
+        index_ms = _timed(lambda: amc._search_tickets(q), args.repeat)
+        print(f"{q:>22} {len(hits):>7} {scan_ms:>9.1f} {index_ms:>9.3f}")
+
+
+def bench_state(args):
+    """Per-ticket state lookups (_get_ticket_state / _merge_ticket) against
+    ticket_state.json: re-parsing the file for every ticket, as before, vs.
+    the shared stat-checked cache."""
+    amc.SUBMIT_STATE = os.path.join(WORK_DIR, f"state-{args.size}.json")
+    state = {f"CO-{i:08X}": {"status": "open", "note": f"remark {i}", "history": []} for i in range(args.size)}
+    amc._save_state_files(state)
+    tickets = list(state)[:args.lookups]
+
+    def reparse():
+        for t in tickets:
+            with open(amc.SUBMIT_STATE, "r", encoding="utf-8") as f:
+                json.load(f).get(t)
+
+    def cached():
+        for t in tickets:
+            amc._get_ticket_state(t)
+
+    amc._STATE_CACHE["sig"] = None
+    cold_ms = _timed(cached, 1)
+    print(f"{args.size} tickets in state, {len(tickets)} lookups per pass")
+    print(f"{'re-parse each ms':>17} {'cache cold ms':>14} {'cache warm ms':>14}")
+    print(f"{_timed(reparse, 1):>17.1f} {cold_ms:>14.1f} {_timed(cached, args.repeat):>14.2f}")
+
+
+def bench_state_write(args):
+    """Cost of one ticket update (status change + history entry) as the
+    state grows: rewriting the whole ticket_state.json, as before, vs.
+    appending a journal record."""
+    print(f"{'tickets':>9} {'rewrite ms':>11} {'journal ms':>11}")
+    for n in args.sizes:
+        amc.SUBMIT_STATE = os.path.join(WORK_DIR, f"state-write-{n}.json")
+        amc.STATE_JOURNAL = amc.SUBMIT_STATE + ".journal"
+        hist = [{"ts": "2024-01-01T00:00:00Z", "status": "wip", "note": "called back", "by": "admin"}] * 3
+        state = {f"CO-{i:08X}": {"status": "open", "note": f"remark {i}", "history": list(hist)} for i in range(n)}
+        amc._save_state_files(state)
+        seq = [0]
+
+        def rewrite():
+            with open(amc.SUBMIT_STATE + ".old", "w", encoding="utf-8") as f:
+                json.dump(state, f, ensure_ascii=False, indent=2)
+
+        def journal():
+            seq[0] += 1
+            t = f"CO-{seq[0] % n:08X}"
+            amc._update_ticket_states({t: {"status": "wip"}},
+                                      {t: {"ts": "x", "status": "wip", "note": str(seq[0]), "by": "admin"}})
+
+        print(f"{n:>9} {_timed(rewrite, min(args.repeat, 5)):>11.1f} {_timed(journal, args.repeat):>11.3f}")
+
+
+def _stress_worker(w: int, args, out):
+    """One worker process: args.threads threads, args.writes writes between
+    them; each write is a new submission plus a history entry on one of a
+    few shared (contended) tickets."""
+    def run(t):
+        for i in range(t, args.writes, args.threads):
+            amc._log_submission(dict(_fake_submission(0), ticket=f"S-{w}-{i}"))
+            hot = f"HOT-{i % args.hot}"
+            amc._update_ticket_states({hot: {"note": f"{w}-{i}"}}, {hot: {"w": w, "i": i}})
+
+    threads = [threading.Thread(target=run, args=(t,)) for t in range(args.threads)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    out.put({path: (q["commits"], q["records"]) for path, q in amc._COMMIT_QUEUES.items()})
+
+
+def bench_stress(args):
+    """N worker processes x M writes against the file store, all at once;
+    then checks that every submission and every history entry made it to
+    disk and reports fsync'd commits/sec (group commit folds concurrent
+    writes into one commit)."""
+    amc.SUBMIT_LOG = os.path.join(WORK_DIR, "stress.jsonl")
+    amc.SUBMIT_STATE = os.path.join(WORK_DIR, "stress-state.json")
+    amc.STATE_JOURNAL = amc.SUBMIT_STATE + ".journal"
+    amc.STATE_JOURNAL_MAX_BYTES = args.compact_bytes
+    ctx = multiprocessing.get_context("fork")
+    out = ctx.Queue()
+    procs = [ctx.Process(target=_stress_worker, args=(w, args, out)) for w in range(args.procs)]
+    t0 = time.perf_counter()
+    for p in procs: p.start()
+    stats = [out.get() for _ in procs]
+    for p in procs: p.join()
+    wall = time.perf_counter() - t0
+
+    writes = args.procs * args.writes
+    subs = {it["ticket"] for it in amc._read_submissions()}
+    state = amc._load_state()
+    seen = {(h["w"], h["i"]) for k, st in state.items() if k.startswith("HOT-") for h in st["history"]}
+    lost_subs = sum(f"S-{w}-{i}" not in subs for w in range(args.procs) for i in range(args.writes))
+    lost_hist = writes - len(seen)
+    commits = sum(c for st in stats for c, _ in st.values())
+    records = sum(r for st in stats for _, r in st.values())
+    print(f"{args.procs} procs x {args.threads} threads, {writes} writes (2 records each) in {wall:.2f}s")
+    print(f"lost submissions: {lost_subs}   lost history entries: {lost_hist}")
+    print(f"{commits} fsync'd commits ({commits / wall:.0f}/s), {records / max(commits, 1):.2f} records per commit, "
+          f"{writes / wall:.0f} writes/s")
+    if lost_subs or lost_hist:
+        sys.exit(1)
+
+
+def _invoice_worker(args, block: int, out):
+    """One worker process: args.threads threads claiming args.numbers
+    invoice numbers between them, `block` at a time."""
+    got = []
+
+    def run(t):
+        for _ in range(t, args.numbers // block, args.threads):
+            _, _, first = amc._claim_invoice_numbers(block)
+            got.extend(range(first, first + block))
+
+    threads = [threading.Thread(target=run, args=(t,)) for t in range(args.threads)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    out.put(got)
+
+
+def bench_invoice(args):
+    """N worker processes x M threads all claiming invoice numbers at once,
+    one per lock acquisition (commit-number) vs. a block per acquisition
+    (reserve-block); checks that the numbers issued are exactly 1..total,
+    with no duplicates and no gaps."""
+    ctx = multiprocessing.get_context("fork")
+    print(f"{args.procs} procs x {args.threads} threads, {args.numbers} numbers per process")
+    print(f"{'block':>6} {'wall s':>8} {'numbers/s':>10} {'dupes':>6} {'gaps':>5}")
+    failed = False
+    for block in [1] + args.blocks:
+        amc.INVOICE_SEQ_STATE = os.path.join(WORK_DIR, f"invoice-seq-{block}.json")
+        out = ctx.Queue()
+        procs = [ctx.Process(target=_invoice_worker, args=(args, block, out)) for _ in range(args.procs)]
+        t0 = time.perf_counter()
+        for p in procs: p.start()
+        got = [n for _ in procs for n in out.get()]
+        for p in procs: p.join()
+        wall = time.perf_counter() - t0
+        dupes = len(got) - len(set(got))
+        gaps = (max(got) - len(set(got))) if got else 0
+        failed |= bool(dupes or gaps)
+        print(f"{block:>6} {wall:>8.2f} {len(got) / wall:>10.0f} {dupes:>6} {gaps:>5}")
+    if failed:
+        sys.exit(1)
+
+
+def bench_invoice_history(args):
+    """Opening the invoice history panel: JSON-parsing a whole localStorage-
+    style history of N drafts, as the browser did, vs. one page plus the
+    month strip from the server store (through the Flask test client)."""
+    client = amc.app.test_client()
+    with client.session_transaction() as s:
+        s["authed"], s["access_logged"], s["who"] = True, True, amc.ADMIN_USER_ID
+    print(f"{'invoices':>9} {'parse all ms':>13} {'page+months ms':>15} {'search ms':>10}")
+    have = 0
+    for n in args.sizes:
+        items = [{"desc": "Annual maintenance of 33kV panels", "hsn": "998719", "qty": 1, "rate": 45000, "per": "Nos"}] * 3
+        hist = []
+        for i in range(have, n):
+            date = f"{1 + i % 28:02d} {('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun')[i % 6]} 2026"
+            data = {"fields": {"b_name": f"Client {i % 300}", "inv_date": date, "tax_type": "igst",
+                               "tax_rate": "18", "cur": "₹", "b_addr": "Plot 12, Sector 24\nFaridabad"},
+                    "items": items, "round_off": True}
+            amc._store_invoice(f"ASAS/25-26/B{i:06d}", {"taxable": 135000, "gst": 24300, "total": 159300, "data": data})
+        have = n
+        for i in range(n):
+            hist.append({"invNo": f"ASAS/25-26/B{i:06d}", "date": "01 Jan 2026", "buyerName": f"Client {i % 300}",
+                         "total": 159300, "cur": "₹", "status": "completed", "updatedAt": i, "data": data})
+        blob = json.dumps(hist)
+
+        def parse_all():
+            sorted(json.loads(blob), key=lambda h: h["updatedAt"], reverse=True)
+
+        def page():
+            assert client.get("/admin/api/invoices?limit=20").status_code == 200
+            assert client.get("/admin/api/invoices/months").status_code == 200
+
+        def search():
+            assert client.get("/admin/api/invoices?limit=20&q=client 42").status_code == 200
+
+        print(f"{n:>9} {_timed(parse_all, args.repeat):>13.2f} {_timed(page, args.repeat):>15.2f} "
+              f"{_timed(search, args.repeat):>10.2f}")
+
+
+class _FakeBrevo(BaseHTTPRequestHandler):
+    """Answers every POST like Brevo's /v3/smtp/email does, after an
+    optional artificial delay (the server's --latency-ms). With the server's
+    drop_after_read set, it reads the POST and hangs up without answering,
+    like a connection lost after the message was accepted."""
+    protocol_version = "HTTP/1.1"  # keep-alive
+    wbufsize = -1  # headers + body in one segment, or Nagle/delayed-ACK adds 40 ms
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        self.server.posts += 1
+        if self.server.drop_after_read:
+            self.close_connection = True
+            return
+        time.sleep(self.server.latency)
+        body = b'{"messageId":"<bench@localhost>"}'
+        self.send_response(201)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *a):
+        pass
+
+
+def _local_tls_server(latency_ms: float):
+    """A self-signed HTTPS stand-in on 127.0.0.1 (cert made with the openssl
+    CLI); returns (server, url, client SSL context that trusts it)."""
+    cert, key = os.path.join(WORK_DIR, "bench-cert.pem"), os.path.join(WORK_DIR, "bench-key.pem")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+                    "-keyout", key, "-out", cert, "-subj", "/CN=localhost",
+                    "-addext", "subjectAltName=DNS:localhost,IP:127.0.0.1"],
+                   check=True, capture_output=True)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _FakeBrevo)
+    server.latency = latency_ms / 1000
+    server.posts, server.drop_after_read = 0, False
+    server_ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    server_ctx.load_cert_chain(cert, key)
+    server.socket = server_ctx.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"https://localhost:{server.server_address[1]}/v3/smtp/email", ssl.create_default_context(cafile=cert)
+
+
+def bench_mailer(args):
+    """send_email() against a local TLS stand-in for Brevo: a new urlopen()
+    connection (TCP + TLS handshake) per message, as before, vs. the
+    keep-alive pool - sequentially and from concurrent threads. Then checks
+    that a POST the server read but never answered, on a reused connection,
+    isn't sent a second time (exit 1 if it is)."""
+    server, url, client_ctx = _local_tls_server(args.latency_ms)
+    amc.BREVO_API_URL, amc.BREVO_API_KEY, amc.EMAIL_USER = url, "bench-key", "bench@localhost"
+    amc._HTTP_SSL_CONTEXT = client_ctx
+    html_body, _ = amc.client_ack_email("Contact", "Bench", "CO-BENCH")
+
+    def old_send():
+        req = Request(url, data=json.dumps({"subject": "x", "htmlContent": html_body}).encode("utf-8"),
+                      headers={"api-key": "bench-key", "Content-Type": "application/json"}, method="POST")
+        with urlopen(req, timeout=10, context=client_ctx) as resp:
+            resp.read()
+
+    def new_send():
+        amc.send_email("x", html_body, to=["client@example.com"])
+
+    print(f"{args.messages} messages, server latency {args.latency_ms} ms")
+    print(f"{'':>22} {'urlopen ms/msg':>15} {'pooled ms/msg':>14}")
+    for threads in args.threads:
+        row = []
+        for fn in (old_send, new_send):
+            t0 = time.perf_counter()
+            with ThreadPoolExecutor(threads) as ex:
+                list(ex.map(lambda _: fn(), range(args.messages)))
+            row.append((time.perf_counter() - t0) * 1000 / args.messages)
+        print(f"{f'{threads} thread(s)':>22} {row[0]:>15.2f} {row[1]:>14.2f}")
+    print("pool:", amc._HTTP_POOL_STATS)
+
+    server.drop_after_read, server.posts = True, 0
+    try:
+        new_send()
+    except RuntimeError:
+        pass  # expected: the outbox retries it later, with backoff
+    server.shutdown()
+    print(f"POST read but not answered: server saw it {server.posts} time(s)")
+    if server.posts != 1:
+        sys.exit(1)
+
+
+def _legacy_shell(preheader: str, inner_html: str) -> str:
+    """The branded shell as one f-string over BRAND, rebuilt for every
+    email - kept here only as the baseline for bench_email."""
+    B = amc.BRAND
+    return f"""<!DOCTYPE html><html><head><meta charset="utf-8"><meta name="viewport" content="width=device-width,initial-scale=1"></head>
+<body style="margin:0;padding:0;background:{B['bg']};">
+  <span style="display:none!important;opacity:0;visibility:hidden">{preheader}</span>
+  <table role="presentation" cellpadding="0" cellspacing="0" width="100%" style="background:{B['bg']};padding:24px 0;">
+    <tr><td align="center">
+      <table role="presentation" width="600" style="max-width:600px;background:#fff;border:1px solid {B['line']};border-radius:14px;overflow:hidden">
+        <tr><td style="padding:18px 22px;border-bottom:1px solid {B['line']};background:linear-gradient(90deg,{B['brand']},{B['brand2']});color:#00121b;font:800 18px Arial">
+          ⚡ {B['name']} <span style="float:right;font:700 12px Arial"><a href="{B['site']}" style="color:#00121b;text-decoration:none">Visit Website →</a></span>
+        </td></tr>
+        <tr><td style="padding:22px">{inner_html}</td></tr>
+        <tr><td style="padding:14px 22px;border-top:1px solid {B['line']};background:#f9fbff;font:12px Arial;color:{B['muted']}">
+          📍 {B['addr']} • 📞 {B['phone']} • ✉️ {B['email']}
+        </td></tr>
+      </table>
+    </td></tr>
+  </table>
+</body></html>"""
+
+
+def bench_email(args):
+    """Email rendering throughput per message type. "old" is only what the
+    new pipeline removed - rebuilding the shell f-string and regex-stripping
+    the finished HTML for the text part - around an already-built body;
+    "new" renders the whole message, body included, to HTML and text."""
+    sub = _fake_submission(7)
+    alerts = [(_fake_submission(i), "open") for i in range(args.digest)]
+    cases = {
+        "admin notification": lambda: amc.admin_email("Quick Quote", sub["fields"], ["a.pdf"], sub["ticket"]),
+        "client ack": lambda: amc.client_ack_email("Quick Quote", "Client 7", sub["ticket"]),
+        "ticket update": lambda: amc.ticket_update_email(sub["ticket"], "wip", "Engineer visiting Monday"),
+        "overdue": lambda: amc._overdue_alert_email(sub, "open"),
+        f"overdue digest x{args.digest}": lambda: amc._overdue_digest_email(alerts),
+    }
+    pre_chunk, mid, tail = amc._SHELL_HTML
+    print(f"{'message':>22} {'old shell+strip/s':>18} {'new full render/s':>18}")
+    for label, render in cases.items():
+        html_body, _ = render()
+        inner = html_body[len(pre_chunk):-len(tail)].split(mid, 1)[1]
+        old = lambda: amc._plain_from_html(_legacy_shell("preheader", inner))
+        n = args.renders
+        old_s = _timed(lambda: [old() for _ in range(n)], 3) / 1000
+        new_s = _timed(lambda: [render() for _ in range(n)], 3) / 1000
+        print(f"{label:>22} {n / old_s:>18,.0f} {n / new_s:>18,.0f}")
+
+
+def bench_upload(args):
+    """Peak Python heap while storing one Project Desk attachment, by file
+    size: reading it whole (f.read(), as before) vs. _ingest_upload()'s
+    chunked copy. The upload is a FileStorage over a file on disk, which is
+    what Werkzeug hands the view for anything over 500 KB. Fails (exit 1) if
+    a streamed peak goes over --max-peak-kib or over twice the streamed peak
+    at the smallest size, i.e. if memory starts growing with the file.
+
+    The over-limit column only stops the copy into the store; the request
+    itself is capped by MAX_CONTENT_LENGTH while Werkzeug parses the form.
+    So an over-sized POST /api/project also goes through the test client,
+    with a declared Content-Length and chunked: both must get a JSON 413,
+    the first without its body being read at all, the second once about
+    MAX_CONTENT_LENGTH of it has been, and neither may leave a temp file in
+    the store."""
+    from io import RawIOBase
+    from werkzeug.datastructures import FileStorage
+
+    class Body(RawIOBase):
+        """A multipart body of `size` bytes - one PDF part that never ends -
+        counting what gets read."""
+        head = (b'--x\r\nContent-Disposition: form-data; name="files"; filename="big.pdf"\r\n'
+                b"Content-Type: application/pdf\r\n\r\n%PDF-1.7\n")
+
+        def __init__(self, size):
+            self.left, self.read_bytes = size, 0
+
+        def readable(self):
+            return True
+
+        def readinto(self, b):
+            n = min(len(b), self.left)
+            done = self.read_bytes
+            b[:n] = (self.head[done:done + n] + b"x" * n)[:n]
+            self.left -= n
+            self.read_bytes += n
+            return n
+
+    def old_ingest(f):
+        blob = f.read()
+        with open(os.path.join(amc.UPLOAD_DIR, "old_" + f.filename), "wb") as wf:
+            wf.write(blob)
+
+    def peak_kib(fn, path):
+        with open(path, "rb") as src:
+            f = FileStorage(stream=src, filename="drawing.pdf")
+            tracemalloc.start()
+            saved = None
+            try:
+                saved = fn(f)
+                return tracemalloc.get_traced_memory()[1] / 1024
+            finally:
+                tracemalloc.stop()
+                if isinstance(saved, dict):
+                    amc._discard_uploads([saved])
+
+    print(f"{'file MB':>8} {'f.read() peak KiB':>18} {'streamed peak KiB':>18} {'over-limit peak KiB':>20}")
+    peaks = []
+    for mb in sorted(args.sizes):
+        path = os.path.join(WORK_DIR, f"upload-{mb}.pdf")
+        with open(path, "wb") as out:
+            out.write(b"%PDF-1.7\n")
+            out.write(os.urandom(mb * 1024 * 1024))
+        old = peak_kib(old_ingest, path)
+        new = peak_kib(lambda f: amc._ingest_upload(f, amc.MAX_EMAIL_BYTES * 10), path)
+        cut = peak_kib(lambda f: amc._ingest_upload(f, 1024 * 1024), path)  # copy stopped after 1 MB
+        print(f"{mb:>8} {old:>18,.0f} {new:>18,.0f} {cut:>20,.0f}")
+        os.remove(path)
+        peaks += [new, cut]
+    bound = min(args.max_peak_kib, 2 * peaks[0])
+    if max(peaks) > bound:
+        print(f"FAIL: streamed peak {max(peaks):,.0f} KiB is over {bound:,.0f} KiB")
+        sys.exit(1)
+
+    limit = amc.app.config["MAX_CONTENT_LENGTH"]
+    client = amc.app.test_client()
+    tmp_dir = os.path.join(amc.BLOB_DIR, "tmp")
+    left_before = set(os.listdir(tmp_dir))
+    failed = False
+    for label, environ in (("declared", {"CONTENT_LENGTH": str(limit + (8 << 20))}),
+                           ("chunked", {"wsgi.input_terminated": True})):
+        body = Body(limit + (8 << 20))
+        tracemalloc.start()
+        # the builder would swap in its own boundary, so the headers go in raw
+        resp = client.post("/api/project", environ_overrides={
+            "wsgi.input": body, "CONTENT_TYPE": "multipart/form-data; boundary=x", **environ})
+        peak = tracemalloc.get_traced_memory()[1] / 1024
+        tracemalloc.stop()
+        print(f"over-sized POST /api/project ({label}, {body.read_bytes + body.left >> 20} MB, "
+              f"MAX_CONTENT_LENGTH {limit >> 20} MB): {resp.status_code}, "
+              f"{body.read_bytes >> 20} MB read, peak {peak:,.0f} KiB")
+        allowed = 0 if label == "declared" else limit + 1024 * 1024
+        if resp.status_code != 413 or not resp.is_json or body.read_bytes > allowed:
+            print(f"FAIL: expected a JSON 413 after reading at most {allowed:,} bytes")
+            failed = True
+    if set(os.listdir(tmp_dir)) != left_before:
+        print("FAIL: the rejected requests left files in the blob store")
+        failed = True
+    if failed:
+        sys.exit(1)
+
+
+def bench_static(args):
+    """Loading a page and the assets it references, first visit and repeat
+    visit: raw files revalidated on every visit (as before) vs. the asset
+    pipeline (hashed URLs, precompressed, immutable). Bytes are response
+    bodies; a repeat visit's requests are the round trips the browser still
+    has to make."""
+    import re
+    client = amc.app.test_client()
+    with client.session_transaction() as sess:
+        sess.update(authed=True, who=amc.ADMIN_USER_ID, access_logged=True)
+    ref = re.compile(rb'(?:src|href)="([^"#?:]+)"')
+    accept = {"Accept-Encoding": "br, gzip"}
+
+    def raw(page):
+        body = open(os.path.join(amc.STATIC_DIR, page), "rb").read()
+        refs = [r.decode().lstrip("/") for r in ref.findall(body)]
+        refs = [r for r in refs if os.path.isfile(os.path.join(amc.STATIC_DIR, r)) and not r.endswith(".html")]
+        first = len(body) + sum(os.path.getsize(os.path.join(amc.STATIC_DIR, r)) for r in refs)
+        return first, 1 + len(refs)  # no-cache: every file is revalidated
+
+    def piped(page):
+        resp = client.get("/" + page, headers=accept)
+        first = len(resp.data)
+        with open(amc._ASSETS["pages"][page]["path"], "rb") as f:
+            for r in ref.findall(f.read()):
+                if r.decode().lstrip("/") in amc._ASSETS["files"]:
+                    first += len(client.get(r.decode(), headers=accept).data)
+        return first, 1  # only the page; hashed assets are still fresh
+
+    print(f"{'page':<24} {'raw first B':>12} {'new first B':>12} {'raw repeat reqs':>16} {'new repeat reqs':>16}")
+    for page in args.pages:
+        (rf, rr), (nf, nr) = raw(page), piped(page)
+        print(f"{page:<24} {rf:>12,} {nf:>12,} {rr:>16} {nr:>16}")
+
+
+def bench_images(args):
+    """Bytes a browser downloads for index.html's photos when it picks the
+    srcset candidate for a given device width (CSS px x DPR), vs. the
+    originals it got before; plus the cost of encoding a derivative the
+    first time and serving it from the cache afterwards."""
+    import re
+    client = amc.app.test_client()
+    with open(amc._ASSETS["pages"]["index.html"]["path"], "rb") as f:
+        tags = re.findall(rb"<img\b[^>]*>", f.read())
+    photos = [re.search(rb'src="/([^"]+)"', t).group(1).decode() for t in tags if b"srcset=" in t]
+    original = sum(os.path.getsize(amc._ASSETS["files"][p]["path"]) for p in photos)
+
+    print(f"{'device px':>10} {'originals B':>12} {'jpeg B':>10} {'webp B':>10}")
+    for px in args.widths:
+        row = {}
+        for accept, fmt in (("*/*", "jpeg"), ("image/webp,*/*", "webp")):
+            total = 0
+            for p in photos:
+                fits = [w for w in amc.IMAGE_WIDTHS if w >= px and w < amc._ASSETS["files"][p]["width"]]
+                url = f"/img/{fits[0]}/{p}" if fits else f"/{p}"
+                total += len(client.get(url, headers={"Accept": accept}).data)
+            row[fmt] = total
+        print(f"{px:>10} {original:>12,} {row['jpeg']:>10,} {row['webp']:>10,}")
+
+    entry = amc._ASSETS["files"][photos[1]]
+    width = amc.IMAGE_WIDTHS[1]
+    for fmt in ("webp", "jpeg"):
+        out = os.path.join(amc.ASSET_BUILD_DIR, "img", f"{entry['etag']}-{width}.{fmt}")
+        if os.path.exists(out):
+            os.remove(out)
+        t0 = time.perf_counter()
+        amc._image_derivative(entry, width, fmt)
+        first = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        for _ in range(100):
+            amc._image_derivative(entry, width, fmt)
+        cached = (time.perf_counter() - t0) / 100
+        print(f"{photos[1]} @{width} {fmt}: first encode {first * 1000:.0f} ms, cached lookup {cached * 1e6:.0f} us")
+
+
+class _FakeMicrolink(BaseHTTPRequestHandler):
+    """Local stand-in for the screenshot API: answers with the image itself
+    when asked to embed it (JPEG if screenshot.type=jpeg, else PNG), or with
+    microlink's JSON pointing at /shot.png otherwise; every response after
+    the server's `latency` seconds."""
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        from urllib.parse import parse_qs, urlsplit
+        time.sleep(self.server.latency)
+        parts = urlsplit(self.path)
+        query = parse_qs(parts.query)
+        if parts.path == "/shot.png":
+            body, ctype = self.server.png, "image/png"
+        elif "embed" in query and self.server.embed:
+            jpeg = query.get("screenshot.type") == ["jpeg"]
+            body, ctype = (self.server.jpeg, "image/jpeg") if jpeg else (self.server.png, "image/png")
+        else:
+            host, port = self.server.server_address
+            body = json.dumps({"status": "success",
+                               "data": {"screenshot": {"url": f"http://{host}:{port}/shot.png"}}}).encode()
+            ctype = "application/json"
+        self.send_response(200)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *a):
+        pass
+
+
+def _fake_screenshot_server(latency_ms: float, embed: bool = True):
+    """A _FakeMicrolink on 127.0.0.1 holding a 2560x1600 page-like capture
+    (a 1280x800 viewport at 2x, microlink's default device); returns
+    (server, API url)."""
+    from PIL import Image, ImageDraw
+    from io import BytesIO
+    img = Image.new("RGB", (2560, 1600), (248, 250, 252))
+    draw = ImageDraw.Draw(img)
+    draw.rectangle([0, 0, 2560, 160], fill=(15, 23, 42))
+    for i in range(12):
+        x, y = 160 + (i % 4) * 580, 300 + (i // 4) * 420
+        draw.rectangle([x, y, x + 520, y + 360], fill=(255, 255, 255), outline=(226, 232, 240), width=4)
+        draw.rectangle([x + 30, y + 30, x + 490, y + 200], fill=(30 + i * 15, 64, 175 - i * 8))
+        for line in range(4):
+            draw.text((x + 30, y + 220 + line * 30), "Annual maintenance of 33kV substations " * 2, fill=(71, 85, 105))
+    png, jpeg = BytesIO(), BytesIO()
+    img.save(png, "PNG")
+    img.save(jpeg, "JPEG", quality=90)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _FakeMicrolink)
+    server.latency, server.embed = latency_ms / 1000, embed
+    server.png, server.jpeg = png.getvalue(), jpeg.getvalue()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/"
+
+
+def _old_screenshot(api_url: str) -> bytes:
+    """What _capture_site_screenshot_jpeg() used to do - kept here only as
+    the baseline: JSON round trip, then the PNG, decoded at full size and
+    LANCZOS-resized (timestamp bar left out - both versions draw the same)."""
+    from PIL import Image
+    from io import BytesIO
+    from urllib.parse import urlencode
+    with urlopen(api_url + "?" + urlencode({"url": amc.BRAND["site"], "screenshot": "true", "meta": "false"}),
+                 timeout=25) as resp:
+        shot_url = json.loads(resp.read().decode("utf-8"))["data"]["screenshot"]["url"]
+    with urlopen(shot_url, timeout=25) as resp:
+        raw = resp.read()
+    img = Image.open(BytesIO(raw)).convert("RGB")
+    img = img.resize((1280, round(img.height * 1280 / img.width)), Image.LANCZOS)
+    out = BytesIO()
+    img.save(out, format="JPEG", quality=82)
+    return out.getvalue()
+
+
+def bench_screenshot(args):
+    """The health-check screenshot against a local stand-in for the
+    screenshot API: the old two-request PNG pipeline vs. the single
+    embedded JPEG decoded with draft() (and a PNG via reduce()), a cached
+    repeat, and how long a capture takes to give up on a stalled API."""
+    def cold(url):
+        amc.SCREENSHOT_API_URL = url
+        amc._SCREENSHOT_CACHE.update(at=0.0, jpeg=None)
+        assert amc._capture_site_screenshot_jpeg()
+
+    server, url = _fake_screenshot_server(args.latency_ms)
+    png_only, png_url = _fake_screenshot_server(args.latency_ms, embed=False)
+    print(f"stand-in latency {args.latency_ms:g} ms per request, capture 2560x1600 -> 1280 wide")
+    print(f"old (JSON + PNG, full decode):         {_timed(lambda: _old_screenshot(url), args.repeat):8.1f} ms")
+    print(f"new (embedded JPEG, draft):            {_timed(lambda: cold(url), args.repeat):8.1f} ms")
+    print(f"new (JSON + PNG, reduce):              {_timed(lambda: cold(png_url), args.repeat):8.1f} ms")
+    amc._SCREENSHOT_CACHE.update(at=0.0, jpeg=None)
+    amc._capture_site_screenshot_jpeg()
+    print(f"new, cached (within SCREENSHOT_CACHE_TTL): {_timed(amc._capture_site_screenshot_jpeg, args.repeat) * 1000:8.1f} us")
+    server.shutdown()
+    png_only.shutdown()
+
+    stalled, stalled_url = _fake_screenshot_server(args.stall_s * 1000)
+    amc.SCREENSHOT_TIMEOUT = args.deadline_s
+    amc.SCREENSHOT_API_URL = stalled_url
+    amc._SCREENSHOT_CACHE.update(at=0.0, jpeg=None)
+    t0 = time.perf_counter()
+    got = amc._capture_site_screenshot_jpeg()
+    print(f"API stalled {args.stall_s:g}s, SCREENSHOT_TIMEOUT={args.deadline_s}: gave up after "
+          f"{time.perf_counter() - t0:.2f}s (screenshot: {'yes' if got else 'none'})")
+    stalled.shutdown()
+
+
+def _peak_rss_of(fn, *a) -> tuple[object, int]:
+    """Run fn(*a) in a forked child; (its result, how far it pushed the
+    child's peak RSS above where it started, in KB). Linux/glibc only: the
+    child inherits the parent's high-water mark, and the parent's freed but
+    still mapped heap, which would let it allocate without growing RSS -
+    both are dropped first."""
+    import ctypes
+    ctx = multiprocessing.get_context("fork")
+    out = ctx.Queue()
+
+    def hwm_kb():
+        with open("/proc/self/status") as f:
+            return next(int(line.split()[1]) for line in f if line.startswith("VmHWM:"))
+
+    def child():
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        before = hwm_kb()
+        result = fn(*a)
+        out.put((result, hwm_kb() - before))
+
+    p = ctx.Process(target=child)
+    p.start()
+    got = out.get()
+    p.join()
+    return got
+
+
+def bench_access_photo(args):
+    """The access-log photo stage: bytes received vs. put into the Brevo
+    payload, time, and extra peak memory for the verify page's own capture
+    and for large uploads, vs. decoding the upload at full size as a
+    baseline."""
+    from PIL import Image
+    from io import BytesIO
+
+    def encode(img, fmt, **kw):
+        b = BytesIO()
+        img.save(b, fmt, **kw)
+        return b.getvalue()
+
+    def photo(w, h):
+        # camera-like content: smooth gradients plus sensor noise
+        noise = Image.effect_noise((w, h), 24)
+        return Image.merge("RGB", [Image.linear_gradient("L").resize((w, h)), noise,
+                                   Image.radial_gradient("L").resize((w, h))])
+
+    sideways = Image.Exif()
+    sideways[0x0112] = 6
+    cases = [
+        ("verify page 480x360 q85", encode(photo(480, 360), "JPEG", quality=85)),
+        ("phone 4000x3000 q90", encode(photo(4000, 3000), "JPEG", quality=90)),
+        ("phone 4000x3000 sideways", encode(photo(4000, 3000), "JPEG", quality=90, exif=sideways)),
+        ("PNG 1920x1080", encode(photo(1920, 1080), "PNG")),
+    ]
+
+    def full_decode(raw):
+        Image.open(BytesIO(raw)).convert("RGB").load()
+
+    def fit(raw):
+        return len(amc._fit_photo_jpeg(raw, amc.ACCESS_PHOTO_MAX_EDGE, amc.ACCESS_PHOTO_MAX_BYTES))
+
+    print(f"max edge {amc.ACCESS_PHOTO_MAX_EDGE}px, budget {amc.ACCESS_PHOTO_MAX_BYTES:,} B")
+    print(f"{'input':<26} {'received B':>11} {'sent B':>9} {'ms':>6} {'peak KB':>8} {'full decode KB':>15}")
+    for label, raw in cases:
+        ms = _timed(lambda: fit(raw), args.repeat)
+        sent, peak = _peak_rss_of(fit, raw)
+        _, full = _peak_rss_of(full_decode, raw)
+        print(f"{label:<26} {len(raw):>11,} {sent:>9,} {ms:>6.1f} {peak:>8,} {full:>15,}")
+
+
+def bench_static_rps(args):
+    """Static requests per second through the app's WSGI callable (the full
+    Flask stack, minus any server): send_from_directory() as before vs. the
+    new file serving with the hot cache off (STATIC_CACHE_MAX_BYTES=0) and
+    on."""
+    from flask import send_from_directory
+    from werkzeug.test import EnvironBuilder
+    amc.app.add_url_rule("/_bench_old/<path:path>", "bench_old",
+                         lambda path: send_from_directory(amc.STATIC_DIR, path))
+    css = amc._ASSETS["urls"]["assets/app.css"]
+    js = amc._ASSETS["urls"]["assets/jspdf.umd.min.js"]
+    photo = next(v for k, v in amc._ASSETS["urls"].items() if k.startswith("Power_Grid"))
+    cases = [
+        ("app.css", "/assets/app.css", "/_bench_old/assets/app.css", {}),
+        ("app.css hashed, gzip", "/" + css, "/_bench_old/assets/app.css", {"Accept-Encoding": "gzip"}),
+        ("jspdf hashed, gzip", "/" + js, "/_bench_old/assets/jspdf.umd.min.js", {"Accept-Encoding": "gzip"}),
+        ("app.css revalidate", "/assets/app.css", "/_bench_old/assets/app.css", "etag"),
+        ("photo, 64 KiB range", "/" + photo, "/_bench_old/Power_Grid_Jamsedpur.jpg", {"Range": "bytes=0-65535"}),
+    ]
+
+    def start_response(status, headers, exc_info=None):
+        pass
+
+    def call(url, headers):
+        body = amc.app.wsgi_app(EnvironBuilder(path=url, headers=headers).get_environ(), start_response)
+        for _ in body:
+            pass
+        if hasattr(body, "close"):
+            body.close()
+
+    def rps(url, headers):
+        if headers == "etag":
+            headers = {"If-None-Match": amc.app.test_client().get(url).headers["ETag"]}
+        environ = EnvironBuilder(path=url, headers=headers).get_environ()
+        for _ in range(20):
+            call(url, headers)
+        t0 = time.perf_counter()
+        for _ in range(args.requests):
+            body = amc.app.wsgi_app(dict(environ), start_response)
+            for _ in body:
+                pass
+            if hasattr(body, "close"):
+                body.close()
+        return args.requests / (time.perf_counter() - t0)
+
+    saved = amc.STATIC_CACHE_MAX_BYTES
+    print(f"{'asset':<22} {'send_from_directory/s':>22} {'no cache/s':>11} {'hot cache/s':>12}")
+    for label, url, old_url, headers in cases:
+        old = rps(old_url, headers)
+        amc.STATIC_CACHE_MAX_BYTES = 0
+        cold = rps(url, headers)
+        amc.STATIC_CACHE_MAX_BYTES = saved
+        hot = rps(url, headers)
+        print(f"{label:<22} {old:>22,.0f} {cold:>11,.0f} {hot:>12,.0f}")
+
+
+def bench_concurrency(args):
+    """Real gunicorn, Brevo stand-in that never answers (the send times out
+    after EMAIL_SEND_TIMEOUT): while one form post is stuck on it, how long
+    do static files and other form posts take? Old setup = one sync worker
+    with inline sending; new = gunicorn.conf.py (gthread), with inline
+    sending (worst case) and with the outbox sender (the default)."""
+    import socket
+    from urllib.error import HTTPError
+    server, brevo_url, _ = _local_tls_server(latency_ms=3_600_000)
+
+    def free_port():
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            return sock.getsockname()[1]
+
+    def get(url, data=None):
+        t0 = time.perf_counter()
+        req = Request(url, data=data, headers={"Content-Type": "application/json"} if data else {})
+        try:
+            with urlopen(req, timeout=60) as resp:
+                resp.read()
+        except HTTPError as e:
+            e.read()
+        return time.perf_counter() - t0
+
+    def form(base, i):
+        return get(base + "/api/contact", json.dumps(
+            {"name": f"Bench {i}", "email": f"b{i}@example.com", "message": "hello"}).encode())
+
+    rows = [("old: 1 sync worker, inline send", ["--workers", "1", "--threads", "1", "--worker-class", "sync"], "0"),
+            ("new: gthread, inline send", [], "0"),
+            ("new: gthread, outbox sender", [], "1")]
+    print(f"EMAIL_SEND_TIMEOUT={args.send_timeout}s; {args.requests} static GETs + {args.forms} form posts "
+          f"issued while one form post hangs")
+    print(f"{'':<34} {'static p50 s':>12} {'static max s':>12} {'form p50 s':>11} {'form max s':>11}")
+    for label, extra, sender in rows:
+        port = free_port()
+        run_dir = tempfile.mkdtemp(dir=WORK_DIR)
+        env = dict(os.environ, PORT=str(port), BREVO_API_URL=brevo_url, BREVO_API_KEY="bench-key",
+                   EMAIL_USER="bench@localhost", SSL_CERT_FILE=os.path.join(WORK_DIR, "bench-cert.pem"),
+                   EMAIL_SEND_TIMEOUT=str(args.send_timeout), OUTBOX_SENDER=sender, RATE_LIMIT="0",
+                   SUBMIT_LOG=os.path.join(run_dir, "s.jsonl"), SUBMIT_STATE=os.path.join(run_dir, "st.json"),
+                   OUTBOX_DIR=os.path.join(run_dir, "outbox"), UPLOAD_DIR=os.path.join(run_dir, "uploads"),
+                   BACKGROUND_LEADER_LOCK=os.path.join(run_dir, "bg.lock"))
+        proc = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", *extra,
+                                 "--access-logfile", "/dev/null", "app:app"],
+                                cwd=REPO_ROOT, env=env, stderr=subprocess.DEVNULL)
+        base = f"http://127.0.0.1:{port}"
+        try:
+            for _ in range(100):
+                try:
+                    get(base + "/api/health")
+                    break
+                except OSError:
+                    time.sleep(0.2)
+            stuck = threading.Thread(target=form, args=(base, -1))
+            stuck.start()
+            time.sleep(0.5)  # let it reach the Brevo call
+            with ThreadPoolExecutor(8) as ex:
+                statics = ex.map(lambda _: get(base + "/assets/app.css"), range(args.requests))
+                forms = ex.map(lambda i: form(base, i), range(args.forms))
+                statics, forms = sorted(statics), sorted(forms)
+            print(f"{label:<34} {statics[len(statics) // 2]:>12.3f} {statics[-1]:>12.3f} "
+                  f"{forms[len(forms) // 2]:>11.3f} {forms[-1]:>11.3f}")
+            stuck.join()
+        finally:
+            proc.terminate()
+            proc.wait()
+    server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    p = sub.add_parser("tickets", help=bench_tickets.__doc__)
+    p.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000, 500_000])
+    p.add_argument("--repeat", type=int, default=20)
+    p.set_defaults(fn=bench_tickets)
+
+    p = sub.add_parser("search", help=bench_search.__doc__)
+    p.add_argument("--size", type=int, default=100_000)
+    p.add_argument("--queries", nargs="+",
+                   default=["CO-0001869F", "0001869", "client99999@", "example.com", "client 4242", "zz-no-match"])
+    p.add_argument("--repeat", type=int, default=50)
+    p.set_defaults(fn=bench_search)
+
+    p = sub.add_parser("state", help=bench_state.__doc__)
+    p.add_argument("--size", type=int, default=5_000)
+    p.add_argument("--lookups", type=int, default=200)
+    p.add_argument("--repeat", type=int, default=20)
+    p.set_defaults(fn=bench_state)
+
+    p = sub.add_parser("state-write", help=bench_state_write.__doc__)
+    p.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 50_000])
+    p.add_argument("--repeat", type=int, default=50)
+    p.set_defaults(fn=bench_state_write)
+
+    p = sub.add_parser("stress", help=bench_stress.__doc__)
+    p.add_argument("--procs", type=int, default=8)
+    p.add_argument("--threads", type=int, default=4)
+    p.add_argument("--writes", type=int, default=500, help="writes per process")
+    p.add_argument("--hot", type=int, default=5, help="number of shared tickets")
+    p.add_argument("--compact-bytes", type=int, default=64 << 10,
+                   help="journal size that triggers compaction (small, to compact mid-run)")
+    p.set_defaults(fn=bench_stress)
+
+    p = sub.add_parser("invoice", help=bench_invoice.__doc__)
+    p.add_argument("--procs", type=int, default=8)
+    p.add_argument("--threads", type=int, default=4)
+    p.add_argument("--numbers", type=int, default=400, help="numbers claimed per process")
+    p.add_argument("--blocks", type=int, nargs="+", default=[10, 50], help="block sizes to compare")
+    p.set_defaults(fn=bench_invoice)
+
+    p = sub.add_parser("invoice-history", help=bench_invoice_history.__doc__)
+    p.add_argument("--sizes", type=int, nargs="+", default=[300, 3_000, 20_000])
+    p.add_argument("--repeat", type=int, default=20)
+    p.set_defaults(fn=bench_invoice_history)
+
+    p = sub.add_parser("mailer", help=bench_mailer.__doc__)
+    p.add_argument("--messages", type=int, default=300)
+    p.add_argument("--threads", type=int, nargs="+", default=[1, 4])
+    p.add_argument("--latency-ms", type=float, default=0.0)
+    p.set_defaults(fn=bench_mailer)
+
+    p = sub.add_parser("email", help=bench_email.__doc__)
+    p.add_argument("--renders", type=int, default=5_000)
+    p.add_argument("--digest", type=int, default=25, help="tickets in the digest case")
+    p.set_defaults(fn=bench_email)
+
+    p = sub.add_parser("upload", help=bench_upload.__doc__)
+    p.add_argument("--sizes", type=int, nargs="+", default=[1, 5, 20, 50], help="file sizes in MB")
+    p.add_argument("--max-peak-kib", type=float, default=512, help="fixed bound on the streamed peak")
+    p.set_defaults(fn=bench_upload)
+
+    p = sub.add_parser("static", help=bench_static.__doc__)
+    p.add_argument("--pages", nargs="+", default=["index.html", "invoice-generator.html", "admin.html"])
+    p.set_defaults(fn=bench_static)
+
+    p = sub.add_parser("images", help=bench_images.__doc__)
+    p.add_argument("--widths", type=int, nargs="+", default=[400, 800, 1200],
+                   help="device widths in physical px")
+    p.set_defaults(fn=bench_images)
+
+    p = sub.add_parser("screenshot", help=bench_screenshot.__doc__)
+    p.add_argument("--latency-ms", type=float, default=150.0, help="stand-in API latency per request")
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--stall-s", type=float, default=10.0)
+    p.add_argument("--deadline-s", type=int, default=2)
+    p.set_defaults(fn=bench_screenshot)
+
+    p = sub.add_parser("access-photo", help=bench_access_photo.__doc__)
+    p.add_argument("--repeat", type=int, default=5)
+    p.set_defaults(fn=bench_access_photo)
+
+    p = sub.add_parser("static-rps", help=bench_static_rps.__doc__)
+    p.add_argument("--requests", type=int, default=3_000)
+    p.set_defaults(fn=bench_static_rps)
+
+    p = sub.add_parser("concurrency", help=bench_concurrency.__doc__)
+    p.add_argument("--requests", type=int, default=50, help="static GETs")
+    p.add_argument("--forms", type=int, default=4, help="extra form posts")
+    p.add_argument("--send-timeout", type=int, default=5)
+    p.set_defaults(fn=bench_concurrency)
+
+    args = parser.parse_args()
+    args.fn(args)
+
+
+if __name__ == "__main__":
+    main()
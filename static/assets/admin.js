@@ -129,7 +129,13 @@
     }
   });
 
-  function drawerOpen(item){
+  async function drawerOpen(item){
+    // List pages leave out each ticket's history/meta to stay small - pull
+    // the full ticket when its drawer opens.
+    try{
+      const full = await api.getTicket(item.ticket);
+      if(full) item = Object.assign(item, {history: full.history, note: full.note, status: full.status});
+    }catch(e){ console.error(e); }
     drawer.classList.add('open'); drawer.setAttribute('aria-hidden', 'false');
     dTicket.textContent = item.ticket;
     dMeta.textContent = `${item.kind} • ${item.email || '—'} • ${fmtISO(item.ts)}`;
@@ -144,7 +150,7 @@
 
     // attachments
     dFiles.innerHTML = (item.attachments||[]).map(a=>(
-      `<a class="badge" href="/uploads/${encodeURIComponent(a)}" target="_blank" rel="noopener">${escapeHtml(a)}</a>`
+      `<a class="badge" href="${fileUrl(item.ticket, a)}" target="_blank" rel="noopener">${escapeHtml(a)}</a>`
     )).join(' ') || '<span class="muted">—</span>';
 
     // history
@@ -172,6 +178,7 @@
         // optimistic local update
         const idx = VIEW.items.findIndex(x=>x.ticket===item.ticket);
         if(idx>-1){
+          moveCount(VIEW.items[idx].status, payload.status);
           VIEW.items[idx].status = payload.status;
           VIEW.items[idx].note = payload.note;
           if(payload.status==='resolved') VIEW.items[idx].overdue = false;
@@ -187,18 +194,43 @@
   }
 
   // ---------- API ----------
+  const PAGE_SIZE = 100, PAGE_MAX = 500;
+  // Conditional GETs: remember the last ETag + body per URL and send
+  // If-None-Match, so an unchanged poll is a bodiless 304 on the wire.
+  // `notModified` lets callers skip re-rendering identical data.
+  const ETAG_CACHE = new Map();
+  async function getJSON(url){
+    const prev = ETAG_CACHE.get(url);
+    const headers = prev ? {'If-None-Match': prev.etag} : {};
+    const r = await fetch(url, {credentials:'same-origin', headers, cache:'no-store'});
+    if(r.status===304 && prev) return {r, data: prev.data, notModified: true};
+    const data = r.ok ? await r.json() : null;
+    const etag = r.headers.get('ETag');
+    if(r.ok && etag){
+      ETAG_CACHE.delete(url);
+      ETAG_CACHE.set(url, {etag, data});
+      if(ETAG_CACHE.size > 20) ETAG_CACHE.delete(ETAG_CACHE.keys().next().value);
+    }
+    return {r, data, notModified: false};
+  }
   const api = {
-    async getTickets(){
+    async getTickets({limit=PAGE_SIZE, cursor=''}={}){
       const p = new URLSearchParams();
       if(FILTERS.q) p.set('q', FILTERS.q);
       if(FILTERS.kind) p.set('kind', FILTERS.kind);
       if(FILTERS.status) p.set('status', FILTERS.status);
-      const r = await fetch('/admin/api/tickets?'+p.toString(), {credentials:'same-origin'});
+      p.set('limit', String(limit));
+      if(cursor) p.set('cursor', cursor);
+      const {r, data, notModified} = await getJSON('/admin/api/tickets?'+p.toString());
       if(r.status===401){ location.href='/admin/login'; return {ok:false, items:[]}; }
-      if(!r.ok) throw new Error('HTTP '+r.status);
-      return r.json();
+      if(!r.ok && !notModified) throw new Error('HTTP '+r.status);
+      return Object.assign({}, data, {notModified});
 
     },
+    async getTicket(ticket){
+      const {data} = await getJSON(`/admin/api/tickets/${encodeURIComponent(ticket)}`);
+      return data?.ok ? data.item : null;
+    },
     async patchTicket(ticket, payload){
       const r = await fetch(`/admin/api/tickets/${encodeURIComponent(ticket)}`, {
         method:'PATCH', headers:{'Content-Type':'application/json'}, credentials:'same-origin',
@@ -217,7 +249,7 @@
   };
 
   // ---------- State ----------
-  const VIEW = { items:[], charts:{} };
+  const VIEW = { items:[], charts:{}, total:0, counts:null, next:null };
 
   function normalize(x){
     return {
@@ -240,10 +272,13 @@
 
   // ---------- Render: KPIs ----------
   function renderKPIs(list){
-    const total = list.length;
-    const open  = list.filter(i=>i.status==='open').length;
-    const wip   = list.filter(i=>i.status==='wip').length;
-    const res   = list.filter(i=>i.status==='resolved').length;
+    // Counts come from the server for the whole filtered set, not just the
+    // pages loaded so far.
+    const c = VIEW.counts;
+    const total = c ? VIEW.total : list.length;
+    const open  = c ? (c.open||0) : list.filter(i=>i.status==='open').length;
+    const wip   = c ? (c.wip||0) : list.filter(i=>i.status==='wip').length;
+    const res   = c ? (c.resolved||0) : list.filter(i=>i.status==='resolved').length;
     $('#kTotal').textContent = total;
     $('#kOpen').textContent  = open;
     $('#kWip').textContent   = wip;
@@ -302,20 +337,29 @@
     });
   });
 
+  function moveCount(from, to){
+    if(!VIEW.counts || from===to) return;
+    VIEW.counts[from] = Math.max(0, (VIEW.counts[from]||0) - 1);
+    VIEW.counts[to] = (VIEW.counts[to]||0) + 1;
+  }
+
   async function quickUpdate(ticket, status){
     const ok = await api.patchTicket(ticket, {status, note:'', email_client:false});
     if(!ok){ toast('Update failed'); return; }
     const it = VIEW.items.find(x=>x.ticket===ticket);
-    if(it){ it.status = status; if(status==='resolved') it.overdue=false; }
+    if(it){ moveCount(it.status, status); it.status = status; if(status==='resolved') it.overdue=false; }
     toast(`Marked ${status.toUpperCase()}`);
     renderAll();
   }
 
   // ---------- Render: Table ----------
+  const fileUrl = (ticket, name) =>
+    `/admin/api/tickets/${encodeURIComponent(ticket||'')}/files/${encodeURIComponent(name)}`;
+
   function renderTable(list){
     if(!list.length){ $('#grid').innerHTML = `<div class="card muted">No submissions.</div>`; return; }
     const rows = list.map(r=>{
-      const files = (r.attachments||[]).map(a=>`<a class="badge" href="/uploads/${encodeURIComponent(a)}" target="_blank" rel="noopener">${escapeHtml(a)}</a>`).join(' ');
+      const files = (r.attachments||[]).map(a=>`<a class="badge" href="${fileUrl(r.ticket, a)}" target="_blank" rel="noopener">${escapeHtml(a)}</a>`).join(' ');
       const notesShort = escapeHtml(stripTags(r.msg || r.note || '')).slice(0,160);
       const trClass = `row row-${r.status} ${r.overdue ? 'overdue' : ''}`;
       return `
@@ -387,7 +431,7 @@
   async function bulkUpdate(tickets, status){
     if(!tickets.length) return toast('Select rows first');
     await Promise.all(tickets.map(t=> api.patchTicket(t, {status, note:'', email_client:false})));
-    VIEW.items.forEach(it=>{ if(tickets.includes(it.ticket)){ it.status=status; if(status==='resolved') it.overdue=false; }});
+    VIEW.items.forEach(it=>{ if(tickets.includes(it.ticket)){ moveCount(it.status, status); it.status=status; if(status==='resolved') it.overdue=false; }});
     toast(`Updated ${tickets.length} → ${status.toUpperCase()}`);
     renderAll();
   }
@@ -511,20 +555,52 @@
   }
 
   // ---------- Fetch + Render ----------
+  function applyPage(data, append){
+    const items = (data.items||[]).map(normalize);
+    VIEW.items = append ? VIEW.items.concat(items) : items;
+    VIEW.total = Number(data.total || VIEW.items.length);
+    VIEW.counts = data.counts || null;
+    VIEW.next = data.next_cursor || null;
+  }
+
   async function fetchAndRender(){
     try{
-      const data = await api.getTickets();
+      // A refresh re-fetches as many rows as are already on screen, so
+      // "Load more" progress isn't thrown away by the 30s auto refresh.
+      const limit = Math.min(PAGE_MAX, Math.max(PAGE_SIZE, VIEW.items.length));
+      const data = await api.getTickets({limit});
       if(!data?.ok){ toast('Load failed'); return; }
-      VIEW.items = (data.items||[]).map(normalize).sort((a,b)=> b.ts - a.ts);
+      if(data.notModified) return;
+      applyPage(data, false);
       renderAll();
     }catch(e){ console.error(e); toast('Network error'); }
   }
 
+  const btnMore = $('#loadMore');
+  btnMore?.addEventListener('click', async ()=>{
+    if(!VIEW.next) return;
+    btnMore.disabled = true;
+    try{
+      const data = await api.getTickets({cursor: VIEW.next});
+      if(!data?.ok){ toast('Load failed'); return; }
+      applyPage(data, true);
+      renderAll();
+    }catch(e){ console.error(e); toast('Network error'); }
+    finally{ btnMore.disabled = false; }
+  });
+
+  function renderMore(){
+    if(!btnMore) return;
+    btnMore.hidden = !VIEW.next;
+    $('#loadedCount').textContent = `Showing ${VIEW.items.length} of ${VIEW.total}`;
+  }
+
   function renderAll(){
     renderKPIs(VIEW.items);
     renderKanban(VIEW.items);
     renderTable(VIEW.items);
     renderCharts(VIEW.items);
+    renderMore();
   }
 
   // ---------- Auto refresh ----------
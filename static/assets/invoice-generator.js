@@ -409,11 +409,13 @@ async function downloadPDF(){
     // Ask the server to authoritatively assign the number now, at the actual
     // moment of saving - this is what makes it collision-proof across
     // devices, not just whatever was shown while drafting.
-    const assigned=await commitInvoiceNumber(invNoAutoFilled?'':g('inv_no'));
-    if(!assigned){
+    const draftNo=g('inv_no');
+    const committed=await commitInvoiceNumber(invNoAutoFilled?'':draftNo);
+    if(!committed){
       alert('Could not reach the server to assign an invoice number. Check your connection and try again.');
       return;
     }
+    const assigned=committed.number;
     if(assigned!==g('inv_no')){
       document.getElementById('inv_no').value=assigned;
       invNoAutoFilled=true;
@@ -437,7 +439,12 @@ async function downloadPDF(){
 
     const name=(g('inv_no')||'invoice').replace(/[^\w-]/g,'_');
     pdf.save(name+'.pdf');
-    saveToHistory('completed');
+    if(committed.invoice){ // in the shared history now - this device's draft copy is done with
+      committedNos.add(assigned);
+      dropLocalDraft(draftNo,assigned);
+    }else{
+      saveToHistory('completed'); // kept locally; uploaded by importLocalHistory() next load
+    }
   }catch(err){
     alert('Could not generate PDF: '+err.message);
   }finally{
@@ -471,23 +478,43 @@ function loadJSON(e){
   r.readAsText(f);
 }
 
-/* ---------- invoice history (no backend - stored in this browser's localStorage) ---------- */
+/* ---------- invoice history ----------
+   Committed invoices (Download PDF) are recorded on the server by
+   /admin/api/invoice/commit-number and listed from /admin/api/invoices, a
+   page at a time, so every device sees the same history. Only unfinished
+   drafts ("pending") stay in this browser's localStorage. Completed
+   entries an older version left in localStorage are uploaded once on load
+   (importLocalHistory) and then dropped from it. */
 const HISTORY_KEY='amc_invoice_history_v1';
+const HIST_PAGE=20;
+const committedNos=new Set(); // numbers saved on the server from this page - never re-archived as drafts
+let srvHist={items:[],cursor:null,totals:null,months:[],q:'',month:'',loading:false,error:''};
+let histSearchTimer=null;
 function getHistory(){ try{return JSON.parse(localStorage.getItem(HISTORY_KEY)||'[]');}catch(e){return [];} }
 function setHistory(h){ localStorage.setItem(HISTORY_KEY,JSON.stringify(h)); renderHistoryPanel(); }
 function escJs(s){ return String(s).replace(/\\/g,'\\\\').replace(/'/g,"\\'"); }
 function fmtMoney(n,cur){ return (cur||'₹')+' '+fmt(num(n)); }
 
-function calcTotal(){
-  const rate=num(g('tax_rate')); const taxType=g('tax_type');
-  let taxable=0; items.forEach(it=>taxable+=num(it.qty)*num(it.rate));
-  let grand=taxable+(taxType==='none'?0:taxable*rate/100);
-  if(document.getElementById('round_off').checked)grand=Math.round(grand);
-  return grand;
+function currentInvoiceData(){
+  const data={fields:{},items:JSON.parse(JSON.stringify(items)),round_off:document.getElementById('round_off').checked,b_ship_diff:document.getElementById('b_ship_diff').checked};
+  fields.forEach(f=>data.fields[f]=g(f));
+  return data;
+}
+// Same arithmetic as render(), from a saved draft rather than the form.
+function totalsFor(d){
+  const f=d.fields||{}; const rate=num(f.tax_rate);
+  let taxable=0; (d.items||[]).forEach(it=>taxable+=num(it.qty)*num(it.rate));
+  const gst=f.tax_type==='none'?0:taxable*rate/100;
+  let total=taxable+gst;
+  if(d.round_off)total=Math.round(total);
+  return {taxable,gst,total};
 }
+function calcTotal(){ return totalsFor(currentInvoiceData()).total; }
+function invoicePayload(d){ return Object.assign(totalsFor(d),{data:d}); }
 
 function saveToHistory(forceStatus){
   const invNo=g('inv_no'); if(!invNo)return;
+  if(!forceStatus&&committedNos.has(invNo))return; // already in the shared history
   const hasContent=g('b_name').trim()||items.some(it=>String(it.desc||'').trim());
   if(!hasContent && !forceStatus)return;
   const hist=getHistory();
@@ -496,27 +523,89 @@ function saveToHistory(forceStatus){
   const rec={
     invNo, date:g('inv_date'), dueDate:g('inv_due'), buyerName:g('b_name')||'(no buyer name)',
     pos:g('inv_pos'), total:calcTotal(), cur:g('cur'), status, updatedAt:Date.now(),
-    data:{fields:{},items:JSON.parse(JSON.stringify(items)),round_off:document.getElementById('round_off').checked,b_ship_diff:document.getElementById('b_ship_diff').checked}
+    data:currentInvoiceData()
   };
-  fields.forEach(f=>rec.data.fields[f]=g(f));
   if(idx>=0)hist[idx]=rec; else hist.unshift(rec);
   setHistory(hist);
 }
+function dropLocalDraft(){
+  const nos=new Set(arguments);
+  const hist=getHistory();
+  if(hist.some(h=>nos.has(h.invNo)))setHistory(hist.filter(h=>!nos.has(h.invNo)));
+}
 let autosaveTimer=null;
 function scheduleAutosave(){ clearTimeout(autosaveTimer); autosaveTimer=setTimeout(()=>saveToHistory(),700); }
 
-function openFromHistory(invNo){
-  const rec=getHistory().find(h=>h.invNo===invNo); if(!rec)return;
-  applyInvoiceData(rec.data);
+async function openFromHistory(invNo){
+  let data=(getHistory().find(h=>h.invNo===invNo)||{}).data;
+  if(!data){
+    try{
+      const r=await fetch('/admin/api/invoices/'+encodeURIComponent(invNo));
+      const j=await r.json();
+      if(!j.ok)throw new Error(j.error||'Not found');
+      data=j.item.data; committedNos.add(invNo);
+    }catch(e){ alert('Could not open invoice '+invNo+': '+e.message); return; }
+  }
+  applyInvoiceData(data);
   document.getElementById('validationBanner').style.display='none';
   closeHistoryPanel();
   window.scrollTo({top:0,behavior:'smooth'});
 }
-function deleteFromHistory(invNo,ev){
+async function deleteFromHistory(invNo,ev){
   if(ev)ev.stopPropagation();
   if(!confirm('Delete invoice '+invNo+' from history? This cannot be undone.'))return;
-  setHistory(getHistory().filter(h=>h.invNo!==invNo));
+  if(getHistory().some(h=>h.invNo===invNo)){ setHistory(getHistory().filter(h=>h.invNo!==invNo)); return; }
+  try{
+    const r=await fetch('/admin/api/invoices/'+encodeURIComponent(invNo),{method:'DELETE'});
+    const j=await r.json();
+    if(!j.ok)throw new Error(j.error||'Delete failed');
+  }catch(e){ alert('Could not delete invoice '+invNo+': '+e.message); return; }
+  loadServerHistory(true);
+}
+
+// one-time upload of completed entries kept in localStorage by older versions
+async function importLocalHistory(){
+  const done=getHistory().filter(h=>h.status==='completed');
+  if(!done.length)return;
+  try{
+    const r=await fetch('/admin/api/invoices/import',{
+      method:'POST',
+      headers:{'Content-Type':'application/json'},
+      body:JSON.stringify({records:done.map(h=>Object.assign(invoicePayload(h.data||{}),{number:h.invNo}))})
+    });
+    const j=await r.json();
+    if(!j.ok)return;
+  }catch(e){ return; }
+  setHistory(getHistory().filter(h=>h.status!=='completed'));
+  loadServerHistory(true);
+}
+
+async function loadServerHistory(reset){
+  if(srvHist.loading)return;
+  if(!reset&&!srvHist.cursor)return;
+  srvHist.loading=true; srvHist.error='';
+  const qs=new URLSearchParams({limit:HIST_PAGE});
+  if(srvHist.q)qs.set('q',srvHist.q);
+  if(srvHist.month)qs.set('month',srvHist.month);
+  if(!reset)qs.set('cursor',srvHist.cursor);
+  try{
+    const fetches=[fetch('/admin/api/invoices?'+qs)];
+    if(reset)fetches.push(fetch('/admin/api/invoices/months'));
+    const [page,months]=await Promise.all(fetches.map(p=>p.then(r=>r.json())));
+    if(!page.ok)throw new Error(page.error||'Could not load invoices');
+    srvHist.items=reset?page.items:srvHist.items.concat(page.items);
+    srvHist.cursor=page.next_cursor; srvHist.totals=page.totals;
+    if(months&&months.ok)srvHist.months=months.months;
+  }catch(e){ srvHist.error=e.message; }
+  srvHist.loading=false;
+  renderHistoryPanel();
+}
+function onHistSearch(v){
+  clearTimeout(histSearchTimer);
+  histSearchTimer=setTimeout(()=>{ srvHist.q=v.trim(); loadServerHistory(true); },250);
 }
+function filterHistMonth(m){ srvHist.month=srvHist.month===m?'':m; loadServerHistory(true); }
+function monthLabel(m){ const [y,mo]=m.split('-'); return MONTHS[num(mo)-1]+' '+y; }
 
 function historyItemHtml(rec){
   const badge=rec.status==='completed'?'<span class="badge-completed">Completed</span>':'<span class="badge-pending">Pending</span>';
@@ -530,21 +619,30 @@ function historyItemHtml(rec){
       +'<button class="del-btn2" onclick="deleteFromHistory(\''+safeNo+'\',event)">Delete</button>'
     +'</div></div>';
 }
+function serverItem(r){ return {invNo:r.number,buyerName:r.client||'(no buyer name)',date:r.date,total:r.total,cur:r.cur,status:'completed'}; }
 function renderHistoryPanel(){
   const body=document.getElementById('histBody'); if(!body)return;
-  const hist=getHistory().sort((a,b)=>b.updatedAt-a.updatedAt);
-  const pending=hist.filter(h=>h.status==='pending');
-  const completed=hist.filter(h=>h.status==='completed');
+  const pending=getHistory().filter(h=>h.status==='pending').sort((a,b)=>b.updatedAt-a.updatedAt);
+  const t=srvHist.totals;
+  const months=srvHist.months.slice(0,12).map(m=>
+    '<button class="hist-month'+(srvHist.month===m.month?' active':'')+'" onclick="filterHistMonth(\''+m.month+'\')">'
+    +'<b>'+esc(monthLabel(m.month))+'</b><span>'+m.count+' • '+esc(fmtMoney(m.total))+'</span></button>').join('');
+  let done;
+  if(srvHist.error)done='<div class="hist-empty">'+esc(srvHist.error)+'</div>';
+  else if(!srvHist.items.length)done='<div class="hist-empty">'+(srvHist.loading?'Loading…':'No completed invoices'+(srvHist.q||srvHist.month?' match.':' yet.'))+'</div>';
+  else done=srvHist.items.map(r=>historyItemHtml(serverItem(r))).join('')
+    +(srvHist.cursor?'<button class="hist-more" onclick="loadServerHistory(false)"'+(srvHist.loading?' disabled':'')+'>'+(srvHist.loading?'Loading…':'Load more')+'</button>':'');
   body.innerHTML=
-    '<div class="hist-section-title">🟡 Pending ('+pending.length+')</div>'
+    '<div class="hist-section-title">🟡 Pending on this device ('+pending.length+')</div>'
     +(pending.length?pending.map(historyItemHtml).join(''):'<div class="hist-empty">No pending invoices.</div>')
-    +'<div class="hist-section-title">⚪ Old / Completed ('+completed.length+')</div>'
-    +(completed.length?completed.map(historyItemHtml).join(''):'<div class="hist-empty">No completed invoices yet.</div>');
+    +'<div class="hist-section-title">⚪ Completed ('+(t?t.count:'…')+(t?' • '+esc(fmtMoney(t.total)):'')+')</div>'
+    +(months?'<div class="hist-months">'+months+'</div>':'')
+    +done;
   const badge=document.getElementById('historyBadge');
   if(pending.length){badge.style.display='flex';badge.textContent=pending.length;}
   else badge.style.display='none';
 }
-function openHistoryPanel(){ saveToHistory(); renderHistoryPanel(); document.getElementById('histOverlay').classList.add('open'); document.getElementById('histDrawer').classList.add('open'); }
+function openHistoryPanel(){ saveToHistory(); renderHistoryPanel(); loadServerHistory(true); document.getElementById('histOverlay').classList.add('open'); document.getElementById('histDrawer').classList.add('open'); }
 function closeHistoryPanel(){ document.getElementById('histOverlay').classList.remove('open'); document.getElementById('histDrawer').classList.remove('open'); }
 
 /* ---------- AMC (seller) static details ---------- */
@@ -590,16 +688,19 @@ async function peekNextInvoiceNumber(){
 // current field value when the user has hand-edited it (so a still-valid
 // manual number is respected); pass '' when it was just an auto-suggestion,
 // so the server always issues a fresh, guaranteed-free number.
+// The invoice itself goes along and is recorded in the shared history
+// under whatever number is assigned; resolves to the server's reply
+// ({number, invoice | history_error}) or null.
 async function commitInvoiceNumber(currentValue){
   try{
     const r=await fetch('/admin/api/invoice/commit-number',{
       method:'POST',
       headers:{'Content-Type':'application/json'},
-      body:JSON.stringify({invoice_number:currentValue||''})
+      body:JSON.stringify({invoice_number:currentValue||'',invoice:invoicePayload(currentInvoiceData())})
     });
     if(!r.ok)return null;
     const j=await r.json();
-    return j.ok?j.number:null;
+    return j.ok?j:null;
   }catch(e){ return null; }
 }
 
@@ -631,3 +732,4 @@ async function newInvoice(){
 }
 newInvoice();
 renderHistoryPanel();
+importLocalHistory();